@@ -0,0 +1,74 @@
+"""Compare the memory held by a compact `Catalog` with a list of `PkgFile`
+objects (what the cache used to hold), for the same packages.
+
+The packages are spread over one directory per project, with
+`--versions` wheels per project. Memory is measured with `tracemalloc`,
+so the numbers only cover what the Python allocator hands out (and the
+build times are inflated by the tracing).
+
+Usage: python -m benchmarks.bench_catalog_memory [--files N [N ...]]
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+import typing as t
+
+from pypiserver.catalog import Catalog
+from pypiserver.core import PkgFile
+
+ROOT = "/srv/pypiserver/packages"
+
+
+def make_packages(count: int, versions: int) -> t.Iterator[PkgFile]:
+    for i in range(count):
+        project, version = f"project-{i // versions}", f"1.{i % versions}.0"
+        name = project.replace("-", "_")
+        relfn = f"{project}/{name}-{version}-py3-none-any.whl"
+        yield PkgFile(name, version, f"{ROOT}/{relfn}", ROOT, relfn)
+
+
+def measure(build: t.Callable[[], t.Any]) -> t.Tuple[t.Any, int, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--files", type=int, nargs="+", default=[100_000, 1_000_000]
+    )
+    parser.add_argument("--versions", type=int, default=20)
+    args = parser.parse_args()
+
+    print(
+        f"{'files':>9} {'PkgFile list':>14} {'catalog':>12} "
+        f"{'x':>6} {'bytes/file':>11} {'build':>8}"
+    )
+    for count in args.files:
+        packages, list_size, _ = measure(
+            lambda: list(make_packages(count, args.versions))
+        )
+        del packages
+        catalog, catalog_size, elapsed = measure(
+            lambda: Catalog(make_packages(count, args.versions))
+        )
+        assert len(catalog) == count
+        del catalog
+        print(
+            f"{count:>9} {list_size / 2**20:>12.1f}MB "
+            f"{catalog_size / 2**20:>10.1f}MB {list_size / catalog_size:>6.1f} "
+            f"{catalog_size / count:>11.0f} {elapsed:>7.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
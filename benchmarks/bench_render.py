@@ -0,0 +1,103 @@
+"""Compare the precompiled index renderers with the former templates.
+
+Both sides are given the same `PkgFile` objects, and the template side
+builds its links the way the routes used to (resolving every link against
+the request URL).
+
+Usage: python -m benchmarks.bench_render [--links N [N ...]] [--repeat R]
+"""
+
+import argparse
+import os
+import timeit
+import typing as t
+from urllib.parse import urljoin
+
+from pypiserver.bottle_wrapper import template
+from pypiserver.core import PkgFile
+from pypiserver.render import (
+    render_listing,
+    render_project_links,
+    render_simple_index,
+)
+from tests import templates
+
+SIMPLE_URL = "http://localhost:8080/simple/nightly-build/"
+PACKAGES_URL = "http://localhost:8080/packages/"
+
+
+def make_packages(count: int) -> t.List[PkgFile]:
+    packages = []
+    for i in range(count):
+        relfn = f"nightly/nightly_build-1.0.dev{i}-py3-none-any.whl"
+        pkg = PkgFile(
+            "nightly_build", f"1.0.dev{i}", f"/data/{relfn}", "/data", relfn
+        )
+        pkg.digest = f"sha256={i:064x}"
+        packages.append(pkg)
+    return packages
+
+
+def cases(count: int) -> t.Iterator[t.Tuple[str, t.Callable, t.Callable]]:
+    packages = make_packages(count)
+    projects = [f"project-{i}" for i in range(count)]
+    yield (
+        "/simple/",
+        lambda: template(templates.SIMPLE_INDEX, links=projects),
+        lambda: render_simple_index(projects),
+    )
+    yield (
+        "/simple/<project>/",
+        lambda: template(
+            templates.PROJECT_LINKS,
+            project="nightly-build",
+            links=(
+                (
+                    os.path.basename(pkg.relfn),
+                    urljoin(SIMPLE_URL, f"../../packages/{pkg.fname_and_hash}"),
+                )
+                for pkg in packages
+            ),
+        ),
+        lambda: render_project_links(
+            "nightly-build", urljoin(SIMPLE_URL, "../../packages/"), packages
+        ),
+    )
+    yield (
+        "/packages/",
+        lambda: template(
+            templates.LISTING,
+            links=(
+                (pkg.relfn_unix, urljoin(PACKAGES_URL, pkg.fname_and_hash))
+                for pkg in packages
+            ),
+        ),
+        lambda: "".join(
+            render_listing("Index of packages", PACKAGES_URL, packages)
+        ),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--links", type=int, nargs="+", default=[100, 1000, 20000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'page':<20} {'links':>7} {'template':>12} {'render':>12} {'x':>6}")
+    for count in args.links:
+        for page, old, new in cases(count):
+            assert old() == new(), f"output differs for {page}"
+            number = max(1, 20000 // count)
+            t_old = min(timeit.repeat(old, number=number, repeat=args.repeat))
+            t_new = min(timeit.repeat(new, number=number, repeat=args.repeat))
+            print(
+                f"{page:<20} {count:>7} {t_old / number * 1e3:>10.2f}ms "
+                f"{t_new / number * 1e3:>10.2f}ms {t_old / t_new:>6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compare the `os.scandir` based tree walker with the former `os.walk`
+based one, which built `Path` objects and stat-ed every file.
+
+A temporary tree with one directory per project is created first. Local
+disks serve the extra stats from the inode cache, so the gap is much wider
+on network file systems.
+
+The parallel scan (`--scan-workers`) only pays off when listing a
+directory means waiting on the storage, which a local temporary tree
+rarely does.
+
+Usage: python -m benchmarks.bench_scan [--files N] [--workers W] [--repeat R]
+"""
+
+import argparse
+import os
+import tempfile
+import timeit
+import typing as t
+from pathlib import Path
+
+from pypiserver.backend import (
+    listdir,
+    scan_listed_files,
+    scan_listed_files_parallel,
+)
+from pypiserver.pkg_helpers import is_listed_path
+
+
+def walk_listed_files(root: Path) -> t.Iterator[Path]:
+    """The former walker."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = (
+            dirname for dirname in dirnames if is_listed_path(Path(dirname))
+        )
+        for filename in filenames:
+            if not is_listed_path(Path(filename)):
+                continue
+            filepath = root / dirpath / filename
+            if Path(filepath).is_file():
+                yield filepath
+
+
+def make_tree(root: Path, count: int, versions: int) -> None:
+    for i in range(count):
+        project = root / f"project-{i // versions}"
+        if i % versions == 0:
+            project.mkdir()
+        (project / f"project_{i // versions}-1.{i % versions}.0.tar.gz").touch()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=50_000)
+    parser.add_argument("--versions", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp).resolve()
+        make_tree(root, args.files, args.versions)
+
+        def best(func: t.Callable[[], t.Any]) -> float:
+            return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+        t_walk = best(lambda: list(walk_listed_files(root)))
+        t_scan = best(lambda: list(scan_listed_files(root)))
+        t_stat = best(lambda: list(scan_listed_files(root, with_stat=True)))
+        t_parallel = best(
+            lambda: scan_listed_files_parallel([root], args.workers)
+        )
+        t_listdir = best(lambda: list(listdir(root)))
+        print(f"{args.files} files")
+        print(f"os.walk walker:        {t_walk:8.3f}s")
+        print(f"scandir walker:        {t_scan:8.3f}s")
+        print(f"  with size/mtime:     {t_stat:8.3f}s")
+        threads = f"  {args.workers} threads:"
+        print(f"{threads:<23}{t_parallel:8.3f}s")
+        print(f"listdir (PkgFiles):    {t_listdir:8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare version parsing and sorting with and without memoization and
+compact version keys.
+
+The corpus mimics a package repository: a few thousand projects with a
+mix of release, pre-release, dev, post and calendar versions, where every
+version string is shared by the several files (sdist and wheels) of a
+release and by many projects.
+
+Usage: python -m benchmarks.bench_versions [--files N] [--repeat R]
+"""
+
+import argparse
+import random
+import timeit
+import typing as t
+
+from pypiserver.pkg_helpers import parse_version, version_key
+
+_parse_version = parse_version.__wrapped__
+_version_key = version_key.__wrapped__
+
+
+def make_versions(count: int, seed: int = 0) -> t.List[str]:
+    rnd = random.Random(seed)
+    releases = []
+    while len(releases) * 3 < count:
+        major, minor, patch = (
+            rnd.randrange(4),
+            rnd.randrange(30),
+            rnd.randrange(12),
+        )
+        version = rnd.choice(
+            [
+                f"{major}.{minor}.{patch}",
+                f"{major}.{minor}",
+                f"{major}.{minor}.{patch}rc{rnd.randrange(1, 4)}",
+                f"{major}.{minor}.{patch}b{rnd.randrange(1, 4)}",
+                f"{major}.{minor}.dev{rnd.randrange(100)}",
+                f"{major}.{minor}.{patch}.post{rnd.randrange(1, 3)}",
+                f"20{rnd.randrange(18, 26)}.{rnd.randrange(1, 13)}."
+                f"{rnd.randrange(1, 29)}",
+            ]
+        )
+        # One sdist and a couple of wheels per release
+        releases.append(version)
+    versions = [v for v in releases for _ in range(3)][:count]
+    rnd.shuffle(versions)
+    return versions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    versions = make_versions(args.files)
+    print(f"{args.files} files, {len(set(versions))} distinct versions")
+
+    def best(func: t.Callable[[], t.Any]) -> float:
+        return min(timeit.repeat(func, number=1, repeat=args.repeat))
+
+    # Parsing, as done for every PkgFile
+    t_parse = best(lambda: [_parse_version(v) for v in versions])
+    parse_version.cache_clear()
+    t_memo = best(lambda: [parse_version(v) for v in versions])
+    print(f"parse:    {t_parse:8.3f}s  memoized: {t_memo:8.3f}s")
+
+    # Sorting by the parsed tuples vs. by the compact keys
+    tuples = [_parse_version(v) for v in versions]
+    keys = [_version_key(v) for v in versions]
+    t_tuples = best(lambda: sorted(tuples))
+    t_keys = best(lambda: sorted(keys))
+    print(f"sort:     {t_tuples:8.3f}s  keys:     {t_keys:8.3f}s")
+
+    size_tuples = sum(
+        tup.__sizeof__() + sum(part.__sizeof__() for part in tup)
+        for tup in set(tuples)
+    )
+    size_keys = sum(k.__sizeof__() for k in set(keys))
+    print(
+        f"size per distinct version: {size_tuples / len(set(tuples)):.0f}B "
+        f"(tuple) vs {size_keys / len(set(keys)):.0f}B (key)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ import re as _re
 import sys
 import typing as t
 
+from pypiserver import offload
 from pypiserver.bottle_wrapper import Bottle
 from pypiserver.config import Config, RunConfig, strtobool
 
@@ -140,6 +141,7 @@ def app_from_config(config: RunConfig) -> Bottle:
     # Add a reference to our config on the Bottle app for easy access in testing
     # and other contexts.
     _app.app._pypiserver_config = config
+    offload.set_threads(config.offload_threads)
     return _app.app
 
 
@@ -11,7 +11,14 @@ from pathlib import Path
 from typing import IO, Any
 from wsgiref.simple_server import WSGIRequestHandler
 
-from pypiserver.config import Config, UpdateConfig
+from pypiserver.config import (
+    Config,
+    MigrateConfig,
+    RunConfig,
+    TokenConfig,
+    UpdateConfig,
+)
+from pypiserver.server import RequestHandler, ThreadedServer
 
 log = logging.getLogger("pypiserver.main")
 
@@ -66,6 +73,10 @@ class WsgiHandler(WSGIRequestHandler):
         )
 
 
+class ThreadedWsgiHandler(WsgiHandler, RequestHandler):
+    """The request handler of the built-in threaded server."""
+
+
 class AutoServer(enum.Enum):
     """Expected servers that can be automaticlaly selected by bottle."""
 
@@ -115,6 +126,22 @@ def guess_auto_server() -> AutoServer:
     return server
 
 
+def issue_token(config: TokenConfig) -> str:
+    """Issue the token of `config`, creating its key if needed."""
+    # pylint: disable=import-outside-toplevel
+    from pypiserver.tokens import TokenSigner, create_key, load_key
+
+    try:
+        try:
+            key = create_key(config.token_key)
+            print(f"Created the token key {config.token_key}", file=sys.stderr)
+        except FileExistsError:
+            key = load_key(config.token_key)
+    except (OSError, ValueError) as exc:
+        sys.exit(f"Cannot read the token key: {exc}")
+    return TokenSigner(key).issue(config.user, config.actions, config.expires)
+
+
 def main(argv: Sequence[str] | None = None) -> None:
     """Application entrypoint for pypiserver.
 
@@ -132,6 +159,10 @@ def main(argv: Sequence[str] | None = None) -> None:
 
     config = Config.from_args(argv)
 
+    if isinstance(config, TokenConfig):
+        print(issue_token(config))
+        return
+
     init_logging(
         level=config.log_level,
         filename=config.log_file,
@@ -150,7 +181,28 @@ def main(argv: Sequence[str] | None = None) -> None:
             dry_run=not config.execute,
             stable_only=config.allow_unstable,
             ignorelist=config.ignorelist,
+            index_url=config.index_url,
+            workers=config.workers,
+            timeout=config.timeout,
+            cache_file=config.cache_file,
+        )
+        return
+
+    if isinstance(config, MigrateConfig):
+        from pypiserver.layout import get_layout, migrate
+
+        migrate(
+            config.roots,
+            get_layout(config.layout),
+            workers=config.workers,
+            dry_run=not config.execute,
         )
+        if config.blob_store is not None and config.execute:
+            from pypiserver.blobs import BlobStore, deduplicate
+
+            store = BlobStore(config.blob_store, config.hash_algo)
+            deduplicate(config.roots, store, workers=config.workers)
+            store.collect()
         return
 
     # Fixes #49:
@@ -183,18 +235,31 @@ def main(argv: Sequence[str] | None = None) -> None:
         sys.argv = ["gunicorn"]
 
     wsgi_kwargs = {"handler_class": WsgiHandler}
+    threaded_kwargs = {
+        "handler_class": ThreadedWsgiHandler,
+        "threads": config.threads,
+        "backlog": config.backlog,
+        "timeout": config.timeout,
+        "keepalive_timeout": config.keepalive_timeout,
+        "graceful_timeout": config.graceful_timeout,
+    }
+    server: Any = config.server_method
 
     if config.server_method == "auto":
         expected_server = guess_auto_server()
-        extra_kwargs = (
-            wsgi_kwargs if expected_server is AutoServer.WsgiRef else {}
-        )
+        extra_kwargs: dict = {}
+        if expected_server is AutoServer.WsgiRef:
+            # Rather than bottle's single-threaded wsgiref server
+            server, extra_kwargs = ThreadedServer, threaded_kwargs
         log.debug(
             "Server 'auto' selected. Expecting bottle to run '%s'. "
             "Passing extra keyword args: %s",
-            expected_server.name,
+            getattr(server, "__name__", expected_server.name),
             extra_kwargs,
         )
+    elif config.server_method == "threaded":
+        server, extra_kwargs = ThreadedServer, threaded_kwargs
+        log.debug("Running bottle with the built-in threaded server")
     else:
         extra_kwargs = wsgi_kwargs if config.server_method == "wsgiref" else {}
         log.debug(
@@ -208,15 +273,65 @@ def main(argv: Sequence[str] | None = None) -> None:
     else:
         main_app = app
 
+    if config.workers > 1:
+        if config.server_method not in ("auto", "threaded"):
+            sys.exit(
+                "--workers requires the built-in server: please use "
+                "`--server threaded` (or `auto`), or run several processes "
+                f"of `--server {config.server_method}` on your own instead."
+            )
+        if server is not ThreadedServer:
+            log.info(
+                "Server 'auto' would run '%s', but the workers run the "
+                "built-in threaded server",
+                guess_auto_server().name,
+            )
+        _serve_workers(main_app, config)
+        return
+
     bottle.run(
         app=main_app,
         host=config.host,
         port=config.port,
-        server=config.server_method,
+        server=server,
         **extra_kwargs,
     )
 
 
+def _serve_workers(app: Any, config: RunConfig) -> None:
+    """Serve `app` from `config.workers` pre-forked processes."""
+    # pylint: disable=import-outside-toplevel
+    from pypiserver import prefork
+
+    sock = prefork.listen(config.host, config.port, config.backlog)
+    # Build the index once, before forking, for all the workers to share
+    count = config.backend.package_count()
+    log.info(
+        "Serving %d packages at http://%s:%d/ from %d workers",
+        count,
+        config.host,
+        sock.getsockname()[1],
+        config.workers,
+    )
+    # Serving no requests, this process leaves the watches to the workers
+    config.backend.prepare_workers(config.workers)
+
+    def worker(sock: Any) -> None:
+        # Watch the roots again: the watching threads did not survive the fork
+        config.backend.package_count()
+        prefork.serve_socket(
+            app,
+            sock,
+            ThreadedWsgiHandler,
+            threads=config.threads,
+            timeout=config.timeout,
+            keepalive_timeout=config.keepalive_timeout,
+            graceful_timeout=config.graceful_timeout,
+        )
+
+    prefork.Master(sock, worker, config.workers, config.graceful_timeout).run()
+
+
 def _logwrite(logger: logging.Logger, level: int, msg: str | None) -> None:
     if msg:
         line_endings = ["\r\n", "\n\r", "\n"]
@@ -1,10 +1,12 @@
+import itertools
 import logging
 import mimetypes
-import os
 import re
+import typing as t
 import xmlrpc.client as xmlrpclib
 import zipfile
 from collections import defaultdict, namedtuple
+from collections.abc import Iterator
 from io import BytesIO
 from json import dumps
 from urllib.parse import quote, urljoin, urlparse
@@ -25,11 +27,20 @@ from .bottle_wrapper import (
     static_file,
     template,
 )
+from .compression import ResponseCompressor
 from .pkg_helpers import guess_pkgname_and_version, normalize_pkgname_for_url
+from .proxy import UpstreamError
+from .render import (
+    render_listing,
+    render_project_links,
+    render_proxied_links,
+    render_simple_index,
+)
 
 log = logging.getLogger(__name__)
 config: RunConfig
 app = Bottle()
+_compressor: t.Optional[ResponseCompressor] = None
 
 
 def request_fullpath(request):
@@ -48,26 +59,79 @@ def get_bad_url_redirect_path(request, project):
     return uri
 
 
+def signed_url(filename: str) -> bool:
+    """Whether the query string signs the download URL of `filename`."""
+    return config.url_signer is not None and config.url_signer.verify(
+        filename,
+        request.query.get("expires", ""),
+        request.query.get("signature", ""),
+    )
+
+
 class auth:
     """decorator to apply authentication if specified for the decorated method & action"""
 
-    def __init__(self, action):
+    def __init__(self, action, signed=False):
         self.action = action
+        # Whether a signed URL may stand for credentials
+        self.signed = signed
 
     def __call__(self, method):
         def protector(*args, **kwargs):
-            if self.action in config.authenticate:
+            if self.action in config.authenticate and not (
+                self.signed and signed_url(kwargs["filename"])
+            ):
                 if not request.auth or request.auth[1] is None:
                     raise HTTPError(
                         401, headers={"WWW-Authenticate": 'Basic realm="pypi"'}
                     )
-                if not config.auther(*request.auth):
+                if not config.check_credentials(*request.auth, self.action):
                     raise HTTPError(403)
             return method(*args, **kwargs)
 
         return protector
 
 
+def get_compressor() -> ResponseCompressor:
+    """Return the response compressor, creating it on first use."""
+    global _compressor
+    if _compressor is None:
+        _compressor = ResponseCompressor(
+            level=config.compression_level,
+            min_size=config.compression_min_size,
+        )
+    return _compressor
+
+
+def compressible(method):
+    """decorator to negotiate the content-encoding of the decorated route"""
+
+    def compressor(*args, **kwargs):
+        body = method(*args, **kwargs)
+        if isinstance(body, str):
+            data, encoding = get_compressor().encode(
+                body.encode(response.charset),
+                request.headers.get("Accept-Encoding"),
+            )
+        elif isinstance(body, Iterator):
+            # Read now: the chunks may be consumed on another thread, where
+            # the thread-local response is not bound
+            charset = response.charset
+            data, encoding = get_compressor().encode_stream(
+                (chunk.encode(charset) for chunk in body),
+                request.headers.get("Accept-Encoding"),
+            )
+        else:
+            # Redirects, errors &c. are sent as they are
+            return body
+        response.add_header("Vary", "Accept-Encoding")
+        if encoding is not None:
+            response.set_header("Content-Encoding", encoding)
+        return data
+
+    return compressor
+
+
 @app.hook("before_request")
 def log_request():
     log.info(config.log_req_frmt, request.environ)
@@ -274,144 +338,155 @@ def handle_rpc():
 
 @app.route("/simple/")
 @auth("list")
+@compressible
 def simpleindex():
-    links = sorted(config.backend.get_projects())
-    tmpl = """<!DOCTYPE html>
-<html lang="en">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Simple Index</title>
-    </head>
-    <body>
-        <h1>Simple Index</h1>
-        % for p in links:
-                <a href="{{p}}/">{{p}}</a><br>
-        % end
-    </body>
-</html>
-    """
-    return template(tmpl, links=links)
+    return render_simple_index(config.backend.get_sorted_projects())
 
 
 @app.route("/simple/:project/")
 @auth("list")
+@compressible
 def simple(project):
     # PEP 503: require normalized project
     normalized = normalize_pkgname_for_url(project)
     if project != normalized:
         return redirect(f"/simple/{normalized}/", 301)
 
-    packages = sorted(
-        config.backend.find_project_packages(project),
-        key=lambda x: (x.parsed_version, x.relfn),
-    )
+    packages = list(config.backend.find_sorted_project_packages(project))
+    current_uri = request_fullpath(request)
+    packages_url = urljoin(current_uri, "../../packages/")
+    sign = config.url_signer.query if config.url_signer is not None else None
+    if config.proxy is not None:
+        # The files of proxied projects are listed from upstream
+        proxy_root = str(config.proxy.cache_root)
+        if all(pkg.root == proxy_root for pkg in packages):
+            try:
+                links = config.proxy.project_links(project)
+            except UpstreamError as exc:
+                log.warning("Upstream failed: %s", exc)
+                if not packages:
+                    return HTTPError(502, f"Bad Gateway ({exc})\n\n")
+                # The files cached so far
+                return render_project_links(
+                    project, packages_url, packages, sign
+                )
+            if links is None:
+                return HTTPError(
+                    404, f"Not Found ({normalized} does not exist)\n\n"
+                )
+            return render_proxied_links(
+                project,
+                packages_url,
+                (
+                    (config.proxy.package_path(link.filename), link)
+                    for link in links
+                ),
+                sign,
+            )
+        packages = [pkg for pkg in packages if pkg.root != proxy_root]
     if not packages:
         if not config.disable_fallback:
             return redirect(f"{config.fallback_url.rstrip('/')}/{project}/")
         return HTTPError(404, f"Not Found ({normalized} does not exist)\n\n")
 
-    current_uri = request_fullpath(request)
-
-    links = (
-        (
-            os.path.basename(pkg.relfn),
-            urljoin(current_uri, f"../../packages/{pkg.fname_and_hash}"),
-        )
-        for pkg in packages
-    )
-
-    tmpl = """<!DOCTYPE html>
-<html lang="en">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Links for {{project}}</title>
-    </head>
-    <body>
-        <h1>Links for {{project}}</h1>
-        % for file, href in links:
-            <a href="{{href}}">{{file}}</a><br>
-        % end
-    </body>
-</html>
-    """
-    return template(tmpl, project=project, links=links)
+    return render_project_links(project, packages_url, packages, sign)
 
 
 @app.route("/packages/")
 @auth("list")
+@compressible
 def list_packages():
     fp = request_fullpath(request)
-    packages = sorted(
-        config.backend.get_all_packages(),
-        key=lambda x: (os.path.dirname(x.relfn), x.pkgname, x.parsed_version),
-    )
+    packages = config.backend.get_sorted_packages()
+    return render_listing("Index of packages", fp, packages)
+
 
-    links = (
-        (pkg.relfn_unix, urljoin(fp, pkg.fname_and_hash)) for pkg in packages
+@app.route("/packages/:subdir#.+/#")
+@auth("list")
+@compressible
+def list_packages_subdir(subdir):
+    """List only the packages within a subdirectory of the package roots."""
+    fp = request_fullpath(request)
+    # Links are relative to the `/packages/` listing itself
+    base = urljoin(fp, "../" * subdir.count("/"))
+    prefix = subdir.strip("/") + "/"
+    packages = iter(
+        pkg
+        for pkg in config.backend.get_sorted_packages()
+        if pkg.relfn_unix.startswith(prefix)
     )
+    first = next(packages, None)
+    if first is None:
+        return HTTPError(404, f"Not Found ({subdir} does not exist)\n\n")
 
-    tmpl = """<!DOCTYPE html>
-<html lang="en">
-    <head>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <title>Index of packages</title>
-    </head>
-    <body>
-        <h1>Index of packages</h1>
-        % for file, href in links:
-            <a href="{{href}}">{{file}}</a><br>
-        % end
-    </body>
-</html>
-    """
-    return template(tmpl, links=links)
+    packages = itertools.chain((first,), packages)
+    return render_listing(f"Index of packages/{prefix}", base, packages)
 
 
 @app.route("/packages/:filename#.*#")
-@auth("download")
+@auth("download", signed=True)
 def server_static(filename):
-    entries = config.backend.get_all_packages()
+    # Look the file up among the packages of its project, rather than
+    # among all packages
+    guessed = guess_pkgname_and_version(filename.rpartition("/")[2])
+    if guessed is None:
+        return HTTPError(404, f"Not Found ({filename} does not exist)\n\n")
+    entries = list(config.backend.find_project_packages(guessed[0]))
     for x in entries:
         f = x.relfn_unix
         if f == filename:
-            response = static_file(
-                filename,
-                root=x.root,
-                mimetype=mimetypes.guess_type(filename)[0],
-            )
-            if config.cache_control:
-                response.set_header(
-                    "Cache-Control", f"public, max-age={config.cache_control}"
-                )
-            return response
+            return package_file(filename, x.root)
+
+    proxy = config.proxy
+    basename = filename.rpartition("/")[2]
+    if (
+        proxy is not None
+        and proxy.package_path(basename) == filename
+        # Projects of the package directories are not proxied
+        and all(x.root == str(proxy.cache_root) for x in entries)
+    ):
+        try:
+            path = proxy.fetch(basename)
+        except UpstreamError as exc:
+            log.warning("Upstream failed: %s", exc)
+            return HTTPError(502, f"Bad Gateway ({exc})\n\n")
+        if path is not None:
+            return package_file(filename, str(proxy.cache_root))
 
     return HTTPError(404, f"Not Found ({filename} does not exist)\n\n")
 
 
+def package_file(filename, root):
+    response = static_file(
+        filename,
+        root=root,
+        mimetype=mimetypes.guess_type(filename)[0],
+    )
+    if config.cache_control:
+        response.set_header(
+            "Cache-Control", f"public, max-age={config.cache_control}"
+        )
+    return response
+
+
 @app.route("/:project/json")
 @auth("list")
+@compressible
 def json_info(project):
     # PEP 503: require normalized project
     normalized = normalize_pkgname_for_url(project)
     if project != normalized:
         return redirect(f"/{normalized}/json", 301)
 
-    packages = sorted(
-        config.backend.find_project_packages(project),
-        key=lambda x: x.parsed_version,
-        reverse=True,
-    )
+    packages = list(config.backend.find_sorted_project_packages(project))
 
     if not packages:
         raise HTTPError(404, f"package {project} not found")
 
-    latest_version = packages[0].version
+    latest_version = packages[-1].version
     releases = defaultdict(list)
     req_url = request.url
-    for x in packages:
+    for x in reversed(packages):
         releases[x.version].append(
             {"url": urljoin(req_url, "../../packages/" + x.relfn)}
         )
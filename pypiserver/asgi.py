@@ -0,0 +1,427 @@
+"""An ASGI entry point, serving the same routes as the WSGI application.
+
+Run it with any ASGI server, such as uvicorn::
+
+    uvicorn --factory pypiserver.asgi:app
+
+Package downloads, which make most of the traffic, are served natively: the
+file is looked up through the backend and the password checked in a thread
+pool, then streamed by reading it in chunks on that pool, so that a client
+waiting on its download costs a coroutine rather than a thread. The other
+routes run the bottle application on the same pool, which also keeps
+password checks and digest computations off the event loop. Anything but a
+successful download (errors, unsatisfiable ranges) is left to the bottle
+application too, for the responses to be the same, except for rejected
+credentials: those are not checked twice, and answered with the error page
+of a bare bottle application.
+
+The pool has `--threads` threads. Routes are served relative to the
+`root_path` of the ASGI server.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import logging
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+import typing as t
+import urllib.parse
+
+from . import (
+    app_from_config,
+    backwards_compat_kwargs,
+    setup_routes_from_config,
+)
+from .bottle_wrapper import (
+    Bottle,
+    HTTPError,
+    parse_auth,
+    parse_date,
+    parse_range_header,
+)
+from .config import Config, RunConfig
+from .core import PkgFile
+from .pkg_helpers import guess_pkgname_and_version
+
+log = logging.getLogger(__name__)
+
+Message = t.MutableMapping[str, t.Any]
+Scope = t.MutableMapping[str, t.Any]
+Receive = t.Callable[[], t.Awaitable[Message]]
+Send = t.Callable[[Message], t.Awaitable[None]]
+
+# The size of the chunks files are read and sent in
+_CHUNK_SIZE = 2**18
+# Request bodies larger than this are spooled to a temporary file
+_MAX_MEMORY_BODY = 2**20
+_HTTP_DATE = "%a, %d %b %Y %H:%M:%S GMT"
+
+
+def app(**kwargs: t.Any) -> "ASGIApp":
+    """Construct an ASGI app running pypiserver.
+
+    :param kwds: Any overrides for defaults, as for `pypiserver.app()`.
+    """
+    config = Config.default_with_overrides(**backwards_compat_kwargs(kwargs))
+    return ASGIApp(config)
+
+
+def _path_info(scope: Scope) -> str:
+    path, root_path = scope["path"], scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        return path[len(root_path) :]
+    return path
+
+
+def _wsgi_str(value: str) -> str:
+    # WSGI strings are bytes decoded as latin-1
+    return value.encode("utf-8").decode("latin-1")
+
+
+@contextlib.asynccontextmanager
+async def _disconnection(
+    receive: Receive,
+) -> t.AsyncIterator[asyncio.Event]:
+    """Yield an event set once the client disconnects."""
+    disconnected = asyncio.Event()
+
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+        disconnected.set()
+
+    task = asyncio.ensure_future(watch())
+    try:
+        yield disconnected
+    finally:
+        task.cancel()
+
+
+class _WSGIResponse:
+    """Runs a WSGI application, one chunk of its response at a time."""
+
+    def __init__(self, wsgi_app: t.Callable, environ: t.Dict[str, t.Any]):
+        self.wsgi_app = wsgi_app
+        self.environ = environ
+        self.status = 500
+        self.headers: t.List[t.Tuple[bytes, bytes]] = []
+        self.result: t.Optional[t.Iterable[bytes]] = None
+        self.chunks: t.Iterator[bytes] = iter(())
+
+    def start_response(self, status: str, headers, exc_info=None):
+        if exc_info is not None and self.result is not None:
+            raise exc_info[1].with_traceback(exc_info[2])
+        self.status = int(status.split(" ", 1)[0])
+        self.headers = [
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in headers
+        ]
+
+    def start(self) -> t.Optional[bytes]:
+        """Run the application, and return the first chunk of its
+        response."""
+        self.result = self.wsgi_app(self.environ, self.start_response)
+        self.chunks = iter(self.result)
+        return self.next()
+
+    def next(self) -> t.Optional[bytes]:
+        """The next chunk of the response, or None past the last one."""
+        return next(self.chunks, None)
+
+    def close(self) -> None:
+        close = getattr(self.result, "close", None)
+        if close is not None:
+            close()
+
+
+class ASGIApp:
+    """Serves pypiserver over ASGI.
+
+    :param wsgi_app: the bottle application serving the routes other than
+        downloads, built from `config` by default
+    :param executor: the pool running blocking work, with `config.threads`
+        threads by default
+    """
+
+    def __init__(
+        self,
+        config: RunConfig,
+        wsgi_app: t.Optional[t.Callable] = None,
+        executor: t.Optional[concurrent.futures.Executor] = None,
+    ):
+        self.config = config
+        self.wsgi_app = wsgi_app or setup_routes_from_config(
+            app_from_config(config), config
+        )
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.threads, thread_name_prefix="pypiserver-asgi"
+        )
+        # Answers the downloads with rejected credentials
+        self.forbidden_app = Bottle()
+        self.forbidden_app.route(
+            "/<path:path>", ["GET", "HEAD"], lambda path: HTTPError(403)
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def _run(self, fn: t.Callable, *args: t.Any) -> t.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    # Build the index before serving
+                    await self._run(self.config.backend.package_count)
+                except Exception as exc:  # pylint: disable=broad-except
+                    log.exception("Failed to list the packages")
+                    await send(
+                        {"type": "lifespan.startup.failed", "message": str(exc)}
+                    )
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send):
+        path = _path_info(scope)
+        if (
+            scope["method"] in ("GET", "HEAD")
+            and path.startswith("/packages/")
+            and not path.endswith("/")
+        ):
+            filename = path[len("/packages/") :]
+            if await self._download(scope, filename, receive, send):
+                return
+        await self._wsgi(scope, receive, send)
+
+    def _find_package(self, project: str, filename: str) -> t.Optional[PkgFile]:
+        for pkg in self.config.backend.find_project_packages(project):
+            if pkg.relfn_unix == filename:
+                return pkg
+        return None
+
+    async def _authorized(
+        self, scope: Scope, filename: str, headers: t.Dict[str, str]
+    ) -> t.Optional[bool]:
+        """Whether the download is authorized, or None without credentials."""
+        if "download" not in self.config.authenticate:
+            return True
+        signer = self.config.url_signer
+        if signer is not None:
+            query = urllib.parse.parse_qs(
+                scope.get("query_string", b"").decode("latin-1")
+            )
+            if signer.verify(
+                filename,
+                query.get("expires", [""])[0],
+                query.get("signature", [""])[0],
+            ):
+                return True
+        auth = parse_auth(headers.get("authorization", ""))
+        if not auth or auth[1] is None:
+            return None
+        return await self._run(self.config.check_credentials, *auth, "download")
+
+    async def _download(
+        self, scope: Scope, filename: str, receive: Receive, send: Send
+    ) -> bool:
+        """Serve a package download, or return False to leave the request
+        to the WSGI application."""
+        headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope["headers"]
+        }
+        authorized = await self._authorized(scope, filename, headers)
+        if authorized is None:
+            return False
+        if not authorized:
+            await self._wsgi(scope, receive, send, self.forbidden_app)
+            return True
+        guessed = guess_pkgname_and_version(filename.rpartition("/")[2])
+        if guessed is None:
+            return False
+        pkg = await self._run(self._find_package, guessed[0], filename)
+        if pkg is None:
+            return False
+        try:
+            f = await self._run(open, pkg.fn, "rb")
+        except OSError:
+            return False
+        try:
+            return await self._send_file(scope, f, headers, send, receive)
+        finally:
+            f.close()
+
+    async def _send_file(
+        self,
+        scope: Scope,
+        f: t.BinaryIO,
+        headers: t.Dict[str, str],
+        send: Send,
+        receive: Receive,
+    ) -> bool:
+        # The headers of `bottle.static_file`
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        response_headers = {
+            "Content-Length": str(size),
+            "Last-Modified": time.strftime(
+                _HTTP_DATE, time.gmtime(stat.st_mtime)
+            ),
+        }
+        mimetype = mimetypes.guess_type(f.name)[0]
+        if mimetype:
+            if mimetype.startswith("text/"):
+                mimetype += "; charset=UTF-8"
+            response_headers["Content-Type"] = mimetype
+
+        status, offset, length = 200, 0, size
+        since = headers.get("if-modified-since")
+        if since is not None:
+            since = parse_date(since.split(";")[0].strip())
+        if since is not None and since >= int(stat.st_mtime):
+            status, length = 304, 0
+            response_headers["Date"] = time.strftime(_HTTP_DATE, time.gmtime())
+        else:
+            response_headers["Accept-Ranges"] = "bytes"
+            if "range" in headers:
+                ranges = list(parse_range_header(headers["range"], size))
+                if not ranges:
+                    return False
+                offset, end = ranges[0]
+                status, length = 206, end - offset
+                response_headers["Content-Range"] = (
+                    f"bytes {offset}-{end - 1}/{size}"
+                )
+                response_headers["Content-Length"] = str(length)
+            if self.config.cache_control:
+                response_headers["Cache-Control"] = (
+                    f"public, max-age={self.config.cache_control}"
+                )
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (name.lower().encode("latin-1"), value.encode("latin-1"))
+                    for name, value in response_headers.items()
+                ],
+            }
+        )
+        if scope["method"] == "HEAD":
+            length = 0
+
+        f.seek(offset)
+        finished = False
+        async with _disconnection(receive) as disconnected:
+            while length > 0 and not disconnected.is_set():
+                chunk = await self._run(f.read, min(_CHUNK_SIZE, length))
+                if not chunk:
+                    # Truncated since
+                    break
+                length -= len(chunk)
+                finished = length <= 0
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": not finished,
+                    }
+                )
+        if not finished:
+            await send({"type": "http.response.body"})
+        return True
+
+    def _environ(self, scope: Scope, body: t.BinaryIO) -> t.Dict[str, t.Any]:
+        server = scope.get("server") or ("localhost", 80)
+        client = scope.get("client") or ("", 0)
+        environ = {
+            "REQUEST_METHOD": scope["method"],
+            "SCRIPT_NAME": _wsgi_str(scope.get("root_path", "")),
+            "PATH_INFO": _wsgi_str(_path_info(scope)),
+            "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+            "SERVER_NAME": server[0],
+            "SERVER_PORT": str(server[1] or 0),
+            "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+            "REMOTE_ADDR": client[0],
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": scope.get("scheme", "http"),
+            "wsgi.input": body,
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for raw_name, raw_value in scope["headers"]:
+            name = raw_name.decode("latin-1").upper().replace("-", "_")
+            value = raw_value.decode("latin-1")
+            key = (
+                name
+                if name in ("CONTENT_TYPE", "CONTENT_LENGTH")
+                else f"HTTP_{name}"
+            )
+            environ[key] = (
+                f"{environ[key]},{value}" if key in environ else value
+            )
+        return environ
+
+    async def _wsgi(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        wsgi_app: t.Optional[t.Callable] = None,
+    ):
+        body = tempfile.SpooledTemporaryFile(max_size=_MAX_MEMORY_BODY)
+        try:
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                await self._run(body.write, message.get("body", b""))
+                more_body = message.get("more_body", False)
+            body.seek(0)
+            response = _WSGIResponse(
+                wsgi_app or self.wsgi_app, self._environ(scope, body)
+            )
+            try:
+                chunk = await self._run(response.start)
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": response.status,
+                        "headers": response.headers,
+                    }
+                )
+                async with _disconnection(receive) as disconnected:
+                    while chunk is not None and not disconnected.is_set():
+                        if chunk:
+                            await send(
+                                {
+                                    "type": "http.response.body",
+                                    "body": chunk,
+                                    "more_body": True,
+                                }
+                            )
+                        chunk = await self._run(response.next)
+                await send({"type": "http.response.body"})
+            finally:
+                await self._run(response.close)
+        finally:
+            body.close()
@@ -1,19 +1,40 @@
 import abc
+import contextlib
 import functools
 import hashlib
+import heapq
 import itertools
 import logging
 import os
+import threading
+import time
 import typing as t
+import weakref
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+from . import offload
+from .blobs import BlobStore
 from .cache import ENABLE_CACHING, CacheManager
+from .catalog import Catalog, listing_sort_key, project_sort_key
 from .core import PkgFile
+from .layout import get_layout
 from .pkg_helpers import (
     guess_pkgname_and_version,
     is_listed_path,
     normalize_pkgname,
 )
+from .scan import ListedFile, scan_listed_files, scan_listed_files_parallel
+from .snapshot import (
+    Snapshot,
+    SnapshotReader,
+    snapshot_generation,
+    write_snapshot,
+)
 
 if t.TYPE_CHECKING:
     from .config import _ConfigCommon as Configuration
@@ -62,8 +83,33 @@ class IBackend(abc.ABC):
     def remove_package(self, pkg: PkgFile) -> None:
         pass
 
+    def get_sorted_packages(self) -> t.Iterable[PkgFile]:
+        """Return all packages in listing order, i.e. sorted by directory,
+        project name and version (see `listing_sort_key`).
+        """
+        return sorted(self.get_all_packages(), key=listing_sort_key)
+
+    def get_sorted_projects(self) -> t.Iterable[str]:
+        """Return the normalized names of all projects, sorted."""
+        return sorted(self.get_projects())
+
+    def find_sorted_project_packages(self, project: str) -> t.Iterable[PkgFile]:
+        """Return the packages of a project, sorted by version (oldest first)
+        and path (see `project_sort_key`).
+        """
+        return sorted(self.find_project_packages(project), key=project_sort_key)
+
+    def prepare_workers(self, workers: int) -> None:
+        """Called before `workers` processes are forked from this one to
+        serve the backend, while this one serves no requests anymore."""
+
 
 class Backend(IBackend, abc.ABC):
+    # Whether the PkgFiles returned by the backend are created with their
+    # `digester` already bound to `self.digest`. Otherwise, `BackendProxy`
+    # binds it to every package it hands out.
+    binds_digester = False
+
     def __init__(self, config: "Configuration"):
         self.hash_algo = config.hash_algo
 
@@ -97,7 +143,7 @@ class Backend(IBackend, abc.ABC):
     def digest(self, pkg: PkgFile) -> t.Optional[str]:
         if self.hash_algo is None or pkg.fn is None:
             return None
-        return digest_file(pkg.fn, self.hash_algo)
+        return offload.run(digest_file, pkg.fn, self.hash_algo)
 
     def package_count(self) -> int:
         """Return a count of all available packages. When implementing a Backend
@@ -139,15 +185,90 @@ class Backend(IBackend, abc.ABC):
 
 
 class SimpleFileBackend(Backend):
+    binds_digester = True
+
     def __init__(self, config: "Configuration"):
         super().__init__(config)
         self.roots = [Path(root).resolve() for root in config.roots]
+        self.scan_workers = config.scan_workers
+        self.layout = get_layout(config.layout)
+        self.blobs = (
+            BlobStore(config.blob_store, config.hash_algo)
+            if config.blob_store is not None
+            else None
+        )
 
     def get_all_packages(self) -> t.Iterable[PkgFile]:
-        return itertools.chain.from_iterable(listdir(r) for r in self.roots)
+        if self.scan_workers > 1:
+            return itertools.chain.from_iterable(
+                valid_packages(root, files, self.digest)
+                for root, files in zip(
+                    self.roots,
+                    offload.run(
+                        scan_listed_files_parallel,
+                        self.roots,
+                        self.scan_workers,
+                    ),
+                )
+            )
+        return itertools.chain.from_iterable(
+            offload.iterate(listdir, r, self.digest) for r in self.roots
+        )
+
+    def package_path(self, filename: str) -> Path:
+        """Where an uploaded package file is stored."""
+        return self.roots[0].joinpath(
+            self.layout.package_path(filename) or filename
+        )
 
     def add_package(self, filename: str, stream: t.BinaryIO) -> None:
-        write_file(stream, self.roots[0].joinpath(filename))
+        path = self.package_path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if self.blobs is not None:
+            self.blobs.add(stream, path)
+            return
+        if path.is_file() and path.stat().st_nlink > 1:
+            # Do not write through to the files it is linked with
+            path.unlink()
+        write_file(stream, path)
+
+    def _digest_file(self, path: PathLike, hash_algo: str) -> str:
+        if self.blobs is not None:
+            address = self.blobs.address(path, hash_algo)
+            if address is not None:
+                return address
+        return offload.run(digest_file, path, hash_algo)
+
+    def digest(self, pkg: PkgFile) -> t.Optional[str]:
+        if self.hash_algo is None or pkg.fn is None:
+            return None
+        return self._digest_file(pkg.fn, self.hash_algo)
+
+    def find_project_packages(self, project: str) -> t.Iterable[PkgFile]:
+        if not self.layout.indexed:
+            return super().find_project_packages(project)
+        # Only the directory of the project is to be listed
+        project_norm = normalize_pkgname(project)
+        project_dir = self.layout.project_dir(project)
+        return (
+            pkg
+            for root in self.roots
+            for pkg in valid_packages(
+                root,
+                offload.iterate(scan_listed_files, root.joinpath(project_dir)),
+                self.digest,
+            )
+            if pkg.pkgname_norm == project_norm
+        )
+
+    def find_version(self, name: str, version: str) -> t.Iterable[PkgFile]:
+        if not self.layout.indexed:
+            return super().find_version(name, version)
+        return (
+            pkg
+            for pkg in self.find_project_packages(name)
+            if pkg.pkgname == name and pkg.version == version
+        )
 
     def remove_package(self, pkg: PkgFile) -> None:
         if pkg.fn is not None:
@@ -162,10 +283,13 @@ class SimpleFileBackend(Backend):
                 raise
 
     def exists(self, filename: str) -> bool:
+        relpath = self.layout.package_path(filename)
+        if self.layout.indexed and relpath is not None:
+            return any(root.joinpath(relpath).is_file() for root in self.roots)
         return any(
             filename == existing_file.name
             for root in self.roots
-            for existing_file in all_listed_files(root)
+            for existing_file in scan_listed_files(root)
         )
 
 
@@ -177,28 +301,434 @@ class CachingFileBackend(SimpleFileBackend):
     ):
         super().__init__(config)
 
-        self.cache_manager = cache_manager or CacheManager()  # type: ignore
+        _require_caching(config)
+        self.cache_manager = cache_manager or CacheManager(
+            poll_roots=(
+                self.roots
+                if config.watch_budget == 0
+                else [Path(root).resolve() for root in config.poll_roots]
+            ),
+            poll_interval=config.poll_interval,
+            watch_budget=config.watch_budget,
+            digest_max_entries=config.digest_cache_entries,
+            digest_max_bytes=config.digest_cache_bytes,
+        )
+        # Packages enter the cache with their digester bound once and for all
+        self._listdir = functools.partial(
+            offload.iterate,
+            listdir,
+            digester=self.digest,
+            workers=self.scan_workers,
+        )
+        self._listed_package = functools.partial(
+            listed_package, digester=self.digest
+        )
+        # The merged projects of all roots, along with the catalogs (and
+        # their generations) they were computed from
+        self._merged_projects: t.Tuple[tuple, t.List[str]] = ((), [])
 
     def add_package(self, filename: str, stream: t.BinaryIO) -> None:
         super().add_package(filename, stream)
-        self.cache_manager.invalidate_root_cache(self.roots[0])
+        self.cache_manager.update_root_cache(
+            self.roots[0], added=[str(self.package_path(filename))]
+        )
 
     def remove_package(self, pkg: PkgFile) -> None:
         super().remove_package(pkg)
-        self.cache_manager.invalidate_root_cache(pkg.root)
+        if pkg.root is None or pkg.fn is None:
+            return
+        self.cache_manager.update_root_cache(pkg.root, removed=[pkg.fn])
+
+    def _catalogs(self) -> t.List[Catalog]:
+        return [
+            self.cache_manager.listdir(r, self._listdir, self._listed_package)
+            for r in self.roots
+        ]
 
     def get_all_packages(self) -> t.Iterable[PkgFile]:
-        return itertools.chain.from_iterable(
-            self.cache_manager.listdir(r, listdir) for r in self.roots
+        return itertools.chain.from_iterable(self._catalogs())
+
+    def prepare_workers(self, workers: int) -> None:
+        # The catalogs are shared with the workers, but each watches the
+        # roots on its own
+        self.cache_manager.hand_over_watches(workers)
+
+    def package_count(self) -> int:
+        return sum(len(catalog) for catalog in self._catalogs())
+
+    def get_projects(self) -> t.Iterable[str]:
+        return self.get_sorted_projects()
+
+    def get_sorted_projects(self) -> t.Sequence[str]:
+        catalogs = self._catalogs()
+        if len(catalogs) == 1:
+            return catalogs[0].projects()
+
+        state = tuple((catalog, catalog.generation) for catalog in catalogs)
+        merged_state, projects = self._merged_projects
+        if merged_state != state:
+            projects = list(
+                dict.fromkeys(heapq.merge(*(c.projects() for c in catalogs)))
+            )
+            self._merged_projects = (state, projects)
+        return projects
+
+    def find_project_packages(self, project: str) -> t.Iterable[PkgFile]:
+        return self.find_sorted_project_packages(project)
+
+    def find_sorted_project_packages(self, project: str) -> t.Sequence[PkgFile]:
+        project = normalize_pkgname(project)
+        catalogs = self._catalogs()
+        if len(catalogs) == 1:
+            return catalogs[0].find_project(project)
+        return list(
+            heapq.merge(
+                *(c.find_project(project) for c in catalogs),
+                key=project_sort_key,
+            )
+        )
+
+    def find_version(self, name: str, version: str) -> t.Iterable[PkgFile]:
+        return [
+            pkg
+            for pkg in self.find_sorted_project_packages(name)
+            if pkg.pkgname == name and pkg.version == version
+        ]
+
+    def get_sorted_packages(self) -> t.Iterable[PkgFile]:
+        catalogs = self._catalogs()
+        if len(catalogs) == 1:
+            return catalogs[0].sorted_packages()
+        # The sorted roots are lazily merged, so the packages can be
+        # streamed right away.
+        return heapq.merge(
+            *(c.sorted_packages() for c in catalogs), key=listing_sort_key
         )
 
     def digest(self, pkg: PkgFile) -> t.Optional[str]:
         if self.hash_algo is None or pkg.fn is None:
             return None
         return self.cache_manager.digest_file(
-            pkg.fn, self.hash_algo, digest_file
+            pkg.fn, self.hash_algo, self._digest_file
+        )
+
+
+# The shortest interval between checks for changes to publish
+_MIN_PUBLISH_INTERVAL = 1.0
+
+
+class _PublishedDigests:
+    """The digests of the packages of the published snapshot, by path.
+
+    They are kept apart from the bounded digest cache, which may evict them
+    before they are published, and carried over from one generation to the
+    next. The paths whose files the cache manager sees change are forgotten,
+    including while a generation is being written.
+    """
+
+    def __init__(self):
+        self._digests: t.Dict[str, str] = {}
+        # The number of paths forgotten, as files may be rewritten without
+        # changing the catalogs
+        self.changes = 0
+        # The paths forgotten since each tracking began
+        self._trackers: t.List[t.Set[str]] = []
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> t.Optional[str]:
+        return self._digests.get(path)
+
+    def forget(self, paths: t.Iterable[str]) -> None:
+        with self._lock:
+            for path in paths:
+                self.changes += 1
+                self._digests.pop(path, None)
+                for forgotten in self._trackers:
+                    forgotten.add(path)
+
+    @contextlib.contextmanager
+    def tracking(self) -> t.Iterator[t.Set[str]]:
+        """Track the paths forgotten while digests are being computed."""
+        forgotten: t.Set[str] = set()
+        with self._lock:
+            self._trackers.append(forgotten)
+        try:
+            yield forgotten
+        finally:
+            with self._lock:
+                self._trackers.remove(forgotten)
+
+    def store(
+        self,
+        digests: t.Dict[str, str],
+        forgotten: t.Set[str],
+        replace: bool = False,
+    ) -> None:
+        """Store `digests`, but for the `forgotten` paths, replacing all the
+        digests if `replace`."""
+        with self._lock:
+            fresh = {
+                path: digest
+                for path, digest in digests.items()
+                if path not in forgotten
+            }
+            if replace:
+                self._digests = fresh
+            else:
+                self._digests.update(fresh)
+
+
+class SnapshotBackend(SimpleFileBackend):
+    """Serves the packages from a snapshot shared by all worker processes.
+
+    The first process to lock `<snapshot>.lock` keeps a `CachingFileBackend`
+    and publishes a new generation of the snapshot whenever its catalogs
+    change, then fills the missing digests in. The other processes only map
+    the latest generation, checking for a new one at most every
+    `poll_interval` seconds (and for the lock to be free), and list the
+    roots themselves until a snapshot is published. Their uploads are seen
+    by the publishing process like any other change to the roots.
+    """
+
+    def __init__(self, config: "Configuration"):
+        super().__init__(config)
+        _require_caching(config)
+        self.config = config
+        self.snapshot_path = Path(config.snapshot)
+        self.reader = SnapshotReader(
+            self.snapshot_path, config.poll_interval, self.digest
+        )
+        self.leader: t.Optional[CachingFileBackend] = None
+        self._pid = os.getpid()
+        self._lock_fd: t.Optional[int] = None
+        self._tried_at: t.Optional[float] = None
+        self._lead_lock = threading.Lock()
+        self._publish_lock = threading.Lock()
+        self._published: tuple = ()
+        self._filled: tuple = ()
+        self._missing_digests = 0
+        self._digests = _PublishedDigests()
+        # The digests of the generation being written
+        self._writing: t.Dict[str, str] = {}
+
+    def _lead(self) -> t.Optional[CachingFileBackend]:
+        """Return the backend publishing the snapshot, if this process is
+        (or just became) the one doing so."""
+        if self._pid != os.getpid():
+            # Forked: publishing, and the lock, stay with the parent
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+            self._pid, self._lock_fd, self.leader = os.getpid(), None, None
+            self._tried_at = None
+        if self.leader is not None:
+            return self.leader
+
+        now = time.monotonic()
+        if self._tried_at is not None and (
+            now - self._tried_at < self.reader.interval
+        ):
+            return None
+        with self._lead_lock:
+            if self.leader is None:
+                self._tried_at = now
+                if self._acquire_lock():
+                    self.leader = CachingFileBackend(self.config)
+                    self.leader.cache_manager.forget_callbacks.append(
+                        self._digests.forget
+                    )
+                    self.publish()
+                    threading.Thread(
+                        target=_publish_periodically,
+                        args=(weakref.ref(self),),
+                        name="pypiserver-snapshot",
+                        daemon=True,
+                    ).start()
+        return self.leader
+
+    def _acquire_lock(self) -> bool:
+        if fcntl is None:
+            return True
+        fd = os.open(f"{self.snapshot_path}.lock", os.O_RDWR | os.O_CREAT)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _cached_digest(self, pkg: PkgFile) -> t.Optional[str]:
+        if self.hash_algo is None or pkg.fn is None or self.leader is None:
+            return None
+        digest = self.leader.cache_manager.cached_digest(pkg.fn, self.hash_algo)
+        if digest is None:
+            digest = self._digests.get(pkg.fn)
+        if digest is None and self.blobs is not None:
+            digest = self.blobs.address(pkg.fn, self.hash_algo)
+        return digest
+
+    def _known_digest(self, pkg: PkgFile) -> t.Optional[str]:
+        digest = self._cached_digest(pkg)
+        if digest is None:
+            self._missing_digests += 1
+        elif pkg.fn is not None:
+            self._writing[pkg.fn] = digest
+        return digest
+
+    def _catalog_state(self) -> tuple:
+        assert self.leader is not None
+        catalogs = tuple((c, c.generation) for c in self.leader._catalogs())
+        return catalogs, self._digests.changes
+
+    def publish(self, force: bool = False) -> bool:
+        """Publish a new generation of the snapshot if the catalogs changed
+        since the last one (or if `force`). Only the publishing process may
+        do so."""
+        leader = self.leader
+        if leader is None:
+            raise RuntimeError("Only the publishing process may publish")
+        with self._publish_lock, self._digests.tracking() as forgotten:
+            state = self._catalog_state()
+            if state == self._published and not force:
+                return False
+            self._missing_digests = 0
+            self._writing = {}
+            write_snapshot(
+                self.snapshot_path,
+                leader.get_sorted_packages(),
+                (
+                    (project, leader.find_sorted_project_packages(project))
+                    for project in leader.get_sorted_projects()
+                ),
+                generation=snapshot_generation(self.snapshot_path) + 1,
+                digest=self._known_digest,
+            )
+            # Carried over to the next generation
+            self._digests.store(self._writing, forgotten, replace=True)
+            self._published = state
+        self.reader.refresh()
+        return True
+
+    def fill_digests(self) -> bool:
+        """Compute the digests missing from the snapshot, and publish them.
+        Only the publishing process may do so.
+
+        They are not computed again until the catalogs change, even if some
+        could not be (e.g. for files removed meanwhile).
+        """
+        if not self._missing_digests or self.leader is None:
+            return False
+        assert self.hash_algo is not None
+        state = self._catalog_state()
+        if state == self._filled:
+            return False
+        self._filled = state
+        with self._digests.tracking() as forgotten:
+            digests = {}
+            for pkg in self.leader.get_all_packages():
+                if pkg.fn is None or self._cached_digest(pkg) is not None:
+                    continue
+                try:
+                    digests[pkg.fn] = self._digest_file(pkg.fn, self.hash_algo)
+                except OSError as exc:
+                    log.warning("Cannot digest %s: %s", pkg.fn, exc)
+            self._digests.store(digests, forgotten)
+        return self.publish(force=True)
+
+    def _snapshot(self) -> t.Optional[Snapshot]:
+        self._lead()
+        return self.reader.get()
+
+    def get_all_packages(self) -> t.Iterable[PkgFile]:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return super().get_all_packages()
+        return snapshot.sorted_packages()
+
+    def get_sorted_packages(self) -> t.Iterable[PkgFile]:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return super().get_sorted_packages()
+        return snapshot.sorted_packages()
+
+    def package_count(self) -> int:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return super().package_count()
+        return len(snapshot)
+
+    def get_projects(self) -> t.Iterable[str]:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return super().get_projects()
+        return snapshot.projects()
+
+    def get_sorted_projects(self) -> t.Sequence[str]:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return sorted(super().get_projects())
+        return snapshot.projects()
+
+    def find_project_packages(self, project: str) -> t.Iterable[PkgFile]:
+        return self.find_sorted_project_packages(project)
+
+    def find_sorted_project_packages(self, project: str) -> t.Sequence[PkgFile]:
+        snapshot = self._snapshot()
+        if snapshot is None:
+            return sorted(
+                super().find_project_packages(project), key=project_sort_key
+            )
+        return snapshot.find_project(normalize_pkgname(project))
+
+    def find_version(self, name: str, version: str) -> t.Iterable[PkgFile]:
+        return [
+            pkg
+            for pkg in self.find_sorted_project_packages(name)
+            if pkg.pkgname == name and pkg.version == version
+        ]
+
+    def exists(self, filename: str) -> bool:
+        snapshot = self._snapshot()
+        guessed = guess_pkgname_and_version(filename)
+        if snapshot is None or guessed is None:
+            return super().exists(filename)
+        return any(
+            os.path.basename(pkg.relfn or "") == filename
+            for pkg in snapshot.find_project(normalize_pkgname(guessed[0]))
         )
 
+    def add_package(self, filename: str, stream: t.BinaryIO) -> None:
+        leader = self._lead()
+        if leader is None:
+            super().add_package(filename, stream)
+            return
+        leader.add_package(filename, stream)
+        self.publish()
+
+    def remove_package(self, pkg: PkgFile) -> None:
+        leader = self._lead()
+        if leader is None:
+            super().remove_package(pkg)
+            return
+        leader.remove_package(pkg)
+        self.publish()
+
+
+def _publish_periodically(ref: "weakref.ref[SnapshotBackend]") -> None:
+    """Publish the changes of a backend until it is gone."""
+    while True:
+        backend = ref()
+        if backend is None:
+            return
+        interval = max(backend.reader.interval, _MIN_PUBLISH_INTERVAL)
+        try:
+            if not backend.publish():
+                backend.fill_digests()
+        except Exception:
+            log.exception("Failed to publish %s", backend.snapshot_path)
+        del backend
+        time.sleep(interval)
+
 
 def write_file(fh: t.BinaryIO, destination: PathLike) -> None:
     """write a byte stream into a destination file. Writes are chunked to reduce
@@ -214,31 +744,35 @@ def write_file(fh: t.BinaryIO, destination: PathLike) -> None:
         fh.seek(offset)
 
 
-def listdir(root: Path) -> t.Iterator[PkgFile]:
+Digester = t.Callable[[PkgFile], t.Optional[str]]
+
+
+def listdir(
+    root: Path, digester: t.Optional[Digester] = None, workers: int = 1
+) -> t.Iterator[PkgFile]:
     root = root.resolve()
-    files = all_listed_files(root)
-    yield from valid_packages(root, files)
+    if workers > 1:
+        [files] = scan_listed_files_parallel([root], workers)
+        yield from valid_packages(root, files, digester)
+    else:
+        yield from valid_packages(root, scan_listed_files(root), digester)
 
 
 def all_listed_files(root: Path) -> t.Iterator[Path]:
-    for dirpath, dirnames, filenames in os.walk(root):
-        dirnames[:] = (
-            dirname for dirname in dirnames if is_listed_path(Path(dirname))
-        )
-        for filename in filenames:
-            if not is_listed_path(Path(filename)):
-                continue
-            filepath = root / dirpath / filename
-            if Path(filepath).is_file():
-                yield filepath
+    for file in scan_listed_files(root):
+        yield Path(file.path)
 
 
-def valid_packages(root: Path, files: t.Iterable[Path]) -> t.Iterator[PkgFile]:
+def valid_packages(
+    root: Path,
+    files: t.Iterable[t.Union[Path, ListedFile]],
+    digester: t.Optional[Digester] = None,
+) -> t.Iterator[PkgFile]:
     for file in files:
-        res = guess_pkgname_and_version(str(file.name))
+        res = guess_pkgname_and_version(file.name)
         if res is not None:
             pkgname, version = res
-            fn = str(file)
+            fn = os.fspath(file)
             root_name = str(root)
             yield PkgFile(
                 pkgname=pkgname,
@@ -246,9 +780,26 @@ def valid_packages(root: Path, files: t.Iterable[Path]) -> t.Iterator[PkgFile]:
                 fn=fn,
                 root=root_name,
                 relfn=fn[len(root_name) + 1 :],
+                digester=digester,
             )
 
 
+def listed_package(
+    root: Path, path: PathLike, digester: t.Optional[Digester] = None
+) -> t.Optional[PkgFile]:
+    """Return the package for a single file within `root`, if `listdir(root)`
+    would list it.
+    """
+    path = Path(path)
+    try:
+        relpath = path.relative_to(root)
+    except ValueError:
+        return None
+    if not is_listed_path(relpath) or not path.is_file():
+        return None
+    return next(valid_packages(root, [path], digester), None)
+
+
 def digest_file(file_path: PathLike, hash_algo: str) -> str:
     """
     Reads and digests a file according to specified hashing-algorith.
@@ -267,8 +818,26 @@ def digest_file(file_path: PathLike, hash_algo: str) -> str:
     return f"{hash_algo}={digester.hexdigest()}"
 
 
+def polls_all_roots(config: "Configuration") -> bool:
+    """Whether no package root of `config` is to be watched for changes."""
+    return config.watch_budget == 0 or {
+        Path(root).resolve() for root in config.poll_roots
+    }.issuperset(Path(root).resolve() for root in config.roots)
+
+
+def _require_caching(config: "Configuration") -> None:
+    if not ENABLE_CACHING and not polls_all_roots(config):
+        raise RuntimeError(
+            "Please install the extra cache requirements by running 'pip "
+            "install pypiserver[cache]' to use the CachingFileBackend, "
+            "or have all package directories polled with --poll-root"
+        )
+
+
 def get_file_backend(config: "Configuration") -> Backend:
-    if ENABLE_CACHING:
+    if config.snapshot is not None:
+        return SnapshotBackend(config)
+    if ENABLE_CACHING or polls_all_roots(config):
         return CachingFileBackend(config)
     return SimpleFileBackend(config)
 
@@ -282,13 +851,22 @@ def with_digester(func: PkgFunc) -> PkgFunc:
         self: "BackendProxy", *args: t.Any, **kwargs: t.Any
     ) -> t.Iterable[PkgFile]:
         packages = func(self, *args, **kwargs)
-        for package in packages:
-            package.digester = self.backend.digest
-            yield package
+        if self.backend.binds_digester:
+            # Hand out the (possibly cached) packages as they are
+            return packages
+        return _bind_digester(packages, self.backend.digest)
 
     return t.cast(PkgFunc, add_digester_method)
 
 
+def _bind_digester(
+    packages: t.Iterable[PkgFile], digester: Digester
+) -> t.Iterator[PkgFile]:
+    for package in packages:
+        package.digester = digester
+        yield package
+
+
 class BackendProxy(IBackend):
     def __init__(self, wraps: Backend):
         self.backend = wraps
@@ -307,6 +885,17 @@ class BackendProxy(IBackend):
     def get_projects(self) -> t.Iterable[str]:
         return self.backend.get_projects()
 
+    def get_sorted_projects(self) -> t.Iterable[str]:
+        return self.backend.get_sorted_projects()
+
+    @with_digester
+    def find_sorted_project_packages(self, project: str) -> t.Iterable[PkgFile]:
+        return self.backend.find_sorted_project_packages(project)
+
+    @with_digester
+    def get_sorted_packages(self) -> t.Iterable[PkgFile]:
+        return self.backend.get_sorted_packages()
+
     def exists(self, filename: str) -> bool:
         assert "/" not in filename
         return self.backend.exists(filename)
@@ -314,6 +903,9 @@ class BackendProxy(IBackend):
     def package_count(self) -> int:
         return self.backend.package_count()
 
+    def prepare_workers(self, workers: int) -> None:
+        self.backend.prepare_workers(workers)
+
     def add_package(self, filename: str, fh: t.BinaryIO) -> None:
         assert "/" not in filename
         return self.backend.add_package(filename, fh)
@@ -0,0 +1,204 @@
+"""A content-addressed store for package files.
+
+Each distinct content is stored once, as `<store>/<algo>/<h[0:2]>/<h>`, `h`
+being its hex digest, and package files within the roots are hard links to
+these blobs. Uploading bytes that are already stored only adds a link, and
+the digest of a linked package comes from the address of its blob, matched
+by inode, instead of reading it through.
+
+Removing a package only unlinks it from its root: blobs that no root links
+to anymore are removed by `BlobStore.collect`. The store must be on the same
+file system as the roots; otherwise packages are copied out of it, and only
+the uploads are deduplicated. A hidden directory within the first root, such
+as `.blobs`, is never listed as a package directory.
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import typing as t
+from pathlib import Path
+
+from .pkg_helpers import guess_pkgname_and_version
+from .scan import PathLike, scan_listed_files_parallel
+
+log = logging.getLogger(__name__)
+
+DEFAULT_HASH_ALGO = "sha256"
+
+_Inode = t.Tuple[int, int]
+
+
+class BlobStore:
+    def __init__(self, path: PathLike, hash_algo: t.Optional[str] = None):
+        self.path = Path(path)
+        self.hash_algo = hash_algo or DEFAULT_HASH_ALGO
+        self.blobs_dir = self.path / self.hash_algo
+        self.tmp_dir = self.path / "tmp"
+        self.blobs_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(exist_ok=True)
+        # The hex digests of the blobs, by (device, inode)
+        self._addresses: t.Optional[t.Dict[_Inode, str]] = None
+        self._lock = threading.Lock()
+        self._warned_copy = False
+
+    def blob_path(self, hexdigest: str) -> Path:
+        return self.blobs_dir / hexdigest[:2] / hexdigest
+
+    def _hash_file(self, path: PathLike) -> str:
+        digester = hashlib.new(self.hash_algo)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**16), b""):
+                digester.update(block)
+        return digester.hexdigest()
+
+    def _index(self) -> t.Dict[_Inode, str]:
+        if self._addresses is None:
+            with self._lock:
+                if self._addresses is None:
+                    self._addresses = self._scan_addresses()
+        return self._addresses
+
+    def _scan_addresses(self) -> t.Dict[_Inode, str]:
+        device = self.blobs_dir.stat().st_dev
+        addresses = {}
+        with os.scandir(self.blobs_dir) as shards:
+            for shard in shards:
+                if not shard.is_dir(follow_symlinks=False):
+                    continue
+                with os.scandir(shard.path) as blobs:
+                    for blob in blobs:
+                        addresses[(device, blob.inode())] = blob.name
+        return addresses
+
+    def address(self, path: PathLike, hash_algo: str) -> t.Optional[str]:
+        """The `<hash_algo>=<hex_digest>` of a file linked to a blob, or None
+        if it is not (or the store uses another algorithm)."""
+        if hash_algo != self.hash_algo:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_nlink < 2:
+            return None
+        hexdigest = self._index().get((stat.st_dev, stat.st_ino))
+        if hexdigest is None:
+            return None
+        try:
+            # The blob may be gone, and its inode reused since
+            if not os.path.samestat(stat, os.stat(self.blob_path(hexdigest))):
+                return None
+        except OSError:
+            return None
+        return f"{hash_algo}={hexdigest}"
+
+    def _remember(self, blob: Path) -> None:
+        stat = blob.stat()
+        self._index()[(stat.st_dev, stat.st_ino)] = blob.name
+
+    def _add_blob(self, source: Path, hexdigest: str) -> Path:
+        """Link `source` as the blob of `hexdigest`, unless there is one."""
+        blob = self.blob_path(hexdigest)
+        blob.parent.mkdir(exist_ok=True)
+        try:
+            os.link(source, blob)
+        except FileExistsError:
+            pass
+        else:
+            self._remember(blob)
+        return blob
+
+    def _link(self, blob: Path, destination: Path) -> None:
+        """Atomically replace `destination` with a link to `blob`."""
+        fd, tmp = tempfile.mkstemp(
+            dir=destination.parent, prefix=f".{destination.name}."
+        )
+        os.close(fd)
+        try:
+            os.unlink(tmp)
+            try:
+                os.link(blob, tmp)
+            except OSError:
+                if not self._warned_copy:
+                    log.warning(
+                        "Cannot link %s to %s: copying blobs out instead",
+                        self.path,
+                        destination.parent,
+                    )
+                    self._warned_copy = True
+                shutil.copyfile(blob, tmp)
+            os.replace(tmp, destination)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def add(self, stream: t.BinaryIO, destination: PathLike) -> str:
+        """Store the content of `stream` (unless it is already) and link it
+        as `destination`. Return the `<hash_algo>=<hex_digest>` of the
+        content."""
+        digester = hashlib.new(self.hash_algo)
+        offset = stream.tell()
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with open(fd, "wb") as f:
+                for chunk in iter(lambda: stream.read(2**20), b""):
+                    digester.update(chunk)
+                    f.write(chunk)
+            blob = self._add_blob(Path(tmp), digester.hexdigest())
+        finally:
+            stream.seek(offset)
+            os.unlink(tmp)
+        self._link(blob, Path(destination))
+        return f"{self.hash_algo}={blob.name}"
+
+    def ingest(self, path: PathLike) -> int:
+        """Store an existing file, replacing it with a link to the blob of
+        the same content if there already is one. Return the number of bytes
+        freed by doing so."""
+        path = Path(path)
+        stat = path.stat()
+        if self.address(path, self.hash_algo) is not None:
+            return 0
+        blob = self._add_blob(path, self._hash_file(path))
+        if os.path.samestat(stat, blob.stat()):
+            return 0
+        self._link(blob, path)
+        return stat.st_size if stat.st_nlink == 1 else 0
+
+    def collect(self) -> int:
+        """Remove the blobs that are not linked from anywhere anymore, and
+        return their number."""
+        removed = 0
+        for shard in self.blobs_dir.iterdir():
+            for blob in shard.iterdir():
+                if blob.stat().st_nlink == 1:
+                    blob.unlink()
+                    removed += 1
+        with self._lock:
+            self._addresses = None
+        return removed
+
+
+def deduplicate(
+    roots: t.Sequence[PathLike], store: BlobStore, workers: int = 1
+) -> int:
+    """Ingest the packages within `roots` into `store`, with up to `workers`
+    threads, and return the number of bytes freed."""
+    paths = [
+        file.path
+        for files in scan_listed_files_parallel(roots, max(workers, 1))
+        for file in files
+        if guess_pkgname_and_version(file.name) is not None
+    ]
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(workers, 1), thread_name_prefix="pypiserver-dedup"
+    ) as pool:
+        freed = sum(pool.map(store.ingest, paths))
+    log.info("Freed %d bytes deduplicating %d packages", freed, len(paths))
+    return freed
@@ -1,15 +1,23 @@
 #
-# The cache implementation is only used when the watchdog package
-# is installed
+# Watching package roots for changes needs the watchdog package, polling
+# them does not
 #
 
+import contextlib
+import logging
+import os
+import sys
 import threading
+import time
 import typing as t
+import weakref
+from collections import OrderedDict
 from os.path import dirname
 from pathlib import Path
 
 try:
     from watchdog.observers import Observer
+    from watchdog.observers.api import ObservedWatch
 
     ENABLE_CACHING = True
 
@@ -18,102 +26,656 @@ except ImportError:
 
     ENABLE_CACHING = False
 
+from pypiserver import offload
+from pypiserver.catalog import Catalog
+from pypiserver.scan import count_directories, scan_directory
+
 if t.TYPE_CHECKING:
     from pypiserver.core import PkgFile
 
+# Builds the PkgFile for a single file of a package root, if it is a listed
+# package: `(root, path) -> PkgFile | None`
+FileFn = t.Callable[[Path, str], t.Optional["PkgFile"]]
+
+log = logging.getLogger(__name__)
+
+# The minimum number of seconds between two checks of a polled root
+DEFAULT_POLL_INTERVAL = 5.0
+
+# Directories modified this close (in ns) to being listed are listed again
+# on the next check, as later changes may not move their mtime on file
+# systems with coarse timestamps
+_RACY_NS = 2_000_000_000
+
+# The minimum number of seconds between two sweeps of the digest cache
+DEFAULT_SWEEP_INTERVAL = 300.0
+
+# The estimated bytes taken by a digest cache entry, besides its path and
+# digest: the key tuple and the ordered dict's slot and link
+_DIGEST_ENTRY_OVERHEAD = 160
+
+_MAX_USER_WATCHES = "/proc/sys/fs/inotify/max_user_watches"
+
+
+def default_watch_budget() -> t.Optional[int]:
+    """The number of inotify watches a user may have, if limited."""
+    try:
+        with open(_MAX_USER_WATCHES) as fh:
+            return int(fh.read())
+    except (OSError, ValueError):
+        return None
+
 
 class CacheManager:
     """
     A naive cache implementation for listdir and digest_file
 
-    The listdir_cache is just a giant list of PkgFile objects, and
-    for simplicity it is invalidated anytime a modification occurs
-    within the directory it represents. If we were smarter about
-    the way that the listdir data structure were created/stored,
-    then we could do more granular invalidation. In practice, this
-    is good enough for now.
+    The listdir_cache holds a `Catalog` of PkgFile objects per root. When
+    the root was listed with a `file_fn`, file events within it are applied
+    to the catalog incrementally; otherwise (and for directory events, which
+    may affect a whole subtree) the root's catalog is simply invalidated.
 
     The digest_cache exists on a per-file basis, because computing
     hashes on large files can get expensive, and it's very easy to
-    invalidate specific filenames.
+    invalidate specific filenames. Its size is accounted for, and the least
+    recently used digests are evicted past `digest_max_entries` or
+    `digest_max_bytes`. Every `sweep_interval` seconds, the digests of
+    files that are no longer listed are dropped as well, in case their
+    removal was missed.
+
+    Roots are watched for filesystem events with `watchdog`, except for the
+    `poll_roots`, which are rather checked for directory mtime changes when
+    they are listed, at most once every `poll_interval` seconds (see
+    `PolledRoot`). Polling does not need `watchdog`, and sees the changes
+    made by other clients of network file systems.
+
+    Watching a directory takes an inotify watch for each directory within
+    it, and the number of watches is limited. Watches are counted against
+    `watch_budget` (by default, the system limit), and a root is polled
+    instead (see `fallback_roots`) when watching it would exceed the budget,
+    when scheduling its watch fails, or when directories created within it
+    exceed the budget later on. The budget is per user: a process forking
+    workers hands its watches over to them (see `hand_over_watches`).
     """
 
-    def __init__(self):
-        if not ENABLE_CACHING:
-            raise RuntimeError(
-                "Please install the extra cache requirements by running 'pip "
-                "install pypiserver[cache]' to use the CachingFileBackend"
-            )
+    def __init__(
+        self,
+        poll_roots: t.Iterable[t.Union[Path, str]] = (),
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        watch_budget: t.Optional[int] = None,
+        digest_max_entries: t.Optional[int] = None,
+        digest_max_bytes: t.Optional[int] = None,
+        sweep_interval: float = DEFAULT_SWEEP_INTERVAL,
+    ):
+        self.poll_roots = frozenset(str(root) for root in poll_roots)
+        self.poll_interval = poll_interval
+        # -> key: polled root, value: its directory mtimes
+        self.pollers: t.Dict[str, PolledRoot] = {}
 
         # Cache for listdir output
-        self.listdir_cache = {}
+        # -> key: root, value: Catalog
+        self.listdir_cache: t.Dict[str, Catalog] = {}
+        # -> key: root, value: function to build the PkgFile for a path
+        self.file_fns: t.Dict[str, FileFn] = {}
 
-        # Cache for hashes: two-level dictionary
-        # -> key: hash_algo, value: dict
-        #    -> key: file path, value: hash
-        # We assume that the hash_algo value will never be erased
-        self.digest_cache = {}
+        # Cache for hashes, least recently used first
+        # -> key: (file path, hash_algo), value: hash
+        self.digest_cache: "OrderedDict[t.Tuple[str, str], str]" = OrderedDict()
+        # We assume that the hash_algo values will never be erased
+        self.digest_algos: t.Set[str] = set()
+        self.digest_bytes = 0
+        self.digest_max_entries = digest_max_entries
+        self.digest_max_bytes = digest_max_bytes
+        self.sweep_interval = sweep_interval
+        self.swept_at = time.monotonic()
+        self.sweeping = False
+        # Called with the paths whose digests are forgotten as their files
+        # changed, but not when digests are evicted
+        self.forget_callbacks: t.List[t.Callable[[t.List[str]], None]] = []
 
-        self.observer = Observer()
-        self.observer.start()
+        # Only started when something is to be watched
+        self.observer = None
 
         # Directories being watched
         self.watched = set()
+        # -> key: watched directory, value: its watchdog watch
+        self.watches = {}
+        # -> key: watched directory, value: the number of inotify watches
+        self.watch_counts: t.Dict[str, int] = {}
+        self.watch_budget = (
+            default_watch_budget() if watch_budget is None else watch_budget
+        )
+        # Watched directories that went over the budget, to be polled
+        self.overflowed: t.Set[str] = set()
+        # Directories polled because they could not be watched
+        self.fallback_roots: t.FrozenSet[str] = frozenset()
+
+        self.watch_lock = threading.Lock()
+        self.digest_lock = threading.Lock()
+        self.listdir_lock = threading.Lock()
+        _managers.add(self)
+
+    def _locks(self) -> t.Tuple[threading.Lock, ...]:
+        # In the order they may be taken together
+        return (self.watch_lock, self.listdir_lock, self.digest_lock)
 
+    def _after_fork_in_child(self):
+        """Keep the caches, but forget the watches: the observer thread did
+        not survive the fork. Roots are watched again when next listed."""
         self.watch_lock = threading.Lock()
         self.digest_lock = threading.Lock()
         self.listdir_lock = threading.Lock()
+        self.observer = None
+        self.watched = set()
+        self.watches = {}
+        self.watch_counts = {}
+        self.overflowed = set()
+        self.sweeping = False
+
+    def hand_over_watches(self, processes: int):
+        """Stop watching, for `processes` processes forked from this one to
+        watch the roots instead. The watch budget is per user, so they share
+        it evenly. Until a process watches a root again, its changes are
+        caught up with by polling, from the state it had when handed over.
+        """
+        with self.watch_lock:
+            if self.watch_budget is not None:
+                self.watch_budget //= processes
+            watched = [
+                root for root in self.watched if root in self.listdir_cache
+            ]
+            # Walked while still watched, so that nothing is missed
+            pollers = {}
+            for root in watched:
+                pollers[root] = PolledRoot(root, self.poll_interval)
+                pollers[root].walk()
+            with self.listdir_lock:
+                self.pollers.update(pollers)
+            observer, self.observer = self.observer, None
+            self.watched = set()
+            self.watches = {}
+            self.watch_counts = {}
+            self.overflowed = set()
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+    @property
+    def watch_count(self) -> int:
+        """The number of inotify watches in use: one per directory within
+        the watched directories."""
+        return sum(self.watch_counts.values())
 
     def listdir(
         self,
         root: t.Union[Path, str],
         impl_fn: t.Callable[[Path], t.Iterable["PkgFile"]],
-    ) -> t.Iterable["PkgFile"]:
+        file_fn: t.Optional[FileFn] = None,
+    ) -> Catalog:
         root = str(root)
+        # Not under the listdir_lock: event handlers take it while the
+        # observer holds its own lock, which scheduling watches needs
+        self._ensure_watched(root)
         with self.listdir_lock:
+            if file_fn is not None:
+                self.file_fns[root] = file_fn
+            poller = self.pollers.get(root)
+            if poller is not None and root in self.listdir_cache:
+                if root in self.poll_roots:
+                    changes = offload.run(poller.poll)
+                else:
+                    # Watched again since it was handed over: catch up
+                    del self.pollers[root]
+                    changes = offload.run(poller.poll, True)
+                if changes is not None:
+                    added, removed = changes
+                    self._forget_digests(added + removed)
+                    self._update_catalog(root, added, removed)
             try:
                 return self.listdir_cache[root]
             except KeyError:
-                # check to see if we're watching
-                with self.watch_lock:
-                    if root not in self.watched:
-                        self._watch(root)
+                if root in self.poll_roots:
+                    # Taken before listing, so that nothing is missed
+                    poller = PolledRoot(root, self.poll_interval)
+                    self.pollers[root] = poller
+                    offload.run(poller.walk)
 
-                v = list(impl_fn(Path(root)))
+                v = Catalog(impl_fn(Path(root)))
                 self.listdir_cache[root] = v
                 return v
 
     def digest_file(
         self, fpath: str, hash_algo: str, impl_fn: t.Callable[[str, str], str]
     ) -> str:
+        key = (fpath, hash_algo)
         with self.digest_lock:
+            self._schedule_sweep()
             try:
-                cache = self.digest_cache[hash_algo]
+                v = self.digest_cache[key]
             except KeyError:
-                cache = self.digest_cache.setdefault(hash_algo, {})
+                pass
+            else:
+                self.digest_cache.move_to_end(key)
+                return v
 
-            try:
-                return cache[fpath]
-            except KeyError:
-                root = dirname(fpath)
-                with self.watch_lock:
-                    if root not in self.watched:
-                        self._watch(root)
+        if not self._ensure_watched(dirname(fpath)):
+            # Nothing would tell when to forget it
+            return impl_fn(fpath, hash_algo)
 
+        with self.digest_lock:
             # TODO: move this outside of the lock... but there's not a good
             #       way to do this without a race condition if the file
             #       gets modified
             v = impl_fn(fpath, hash_algo)
-            cache[fpath] = v
+            self._store_digest(key, v)
             return v
 
-    def _watch(self, root: str):
+    def cached_digest(self, fpath: str, hash_algo: str) -> t.Optional[str]:
+        """Return the digest of a file if it is cached, without computing
+        it or marking it as used."""
+        with self.digest_lock:
+            return self.digest_cache.get((fpath, hash_algo))
+
+    @staticmethod
+    def _digest_size(key: t.Tuple[str, str], digest: str) -> int:
+        return (
+            sys.getsizeof(key[0])
+            + sys.getsizeof(digest)
+            + _DIGEST_ENTRY_OVERHEAD
+        )
+
+    def _store_digest(self, key: t.Tuple[str, str], digest: str):
+        # Expects the digest_lock to be held
+        cache = self.digest_cache
+        old = cache.pop(key, None)
+        if old is not None:
+            self.digest_bytes -= self._digest_size(key, old)
+        cache[key] = digest
+        self.digest_algos.add(key[1])
+        self.digest_bytes += self._digest_size(key, digest)
+
+        max_entries, max_bytes = self.digest_max_entries, self.digest_max_bytes
+        while cache and (
+            (max_entries is not None and len(cache) > max_entries)
+            or (max_bytes is not None and self.digest_bytes > max_bytes)
+        ):
+            old_key, old = cache.popitem(last=False)
+            self.digest_bytes -= self._digest_size(old_key, old)
+
+    def _schedule_sweep(self):
+        # Expects the digest_lock to be held
+        if self.sweeping:
+            return
+        now = time.monotonic()
+        if now - self.swept_at < self.sweep_interval:
+            return
+        self.swept_at = now
+        self.sweeping = True
+        threading.Thread(
+            target=self.sweep_digests, name="pypiserver-sweep", daemon=True
+        ).start()
+
+    def sweep_digests(self) -> int:
+        """Drop the digests of the files missing from the cached listings
+        of their roots, and return how many were dropped.
+
+        Digests of files outside any cached listing are left to eviction.
+        """
+        try:
+            with self.listdir_lock:
+                catalogs = list(self.listdir_cache.items())
+            with self.digest_lock:
+                keys = list(self.digest_cache)
+
+            stale = []
+            for key in keys:
+                path = key[0]
+                for root, catalog in catalogs:
+                    if path.startswith(root + os.sep):
+                        if path not in catalog:
+                            stale.append(key)
+                        break
+
+            with self.digest_lock:
+                for key in stale:
+                    digest = self.digest_cache.pop(key, None)
+                    if digest is not None:
+                        self.digest_bytes -= self._digest_size(key, digest)
+            log.debug(
+                "Swept %d stale digests; cache memory: %s",
+                len(stale),
+                self.memory_usage(),
+            )
+            return len(stale)
+        finally:
+            self.sweeping = False
+
+    def memory_usage(self) -> t.Dict[str, int]:
+        """Estimate the number of entries in, and the bytes held by, the
+        listdir and digest caches."""
+        catalogs = list(self.listdir_cache.values())
+        return {
+            "listdir_entries": sum(len(catalog) for catalog in catalogs),
+            "listdir_bytes": sum(
+                catalog.memory_usage() for catalog in catalogs
+            ),
+            "digest_entries": len(self.digest_cache),
+            "digest_bytes": self.digest_bytes,
+        }
+
+    def is_polled(self, path: str) -> bool:
+        """Whether `path` is (within) a polled root."""
+        return any(
+            path == root or path.startswith(root + os.sep)
+            for root in self.poll_roots
+        )
+
+    def _is_within_watched(self, path: str) -> bool:
+        return path in self.watched or any(
+            path.startswith(root + os.sep) for root in self.watched
+        )
+
+    def _ensure_watched(self, path: str) -> bool:
+        """Watch `path`, unless it is polled or already watched (possibly
+        through a parent), or poll it if it cannot be watched. Return
+        whether changes to it are noticed."""
+        if path in self.watched and path not in self.overflowed:
+            return True
+        if self.is_polled(path):
+            return True
+        with self.watch_lock:
+            if path in self.overflowed:
+                self._fall_back(path, "more directories than its budget")
+                return False
+            if self.is_polled(path) or self._is_within_watched(path):
+                return True
+            reason = self._watch(path)
+            if reason is None:
+                return True
+            self._fall_back(path, reason)
+            return False
+
+    def _watch(self, root: str) -> t.Optional[str]:
+        """Watch `root` recursively, or return why it cannot be watched."""
+        available = None
+        if self.watch_budget is not None:
+            available = self.watch_budget - self.watch_count
+        count = count_directories(root, limit=available)
+        if available is not None and count > available:
+            return f"it would exceed the budget of {self.watch_budget} watches"
+
+        if self.observer is None:
+            if not ENABLE_CACHING:
+                raise RuntimeError(
+                    "Please install the extra cache requirements by running "
+                    "'pip install pypiserver[cache]' to watch package "
+                    "directories, or have them polled instead"
+                )
+            self.observer = Observer()
+            self.observer.start()
+
+        handler = _EventHandler(self, root)
+        try:
+            watch = self.observer.schedule(handler, root, recursive=True)
+        except OSError as exc:
+            # The handler is registered before the watch fails to start
+            with contextlib.suppress(KeyError):
+                self.observer.remove_handler_for_watch(
+                    handler, ObservedWatch(root, recursive=True)
+                )
+            return f"scheduling its watch failed: {exc}"
         self.watched.add(root)
-        self.observer.schedule(_EventHandler(self, root), root, recursive=True)
+        self.watches[root] = watch
+        self.watch_counts[root] = count
+        return None
+
+    def _fall_back(self, root: str, reason: str):
+        # Expects the watch_lock to be held
+        log.warning("Polling %s instead of watching it: %s", root, reason)
+        watch = self.watches.pop(root, None)
+        if watch is not None:
+            self.observer.unschedule(watch)
+        self.watched.discard(root)
+        self.watch_counts.pop(root, None)
+        self.overflowed.discard(root)
+        # Replaced rather than updated, as it is read without locking
+        self.poll_roots = self.poll_roots | {root}
+        self.fallback_roots = self.fallback_roots | {root}
+        self.invalidate_root_cache(root)
+
+    def _count_new_directories(self, root: str, delta: int):
+        """Track the directories created (or deleted) within a watched root,
+        which gains (or loses) a watch for each."""
+        count = self.watch_counts.get(root)
+        if count is None:
+            return
+        self.watch_counts[root] = count + delta
+        if (
+            self.watch_budget is not None
+            and self.watch_count > self.watch_budget
+        ):
+            # Falling back needs the observer, which is busy dispatching
+            # this very event: leave it to the next listing
+            self.overflowed.add(root)
 
     def invalidate_root_cache(self, root: t.Union[Path, str]):
         with self.listdir_lock:
             self.listdir_cache.pop(str(root), None)
+            self.pollers.pop(str(root), None)
+
+    def _forget_digests(self, paths: t.Iterable[str]):
+        paths = list(paths)
+        with self.digest_lock:
+            for hash_algo in self.digest_algos:
+                for path in paths:
+                    key = (path, hash_algo)
+                    digest = self.digest_cache.pop(key, None)
+                    if digest is not None:
+                        self.digest_bytes -= self._digest_size(key, digest)
+        for callback in self.forget_callbacks:
+            callback(paths)
+
+    def update_root_cache(
+        self,
+        root: t.Union[Path, str],
+        added: t.Iterable[str] = (),
+        removed: t.Iterable[str] = (),
+    ):
+        """Apply added (or rewritten) and removed files to the cached catalog
+        of a root, rather than invalidating it."""
+        added, removed = list(added), list(removed)
+        # Digests are more expensive: invalidate specific paths
+        self._forget_digests(added + removed)
+        with self.listdir_lock:
+            self._update_catalog(str(root), added, removed)
+
+    def _update_catalog(
+        self, root: str, added: t.Iterable[str], removed: t.Iterable[str]
+    ):
+        # Expects the listdir_lock to be held
+        catalog = self.listdir_cache.get(root)
+        if catalog is None:
+            return
+        file_fn = self.file_fns.get(root)
+        if file_fn is None:
+            del self.listdir_cache[root]
+            self.pollers.pop(root, None)
+            return
+
+        new_packages = []
+        for path in added:
+            if path in catalog:
+                # Same file, new content: only its digest is stale
+                continue
+            pkg = file_fn(Path(root), path)
+            if pkg is not None:
+                new_packages.append(pkg)
+        catalog.update(added=new_packages, removed=removed)
+
+
+# All the managers, so that their caches are consistent across forks
+_managers: "weakref.WeakSet[CacheManager]" = weakref.WeakSet()
+# The managers locked for the fork in progress
+_forking: t.List[CacheManager] = []
+
+
+def _before_fork():
+    # No thread may be updating a cache while the process is forked
+    _forking[:] = list(_managers)
+    for manager in _forking:
+        for lock in manager._locks():
+            lock.acquire()
+
+
+def _after_fork_in_parent():
+    for manager in _forking:
+        for lock in reversed(manager._locks()):
+            lock.release()
+    _forking.clear()
+
+
+def _after_fork_in_child():
+    for manager in _forking:
+        manager._after_fork_in_child()
+    _forking.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(
+        before=_before_fork,
+        after_in_parent=_after_fork_in_parent,
+        after_in_child=_after_fork_in_child,
+    )
+
+
+class _DirState(t.NamedTuple):
+    mtime_ns: int
+    listed_ns: int
+    # -> key: file name, value: its size and mtime (in ns)
+    files: t.Dict[str, t.Tuple[t.Optional[int], int]]
+    subdirs: t.Tuple[str, ...]
+
+    def changed_files(self, old: "_DirState") -> t.List[str]:
+        """The names of the files that appeared since `old` was listed, or
+        whose size or mtime changed."""
+        return [
+            name
+            for name, stat in self.files.items()
+            if old.files.get(name) != stat
+        ]
+
+
+class PolledRoot:
+    """The directories of a root, along with their mtimes and contents when
+    they were last listed.
+
+    A check stats every directory, and lists again only those whose mtime
+    changed: creating, removing or renaming an entry updates the mtime of
+    its directory. Within a listed directory, only the files that appeared,
+    vanished, or changed size or mtime are reported. New subdirectories are
+    walked, and the files of vanished ones are reported as removed. Files
+    rewritten in place leave their directory untouched, so they are only
+    noticed when something else changes it.
+    """
+
+    def __init__(self, root: str, interval: float = DEFAULT_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.dirs: t.Dict[str, _DirState] = {}
+        self.checked_at = time.monotonic()
+
+    @staticmethod
+    def _list(path: str) -> t.Optional[_DirState]:
+        listed_ns = time.time_ns()
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        files, subdirs = scan_directory(path, with_stat=True)
+        return _DirState(
+            mtime_ns,
+            listed_ns,
+            {
+                file.name: (file.size, int((file.mtime or 0) * 1e9))
+                for file in files
+            },
+            tuple(subdirs),
+        )
+
+    def walk(self, path: t.Optional[str] = None) -> t.List[str]:
+        """List `path` (by default the root) and all its subdirectories,
+        returning the files found."""
+        found = []
+        pending = [self.root if path is None else path]
+        while pending:
+            path = pending.pop()
+            state = self._list(path)
+            if state is None:
+                continue
+            self.dirs[path] = state
+            found.extend(os.path.join(path, name) for name in state.files)
+            pending.extend(state.subdirs)
+        return found
+
+    def _forget(self, path: str) -> t.List[str]:
+        """Forget `path` and its subdirectories, returning their files."""
+        lost = []
+        pending = [path]
+        while pending:
+            path = pending.pop()
+            state = self.dirs.pop(path, None)
+            if state is not None:
+                lost.extend(os.path.join(path, name) for name in state.files)
+                pending.extend(state.subdirs)
+        return lost
+
+    def poll(
+        self, force: bool = False
+    ) -> t.Optional[t.Tuple[t.List[str], t.List[str]]]:
+        """Check the directories for changes, unless the last check is too
+        recent, and return the `(added, removed)` files.
+
+        Files rewritten since the last check are reported as added too.
+        """
+        now = time.monotonic()
+        if not force and now - self.checked_at < self.interval:
+            return None
+        self.checked_at = now
+        if not self.dirs:
+            return self.walk(), []
+
+        added: t.List[str] = []
+        removed: t.List[str] = []
+        for path in list(self.dirs):
+            old = self.dirs.get(path)
+            if old is None:
+                # Forgotten along with its parent
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            if mtime_ns == old.mtime_ns and (
+                old.mtime_ns < old.listed_ns - _RACY_NS
+            ):
+                continue
+            new = self._list(path)
+            if new is None:
+                removed.extend(self._forget(path))
+                continue
+            self.dirs[path] = new
+            added.extend(
+                os.path.join(path, name) for name in new.changed_files(old)
+            )
+            removed.extend(
+                os.path.join(path, name)
+                for name in old.files.keys() - new.files.keys()
+            )
+            for subdir in set(old.subdirs).difference(new.subdirs):
+                removed.extend(self._forget(subdir))
+            for subdir in set(new.subdirs).difference(old.subdirs):
+                added.extend(self.walk(subdir))
+        return added, removed
 
 
 class _EventHandler:
@@ -125,23 +687,37 @@ class _EventHandler:
         """Called by watchdog observer"""
         cache = self.cache
 
-        # Don't care about directory events
-        if event.is_directory:
+        # Files being opened, or closed without having been written, don't
+        # change anything
+        if event.event_type not in _CHANGE_EVENTS:
             return
 
-        # Lazy: just invalidate the whole cache
-        cache.invalidate_root_cache(self.root)
-
-        # Digests are more expensive: invalidate specific paths
-        paths = []
+        if event.is_directory:
+            # A whole subtree may have appeared or vanished: just invalidate
+            # the whole cache. Directory modifications are irrelevant, they
+            # are always accompanied by events for the files themselves.
+            if event.event_type == "created":
+                cache._count_new_directories(self.root, 1)
+            elif event.event_type == "deleted":
+                cache._count_new_directories(self.root, -1)
+            if event.event_type != "modified":
+                cache.invalidate_root_cache(self.root)
+            return
 
+        paths = [event.src_path]
         if event.event_type == "moved":
-            paths.append(event.src_path)
             paths.append(event.dest_path)
+
+        if event.event_type == "moved":
+            cache.update_root_cache(
+                self.root, added=paths[1:], removed=paths[:1]
+            )
+        elif event.event_type == "deleted":
+            cache.update_root_cache(self.root, removed=paths)
         else:
-            paths.append(event.src_path)
+            cache.update_root_cache(self.root, added=paths)
 
-        with cache.digest_lock:
-            for _, subcache in cache.digest_cache.items():
-                for path in paths:
-                    subcache.pop(path, None)
+
+_CHANGE_EVENTS = frozenset(
+    ("created", "deleted", "modified", "moved", "closed")
+)
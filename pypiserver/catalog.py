@@ -0,0 +1,596 @@
+"""Incrementally maintained, compact package catalogs.
+
+A `Catalog` holds the packages of one package root together with the
+aggregates the index pages need: the total count, the sorted list of
+projects, the packages of every project sorted by version, and all packages
+in listing order. The aggregates are updated as packages are added or
+removed, so serving a page does not require a pass over the whole store.
+
+To scale to millions of files, a catalog does not keep `PkgFile` objects
+around. Packages are stored as rows of array-backed columns: project names,
+versions, directories and roots are interned in tables and referenced by
+index, file names are packed into a single buffer, and the orderings are
+arrays of row numbers, sorted by integer keys derived from the ranks of the
+interned values. `PkgFile` objects are only materialized for the packages a
+request actually iterates over. See `benchmarks/bench_catalog_memory.py`.
+
+Readers never see partial updates: rows are only ever appended, and every
+ordering that changes is rebuilt as a new array under the catalog's lock and
+then swapped in, so a sequence handed out by the catalog is never modified
+afterwards.
+"""
+
+import bisect
+import os
+import sys
+import threading
+import typing as t
+from array import array
+
+from .core import PkgFile
+from .pkg_helpers import (
+    guess_pkgname_and_version,
+    normalize_pkgname,
+    parse_version,
+    version_key,
+)
+
+
+def listing_sort_key(pkg: PkgFile) -> t.Tuple[str, str, bytes]:
+    """The sort key of packages in the `/packages/` listing."""
+    return (os.path.dirname(pkg.relfn or ""), pkg.pkgname, pkg.version_key)
+
+
+def project_sort_key(pkg: PkgFile) -> t.Tuple[bytes, str]:
+    """The sort key of the packages of a project, oldest version first."""
+    return (pkg.version_key, pkg.relfn or "")
+
+
+# Above this number of rows added or removed at once, re-sorting (or
+# filtering) a whole ordering is cheaper than updating it row by row.
+_INSORT_THRESHOLD = 64
+
+# Dead rows are only dropped once there are more of them than live rows.
+_COMPACT_MIN_ROWS = 1024
+
+# The typecode of row numbers and table indexes.
+_ROW = "I"
+
+# File names are stored with their undecodable bytes, if any, preserved.
+_ENCODING = ("utf-8", "surrogateescape")
+
+
+class _Table:
+    """An append-only table of interned values.
+
+    :param derive: computes a derived value (e.g. the normalized project
+        name) that is stored along with every value.
+    :param rank_key: the sort key by which values are ranked, if they are
+        not ranked by themselves.
+    """
+
+    def __init__(
+        self,
+        derive: t.Optional[t.Callable[[t.Any], t.Any]] = None,
+        rank_key: t.Optional[t.Callable[[t.Any], t.Any]] = None,
+    ):
+        self.values: t.List[t.Any] = []
+        self.derived: t.List[t.Any] = []
+        self._ids: t.Dict[t.Any, int] = {}
+        self._derive = derive
+        self._rank_key = rank_key
+        self._ranks = array(_ROW)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def intern(self, value: t.Any, derived: t.Any = None) -> int:
+        try:
+            return self._ids[value]
+        except KeyError:
+            pass
+        if self._derive is not None:
+            self.derived.append(
+                self._derive(value) if derived is None else derived
+            )
+        idx = self._ids[value] = len(self.values)
+        self.values.append(value)
+        return idx
+
+    def memory_usage(self) -> int:
+        """Estimate the bytes held by the table (its values are not looked
+        into)."""
+        return (
+            sum(map(sys.getsizeof, self.values))
+            + sum(map(sys.getsizeof, self.derived))
+            + sys.getsizeof(self.values)
+            + sys.getsizeof(self.derived)
+            + sys.getsizeof(self._ids)
+            + sys.getsizeof(self._ranks)
+        )
+
+    def ranks(self) -> array:
+        """Return the rank of every value in sort order. Values with equal
+        sort keys share the same rank."""
+        if len(self._ranks) != len(self.values):
+            keys = self.values
+            if self._rank_key is not None:
+                keys = list(map(self._rank_key, keys))
+            ranks = array(_ROW, [0]) * len(keys)
+            rank = -1
+            previous: t.Any = None
+            for idx in sorted(range(len(keys)), key=keys.__getitem__):
+                if rank < 0 or keys[idx] != previous:
+                    rank += 1
+                    previous = keys[idx]
+                ranks[idx] = rank
+            self._ranks = ranks
+        return self._ranks
+
+
+class _Columns:
+    """The rows of a catalog: one entry per row in every column."""
+
+    __slots__ = (
+        "root",
+        "dir",
+        "name",
+        "version",
+        "digester",
+        "files",
+        "file_ends",
+        "irregular",
+    )
+
+    def __init__(self) -> None:
+        self.root = array(_ROW)
+        self.dir = array(_ROW)
+        self.name = array(_ROW)
+        self.version = array(_ROW)
+        self.digester = array(_ROW)
+        # The file names, encoded back to back, and where each one ends
+        self.files = bytearray()
+        self.file_ends = array("Q")
+        # Packages that cannot be rebuilt from their columns are kept as
+        # they are (see `Catalog._split`)
+        self.irregular: t.Dict[int, PkgFile] = {}
+
+    def __len__(self) -> int:
+        return len(self.file_ends)
+
+
+class _State:
+    """The rows and orderings of a catalog.
+
+    The orderings are only ever replaced by new arrays, and the rows are
+    only ever appended, so readers may keep using a state while it is being
+    updated. Dropping dead rows renumbers them, which creates a new state.
+    """
+
+    __slots__ = ("cols", "listing", "by_project", "projects", "paths")
+
+    def __init__(self, cols: _Columns) -> None:
+        self.cols = cols
+        # All rows in listing order
+        self.listing = array(_ROW)
+        # -> key: normalized project name, value: rows in project order
+        self.by_project: t.Dict[str, array] = {}
+        # The sorted normalized project names
+        self.projects: t.List[str] = []
+        # The paths of the irregular rows, which cannot be found by name
+        self.paths: t.Dict[t.Optional[str], int] = {}
+
+
+class PackageSequence(t.Sequence[PkgFile]):
+    """A read-only sequence of packages of a catalog, materialized on
+    access."""
+
+    __slots__ = ("_catalog", "_cols", "_rows")
+
+    def __init__(self, catalog: "Catalog", cols: _Columns, rows: array):
+        self._catalog = catalog
+        self._cols = cols
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @t.overload
+    def __getitem__(self, index: int) -> PkgFile: ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> "PackageSequence": ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return PackageSequence(self._catalog, self._cols, self._rows[index])
+        return self._catalog._package(self._cols, self._rows[index])
+
+    def __iter__(self) -> t.Iterator[PkgFile]:
+        package, cols = self._catalog._package, self._cols
+        for row in self._rows:
+            yield package(cols, row)
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} of {len(self)} packages>"
+
+
+class Catalog:
+    """The packages of a package root, with incrementally maintained
+    aggregates.
+
+    Packages are identified by their full path (`PkgFile.fn`): adding a
+    package with the path of an existing one replaces it.
+    """
+
+    def __init__(self, packages: t.Iterable[PkgFile] = ()):
+        self._lock = threading.Lock()
+        self._roots = _Table()
+        self._dirs = _Table()
+        self._names = _Table(normalize_pkgname)
+        self._versions = _Table(parse_version, rank_key=version_key)
+        self._digesters = _Table()
+        self._state = _State(_Columns())
+        self._dead = 0
+        # Incremented on every change, so that views derived from several
+        # catalogs can tell whether they are still up-to-date
+        self.generation = 0
+
+        self.update(added=packages)
+        self.generation = 0
+
+    def __iter__(self) -> t.Iterator[PkgFile]:
+        return iter(self.sorted_packages())
+
+    def memory_usage(self) -> int:
+        """Estimate the bytes held by the catalog: its columns, orderings
+        and tables."""
+        with self._lock:
+            state = self._state
+            cols = state.cols
+            size = sum(
+                map(
+                    sys.getsizeof,
+                    (
+                        cols.root,
+                        cols.dir,
+                        cols.name,
+                        cols.version,
+                        cols.digester,
+                        cols.files,
+                        cols.file_ends,
+                        cols.irregular,
+                        state.listing,
+                        state.by_project,
+                        state.projects,
+                        state.paths,
+                    ),
+                )
+            )
+            size += sum(map(sys.getsizeof, state.by_project.values()))
+            for pkg in cols.irregular.values():
+                size += sys.getsizeof(pkg) + sum(
+                    sys.getsizeof(getattr(pkg, attr, None))
+                    for attr in ("pkgname", "version", "fn", "root", "relfn")
+                )
+            return size + sum(
+                table.memory_usage()
+                for table in (
+                    self._roots,
+                    self._dirs,
+                    self._names,
+                    self._versions,
+                    self._digesters,
+                )
+            )
+
+    def __len__(self) -> int:
+        return len(self._state.listing)
+
+    def __contains__(self, path: object) -> bool:
+        return (
+            isinstance(path, str)
+            and self._find_row(self._state, path) is not None
+        )
+
+    def get(self, path: str) -> t.Optional[PkgFile]:
+        """Return the package with the given full path, if any."""
+        state = self._state
+        row = self._find_row(state, path)
+        return None if row is None else self._package(state.cols, row)
+
+    def sorted_packages(self) -> t.Sequence[PkgFile]:
+        """Return all packages in listing order (see `listing_sort_key`)."""
+        state = self._state
+        return PackageSequence(self, state.cols, state.listing)
+
+    def projects(self) -> t.Sequence[str]:
+        """Return the sorted normalized names of all projects."""
+        return self._state.projects
+
+    def find_project(self, project_norm: str) -> t.Sequence[PkgFile]:
+        """Return the packages of a project, sorted by `project_sort_key`.
+
+        :param project_norm: the PEP503-normalized project name
+        """
+        state = self._state
+        rows = state.by_project.get(project_norm)
+        if rows is None:
+            return ()
+        return PackageSequence(self, state.cols, rows)
+
+    def add(self, pkg: PkgFile) -> None:
+        self.update(added=(pkg,))
+
+    def remove(self, path: str) -> None:
+        self.update(removed=(path,))
+
+    def update(
+        self,
+        added: t.Iterable[PkgFile] = (),
+        removed: t.Iterable[str] = (),
+    ) -> None:
+        """Add and remove packages (identified by path) in a single step.
+
+        The packages in `added` are expected to have distinct paths.
+        """
+        with self._lock:
+            state = self._state
+            cols = state.cols
+            old_rows: t.Set[int] = set()
+            for path in removed:
+                row = self._find_row(state, path)
+                if row is not None:
+                    old_rows.add(row)
+            new_rows = []
+            for pkg in added:
+                if state.listing and pkg.fn is not None:
+                    row = self._find_row(state, pkg.fn)
+                    if row is not None:
+                        old_rows.add(row)
+                new_rows.append(self._append(state, pkg))
+            if not old_rows and not new_rows:
+                return
+
+            for row in old_rows:
+                pkg = cols.irregular.get(row)  # type: ignore
+                if pkg is not None and state.paths.get(pkg.fn) == row:
+                    del state.paths[pkg.fn]
+
+            state.listing = self._rebuilt(
+                state.listing, old_rows, new_rows, self._listing_key(cols)
+            )
+
+            names, name_col = self._names.derived, cols.name
+            changes: t.Dict[str, t.Tuple[t.Set[int], t.List[int]]] = {}
+            for row in old_rows:
+                changes.setdefault(names[name_col[row]], (set(), []))[0].add(
+                    row
+                )
+            for row in new_rows:
+                changes.setdefault(names[name_col[row]], (set(), []))[1].append(
+                    row
+                )
+
+            project_key = self._project_key(cols)
+            new_projects: t.List[str] = []
+            gone_projects: t.Set[str] = set()
+            for name, (old, new) in changes.items():
+                rows = self._rebuilt(
+                    state.by_project.get(name, array(_ROW)),
+                    old,
+                    new,
+                    project_key,
+                )
+                if rows:
+                    if name not in state.by_project:
+                        new_projects.append(name)
+                    state.by_project[name] = rows
+                elif state.by_project.pop(name, None) is not None:
+                    gone_projects.add(name)
+            if new_projects or gone_projects:
+                projects = [p for p in state.projects if p not in gone_projects]
+                for name in new_projects:
+                    bisect.insort(projects, name)
+                state.projects = projects
+
+            self._dead += len(old_rows)
+            if self._dead > max(len(state.listing), _COMPACT_MIN_ROWS):
+                self._compact()
+
+            self.generation += 1
+
+    def _append(self, state: _State, pkg: PkgFile) -> int:
+        """Append a package to the columns and return its row number."""
+        cols = state.cols
+        row = len(cols)
+        split = self._split(pkg)
+        if split is None:
+            cols.irregular[row] = pkg
+            state.paths[pkg.fn] = row
+            root, dirname = pkg.root, os.path.dirname(pkg.relfn or "")
+            filename = b""
+        else:
+            root, dirname, filename = split
+
+        cols.root.append(self._roots.intern(root))
+        cols.dir.append(self._dirs.intern(dirname))
+        cols.name.append(self._names.intern(pkg.pkgname, pkg.pkgname_norm))
+        cols.version.append(
+            self._versions.intern(pkg.version, pkg.parsed_version)
+        )
+        cols.digester.append(self._digesters.intern(pkg.digester))
+        cols.files += filename
+        cols.file_ends.append(len(cols.files))
+        return row
+
+    @staticmethod
+    def _split(pkg: PkgFile) -> t.Optional[t.Tuple[str, str, bytes]]:
+        """Split a package into its root, directory and encoded file name,
+        or return None if it could not be rebuilt from them, or found by
+        its path.
+        """
+        fn, root, relfn = pkg.fn, pkg.root, pkg.relfn
+        if fn is None or root is None or relfn is None:
+            return None
+        if pkg.replaces is not None or pkg.digest is not None:
+            return None
+        dirname, filename = os.path.split(relfn)
+        if os.path.join(dirname, filename) != relfn:
+            return None
+        if fn != f"{root}{os.sep}{relfn}":
+            return None
+        guessed = guess_pkgname_and_version(filename)
+        if guessed is None or normalize_pkgname(guessed[0]) != pkg.pkgname_norm:
+            return None
+        try:
+            return root, dirname, filename.encode(*_ENCODING)
+        except UnicodeEncodeError:
+            return None
+
+    @staticmethod
+    def _filename(cols: _Columns, row: int) -> str:
+        start = cols.file_ends[row - 1] if row else 0
+        return cols.files[start : cols.file_ends[row]].decode(*_ENCODING)
+
+    def _relfn(self, cols: _Columns, row: int) -> str:
+        pkg = cols.irregular.get(row)
+        if pkg is not None:
+            return pkg.relfn or ""
+        return os.path.join(
+            self._dirs.values[cols.dir[row]], self._filename(cols, row)
+        )
+
+    def _package(self, cols: _Columns, row: int) -> PkgFile:
+        """Materialize the package of a row."""
+        pkg = cols.irregular.get(row)
+        if pkg is not None:
+            return pkg
+
+        relfn = os.path.join(
+            self._dirs.values[cols.dir[row]], self._filename(cols, row)
+        )
+        root = self._roots.values[cols.root[row]]
+        name, version = cols.name[row], cols.version[row]
+        # Bypass `PkgFile.__init__`, all derived values are known already
+        pkg = PkgFile.__new__(PkgFile)
+        pkg.pkgname = self._names.values[name]
+        pkg.pkgname_norm = self._names.derived[name]
+        pkg.version = self._versions.values[version]
+        pkg.parsed_version = self._versions.derived[version]
+        pkg.fn = f"{root}{os.sep}{relfn}"
+        pkg.root = root
+        pkg.relfn = relfn
+        pkg.relfn_unix = relfn.replace("\\", "/")
+        pkg.replaces = None
+        pkg.digest = None
+        pkg.digester = self._digesters.values[cols.digester[row]]
+        return pkg
+
+    def _find_row(self, state: _State, path: str) -> t.Optional[int]:
+        row = state.paths.get(path)
+        if row is not None:
+            return row
+        # Regular rows are found among the rows of their project
+        filename = os.path.basename(path)
+        guessed = guess_pkgname_and_version(filename)
+        if guessed is None:
+            return None
+        cols = state.cols
+        for row in state.by_project.get(normalize_pkgname(guessed[0]), ()):
+            if (
+                row not in cols.irregular
+                and self._filename(cols, row) == filename
+                and f"{self._roots.values[cols.root[row]]}{os.sep}"
+                f"{self._relfn(cols, row)}"
+                == path
+            ):
+                return row
+        return None
+
+    def _listing_key(self, cols: _Columns) -> t.Callable[[int], int]:
+        """Return the sort key of rows in listing order, which packs the
+        ranks of their directory, project name and version in one int."""
+        dir_ranks = self._dirs.ranks()
+        name_ranks = self._names.ranks()
+        version_ranks = self._versions.ranks()
+        version_bits = len(version_ranks).bit_length()
+        name_bits = len(name_ranks).bit_length() + version_bits
+        dir_col, name_col, version_col = cols.dir, cols.name, cols.version
+
+        def key(row: int) -> int:
+            return (
+                dir_ranks[dir_col[row]] << name_bits
+                | name_ranks[name_col[row]] << version_bits
+                | version_ranks[version_col[row]]
+            )
+
+        return key
+
+    def _project_key(self, cols: _Columns) -> t.Callable[[int], tuple]:
+        version_ranks = self._versions.ranks()
+        version_col, relfn = cols.version, self._relfn
+
+        def key(row: int) -> tuple:
+            return (version_ranks[version_col[row]], relfn(cols, row))
+
+        return key
+
+    @staticmethod
+    def _rebuilt(
+        rows: array,
+        old_rows: t.Set[int],
+        new_rows: t.List[int],
+        key: t.Callable[[int], t.Any],
+    ) -> array:
+        """Return a sorted copy of `rows`, without `old_rows` and with
+        `new_rows`."""
+        if len(old_rows) > _INSORT_THRESHOLD:
+            rebuilt = array(_ROW, [row for row in rows if row not in old_rows])
+        else:
+            rebuilt = rows[:]
+            for row in old_rows:
+                idx = bisect.bisect_left(rebuilt, key(row), key=key)
+                while idx < len(rebuilt) and rebuilt[idx] != row:
+                    idx += 1
+                if idx < len(rebuilt):
+                    del rebuilt[idx]
+        if len(new_rows) > _INSORT_THRESHOLD:
+            rebuilt.extend(new_rows)
+            rebuilt = array(_ROW, sorted(rebuilt, key=key))
+        else:
+            for row in new_rows:
+                bisect.insort(rebuilt, row, key=key)
+        return rebuilt
+
+    def _compact(self) -> None:
+        """Drop the dead rows, in a new state."""
+        state = self._state
+        old, cols = state.cols, _Columns()
+        renumbered: t.Dict[int, int] = {}
+        for row in sorted(state.listing):
+            renumbered[row] = new_row = len(cols)
+            cols.root.append(old.root[row])
+            cols.dir.append(old.dir[row])
+            cols.name.append(old.name[row])
+            cols.version.append(old.version[row])
+            cols.digester.append(old.digester[row])
+            start = old.file_ends[row - 1] if row else 0
+            cols.files += old.files[start : old.file_ends[row]]
+            cols.file_ends.append(len(cols.files))
+            if row in old.irregular:
+                cols.irregular[new_row] = old.irregular[row]
+
+        renumber = renumbered.__getitem__
+        new_state = _State(cols)
+        new_state.listing = array(_ROW, map(renumber, state.listing))
+        new_state.by_project = {
+            name: array(_ROW, map(renumber, rows))
+            for name, rows in state.by_project.items()
+        }
+        new_state.projects = state.projects
+        new_state.paths = {
+            path: renumber(row) for path, row in state.paths.items()
+        }
+        self._state = new_state
+        self._dead = 0
@@ -0,0 +1,172 @@
+"""Content-encoding negotiation for index and JSON responses.
+
+Rendered pages are compressed at most once per distinct body: compressed
+variants are kept in a small LRU cache keyed by a digest of the uncompressed
+body, so that repeated requests for an unchanged index page are served
+without re-compressing it.
+
+Brotli is only offered when the optional `brotli` package is installed.
+"""
+
+import gzip
+import hashlib
+import threading
+import typing as t
+import zlib
+from collections import OrderedDict
+
+# The `brotli` requirement is optional, so we need to verify its import here.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Encodings we are able to produce, in order of preference.
+SUPPORTED_ENCODINGS: t.Tuple[str, ...] = (
+    ("br", "gzip") if brotli is not None else ("gzip",)
+)
+
+
+def parse_accept_encoding(header: t.Optional[str]) -> t.Dict[str, float]:
+    """Parse an `Accept-Encoding` header into a mapping of coding -> qvalue."""
+    accepted: t.Dict[str, float] = {}
+    if not header:
+        return accepted
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        qvalue = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    qvalue = float(value)
+                except ValueError:
+                    qvalue = 0.0
+        accepted[coding] = qvalue
+    return accepted
+
+
+def choose_encoding(header: t.Optional[str]) -> t.Optional[str]:
+    """Return the preferred supported encoding for the given header, if any."""
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*", 0.0)
+    best: t.Optional[str] = None
+    best_q = 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        qvalue = accepted.get(coding, wildcard)
+        if qvalue > best_q:
+            best, best_q = coding, qvalue
+    return best
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compress `data` with the given content-coding."""
+    if encoding == "gzip":
+        # A fixed mtime keeps the output deterministic for identical bodies
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(data, quality=level)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def compress_stream(
+    chunks: t.Iterable[bytes], encoding: str, level: int
+) -> t.Iterator[bytes]:
+    """Lazily compress a stream of chunks with the given content-coding."""
+    if encoding == "gzip":
+        # wbits=31 selects the gzip container (with a zeroed mtime)
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    elif encoding == "br" and brotli is not None:
+        compressor = brotli.Compressor(quality=level)
+        process, finish = compressor.process, compressor.finish
+    else:
+        raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class ResponseCompressor:
+    """Negotiate and cache compressed variants of rendered pages.
+
+    :param level: the compression level (1-9). A level of 0 disables
+        compression altogether.
+    :param min_size: bodies smaller than this many bytes are always sent
+        uncompressed, since the savings would not pay for the overhead.
+    :param max_entries: the maximum number of distinct pages for which
+        compressed variants are kept.
+    """
+
+    def __init__(self, level: int, min_size: int, max_entries: int = 64):
+        self.level = level
+        self.min_size = min_size
+        self.max_entries = max_entries
+        # key: digest of the uncompressed body
+        #   -> value: dict of content-coding -> compressed body
+        self._variants: "OrderedDict[bytes, t.Dict[str, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.level > 0
+
+    def encode(
+        self, body: bytes, accept_encoding: t.Optional[str]
+    ) -> t.Tuple[bytes, t.Optional[str]]:
+        """Return the body to send and its content-coding (None if identity)."""
+        if not self.enabled or len(body) < self.min_size:
+            return body, None
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            return body, None
+        return self._get_variant(body, encoding), encoding
+
+    def encode_stream(
+        self, chunks: t.Iterable[bytes], accept_encoding: t.Optional[str]
+    ) -> t.Tuple[t.Iterable[bytes], t.Optional[str]]:
+        """Like `encode`, but for bodies that are streamed in chunks.
+
+        Streamed bodies are compressed on the fly: their size is not known
+        upfront, and they are not cached.
+        """
+        if not self.enabled:
+            return chunks, None
+        encoding = choose_encoding(accept_encoding)
+        if encoding is None:
+            return chunks, None
+        return compress_stream(chunks, encoding, self.level), encoding
+
+    def _get_variant(self, body: bytes, encoding: str) -> bytes:
+        key = hashlib.blake2b(body, digest_size=16).digest()
+        with self._lock:
+            variants = self._variants.get(key)
+            if variants is not None:
+                self._variants.move_to_end(key)
+                try:
+                    return variants[encoding]
+                except KeyError:
+                    pass
+
+        # Compress outside of the lock, since it may take a while for large
+        # pages. Concurrent requests for the same page may compress it twice,
+        # which is harmless.
+        compressed = compress(body, encoding, self.level)
+
+        with self._lock:
+            variants = self._variants.setdefault(key, {})
+            variants[encoding] = compressed
+            self._variants.move_to_end(key)
+            while len(self._variants) > self.max_entries:
+                self._variants.popitem(last=False)
+        return compressed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._variants.clear()
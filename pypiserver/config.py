@@ -5,14 +5,20 @@ the current config logic, but has not yet been integrated.
 
 To add a config option:
 
-- If it should be available for all subcommands (run, update), add it to
-  the `add_common_args()` function
+- If it should be available for all subcommands (run, update, migrate), add
+  it to the `add_common_args()` function
 - If it should only be available for the `run` command, add it to the
   `run_parser` in the `get_parser()` function.
 - If it should only be available for the `update` command, add it to the
   `update_parser` in the `get_parser() function`.
+- If it should only be available for the `migrate` command, add it to the
+  `migrate_parser` in the `get_parser() function`.
+- If it should only be available for the `token` command, add it to the
+  `token_parser` in the `get_parser() function`.
 - Add it to the appropriate Config class, `_ConfigCommon` for global options,
-  `RunConfig` for `run` options, and `UpdateConfig` for `update` options.
+  `RunConfig` for `run` options, `UpdateConfig` for `update` options,
+  `MigrateConfig` for `migrate` options, and `TokenConfig` for `token`
+  options.
   - This requires adding it as an `__init__()` kwarg, setting it as an instance
     attribute in `__init__()`, and ensuring it will be parsed from the argparse
     namespace in the `kwargs_from_namespace()` method
@@ -26,7 +32,7 @@ it, but from `_ConfigCommon`. The `Config` provides the following constructors:
   specified overrides
 - `from_args(args: Optional[Sequence[str]])`: construct a config from the
   provided arguments. Depending on arguments, the config will be either a
-  `RunConfig` or an `UpdateConfig`
+  `RunConfig`, an `UpdateConfig`, a `MigrateConfig` or a `TokenConfig`
 
 Legacy commandline arguments did not require a subcommand. This form is
 still supported, but deprecated. A warning is printing to stderr if
@@ -72,6 +78,16 @@ from pypiserver.backend import (
     SimpleFileBackend,
     get_file_backend,
 )
+from pypiserver.credentials import CredentialCache, HtpasswdAuther
+from pypiserver.layout import LAYOUTS, get_layout
+from pypiserver.proxy import Proxy
+from pypiserver.tokens import (
+    ACTIONS,
+    TOKEN_USER,
+    TokenSigner,
+    URLSigner,
+    load_key,
+)
 
 # The `passlib` requirement is optional, so we need to verify its import here.
 try:
@@ -111,17 +127,49 @@ class DEFAULTS:
     """Config defaults."""
 
     AUTHENTICATE = ["update"]
+    BACKLOG = 128
+    BLOB_STORE = None
+    AUTH_CACHE_SIZE = 1024
+    AUTH_CACHE_TTL = 300.0
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_MIN_SIZE = 1024
+    DIGEST_CACHE_BYTES = 256 * 2**20
+    DIGEST_CACHE_ENTRIES = None
     FALLBACK_URL = "https://pypi.org/simple/"
+    GRACEFUL_TIMEOUT = 30.0
     HEALTH_ENDPOINT = "/health"
     HASH_ALGO = "sha256"
+    INDEX_URL = "https://pypi.org/simple/"
     INTERFACE = "0.0.0.0"
+    KEEPALIVE_TIMEOUT = 5.0
+    LAYOUT = "flat"
     LOG_FRMT = "%(asctime)s|%(name)s|%(levelname)s|%(thread)d|%(message)s"
     LOG_ERR_FRMT = "%(body)s: %(exception)s \n%(traceback)s"
     LOG_REQ_FRMT = "%(bottle.request)s"
     LOG_RES_FRMT = "%(status)s"
     LOG_STREAM = sys.stdout
+    MIGRATE_WORKERS = 8
+    # gevent's own default, 10
+    OFFLOAD_THREADS = None
     PACKAGE_DIRECTORIES = [pathlib.Path("~/packages").expanduser().resolve()]
+    POLL_INTERVAL = 5.0
     PORT = 8080
+    SCAN_WORKERS = 1
+    PROXY_CACHE = None
+    PROXY_INDEX_TTL = 600.0
+    PROXY_NEGATIVE_TTL = 60.0
+    SIGNED_URLS = None
+    SNAPSHOT = None
+    TOKEN_ACTIONS = ["download", "list"]
+    TOKEN_KEY = None
+    THREADS = 16
+    TIMEOUT = 60.0
+    UPDATE_CACHE = None
+    UPDATE_TIMEOUT = 30.0
+    UPDATE_WORKERS = 8
+    # The system limit of inotify watches, if any
+    WATCH_BUDGET = None
+    WORKERS = 1
     SERVER_METHOD = "auto"
     BACKEND = "auto"
     SERVER_BASE_URL = (
@@ -187,6 +235,20 @@ def health_endpoint_arg(arg: str) -> str:
     )
 
 
+def compression_level_arg(arg: str) -> int:
+    """Parse the compression level, which must be in the 0-9 range."""
+    try:
+        level = int(arg)
+    except ValueError:
+        level = -1
+    if not 0 <= level <= 9:
+        raise argparse.ArgumentTypeError(
+            f"Invalid compression level '{arg}'. Please select a level "
+            "between 1 (fastest) and 9 (smallest), or 0 to disable compression."
+        )
+    return level
+
+
 def html_file_arg(arg: t.Optional[str]) -> str:
     """Parse the provided HTML file and return its contents."""
     if arg is None or arg == "pypiserver/welcome.html":
@@ -231,6 +293,11 @@ def package_directory_arg(arg: str) -> pathlib.Path:
     return pkg_dir
 
 
+def path_arg(arg: str) -> pathlib.Path:
+    """Convert a path argument into its absolute path."""
+    return pathlib.Path(arg).expanduser().resolve()
+
+
 # We need to capture this at compile time, because we replace sys.stderr
 # during config parsing in order to better control error output when we
 # encounter legacy cmdline arguments.
@@ -255,6 +322,131 @@ def log_stream_arg(arg: str) -> t.Optional[t.IO]:
     )
 
 
+def _int_at_least(minimum: int, what: str) -> t.Callable[[str], int]:
+    """Make a parser of integer arguments of at least `minimum`, naming the
+    argument `what` in its error message."""
+
+    def parse(arg: str) -> int:
+        try:
+            value = int(arg)
+        except ValueError:
+            value = minimum - 1
+        if value < minimum:
+            raise argparse.ArgumentTypeError(
+                f"Invalid {what} '{arg}'. Please select at least {minimum}."
+            )
+        return value
+
+    return parse
+
+
+scan_workers_arg = _int_at_least(1, "number of scan workers")
+server_workers_arg = _int_at_least(1, "number of server workers")
+threads_arg = _int_at_least(1, "number of threads")
+backlog_arg = _int_at_least(1, "listen backlog")
+
+
+def timeout_arg(arg: str) -> float:
+    """Parse a timeout, a non-negative number of seconds."""
+    try:
+        timeout = float(arg)
+    except ValueError:
+        timeout = -1.0
+    if not 0 <= timeout < float("inf"):
+        raise argparse.ArgumentTypeError(
+            f"Invalid timeout '{arg}'. Please select a non-negative number "
+            "of seconds."
+        )
+    return timeout
+
+
+def poll_interval_arg(arg: str) -> float:
+    """Parse the polling interval, a non-negative number of seconds."""
+    try:
+        interval = float(arg)
+    except ValueError:
+        interval = -1.0
+    if not 0 <= interval < float("inf"):
+        raise argparse.ArgumentTypeError(
+            f"Invalid poll interval '{arg}'. Please select a number of "
+            "seconds, or 0 to check on every request."
+        )
+    return interval
+
+
+def watch_budget_arg(arg: str) -> int:
+    """Parse the watch budget, a non-negative number of watches."""
+    try:
+        budget = int(arg)
+    except ValueError:
+        budget = -1
+    if budget < 0:
+        raise argparse.ArgumentTypeError(
+            f"Invalid watch budget '{arg}'. Please select a number of "
+            "watches, or 0 to poll all package directories."
+        )
+    return budget
+
+
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30}
+
+
+def token_actions_arg(arg: str) -> t.List[str]:
+    """Parse the comma-separated actions a token allows."""
+    actions = sorted(set(i.strip().lower() for i in arg.split(",")))
+    if not actions or any(i not in ACTIONS for i in actions):
+        raise argparse.ArgumentTypeError(
+            f"Invalid token actions '{arg}'. Valid values are "
+            f"{', '.join(ACTIONS)}."
+        )
+    return actions
+
+
+_DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def duration_arg(arg: str) -> float:
+    """Parse a positive duration in seconds, with an optional s, m, h or d
+    unit."""
+    number, unit = arg[:-1], arg[-1:].lower()
+    if unit not in _DURATION_UNITS:
+        number, unit = arg, ""
+    try:
+        duration = float(number) * _DURATION_UNITS[unit]
+    except ValueError:
+        duration = 0.0
+    if not 0 < duration < float("inf"):
+        raise argparse.ArgumentTypeError(
+            f"Invalid duration '{arg}'. Please select a positive number of "
+            "seconds, optionally followed by s, m, h or d (e.g. 90d)."
+        )
+    return duration
+
+
+auth_cache_size_arg = _int_at_least(1, "credential cache size")
+
+
+def digest_cache_bytes_arg(arg: str) -> int:
+    """Parse a positive number of bytes, with an optional K, M or G
+    (binary) unit."""
+    number, unit = arg[:-1], arg[-1:].upper()
+    if unit not in _SIZE_UNITS:
+        number, unit = arg, ""
+    try:
+        size = int(number) * _SIZE_UNITS[unit]
+    except ValueError:
+        size = 0
+    if size < 1:
+        raise argparse.ArgumentTypeError(
+            f"Invalid digest cache size '{arg}'. Please select a number of "
+            "bytes, optionally followed by K, M or G (e.g. 256M)."
+        )
+    return size
+
+
+digest_cache_entries_arg = _int_at_least(1, "number of digest cache entries")
+
+
 def add_common_args(parser: argparse.ArgumentParser) -> None:
     """Add common arguments to a parser."""
     # Don't update at top-level to avoid circular imports in __init__
@@ -316,6 +508,124 @@ def add_common_args(parser: argparse.ArgumentParser) -> None:
         ),
     )
 
+    parser.add_argument(
+        "--layout",
+        default=DEFAULTS.LAYOUT,
+        choices=tuple(LAYOUTS),
+        help=(
+            "How packages are laid out within the package directories: "
+            "anywhere ('flat', uploads go to the first directory itself), "
+            "in a directory per project ('project'), or in a directory per "
+            "project within two levels of hash-prefix directories "
+            "('sharded'). With the latter two, looking a project up only "
+            f"lists its directory (default: {DEFAULTS.LAYOUT})."
+        ),
+    )
+
+    parser.add_argument(
+        "--blob-store",
+        metavar="DIR",
+        default=DEFAULTS.BLOB_STORE,
+        type=path_arg,
+        help=(
+            "Store each distinct package content once in this directory, "
+            "named after its digest, and hard link the package files to it. "
+            "Uploads of content already stored are deduplicated, and the "
+            "digests of linked packages are not computed. It should be on "
+            "the file system of the package directories, e.g. a hidden "
+            "'.blobs' directory within the first one. With 'migrate "
+            "--execute', existing packages are deduplicated into it."
+        ),
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        default=DEFAULTS.SNAPSHOT,
+        type=path_arg,
+        help=(
+            "Share the package catalog between the worker processes of a "
+            "pre-fork server through this snapshot file: one process scans "
+            "and watches the package directories and publishes the "
+            "snapshot, which the others memory-map read-only. They check "
+            "for a new one every --poll-interval seconds."
+        ),
+    )
+
+    parser.add_argument(
+        "--scan-workers",
+        metavar="N",
+        default=DEFAULTS.SCAN_WORKERS,
+        type=scan_workers_arg,
+        help=(
+            "The number of threads listing the package directories, and the "
+            "top-level subdirectories within them, in parallel. Worth raising "
+            "for large trees on network or other high-latency storage "
+            f"(default: {DEFAULTS.SCAN_WORKERS})."
+        ),
+    )
+
+    parser.add_argument(
+        "--poll-root",
+        metavar="PACKAGE_DIRECTORY",
+        action="append",
+        default=[],
+        dest="poll_roots",
+        type=package_directory_arg,
+        help=(
+            "Notice the changes to this package directory by polling the "
+            "mtimes of its directories, instead of watching for filesystem "
+            "events. Needed on network file systems, where events are not "
+            "seen for changes made by other clients. Can be repeated. When "
+            "all package directories are polled, the 'cached-dir' backend "
+            "works without the watchdog package."
+        ),
+    )
+    parser.add_argument(
+        "--poll-interval",
+        metavar="SECONDS",
+        default=DEFAULTS.POLL_INTERVAL,
+        type=poll_interval_arg,
+        help=(
+            "The minimum time between two checks of a polled package "
+            f"directory (default: {DEFAULTS.POLL_INTERVAL:g})."
+        ),
+    )
+    parser.add_argument(
+        "--watch-budget",
+        metavar="N",
+        default=DEFAULTS.WATCH_BUDGET,
+        type=watch_budget_arg,
+        help=(
+            "The maximum number of inotify watches (one per directory) to "
+            "use for watching package directories. Directories that would "
+            "go over it, or fail to be watched, are polled instead. Defaults "
+            "to the system limit; 0 polls all package directories."
+        ),
+    )
+
+    parser.add_argument(
+        "--digest-cache-bytes",
+        metavar="SIZE",
+        default=DEFAULTS.DIGEST_CACHE_BYTES,
+        type=digest_cache_bytes_arg,
+        help=(
+            "The estimated memory the cached digests may take, in bytes, "
+            "optionally followed by K, M or G (default: 256M). The least "
+            "recently used digests are evicted past it."
+        ),
+    )
+    parser.add_argument(
+        "--digest-cache-entries",
+        metavar="N",
+        default=DEFAULTS.DIGEST_CACHE_ENTRIES,
+        type=digest_cache_entries_arg,
+        help=(
+            "The number of digests that may be cached. The least recently "
+            "used digests are evicted past it (default: no limit)."
+        ),
+    )
+
     parser.add_argument(
         "--version",
         action="version",
@@ -417,6 +727,53 @@ def get_parser() -> argparse.ArgumentParser:
             "\n\n"
         ),
     )
+    run_parser.add_argument(
+        "--auth-cache-ttl",
+        metavar="SECONDS",
+        default=DEFAULTS.AUTH_CACHE_TTL,
+        type=timeout_arg,
+        help=(
+            "Remember the credentials checked against the password file for "
+            "SECONDS, or 0 to check them on every request "
+            f"(default: {DEFAULTS.AUTH_CACHE_TTL:g}). They are forgotten "
+            "as soon as the password file changes."
+        ),
+    )
+    run_parser.add_argument(
+        "--auth-cache-size",
+        metavar="N",
+        default=DEFAULTS.AUTH_CACHE_SIZE,
+        type=auth_cache_size_arg,
+        help=(
+            "Remember up to N credentials, evicting the least recently used "
+            f"past it (default: {DEFAULTS.AUTH_CACHE_SIZE})."
+        ),
+    )
+    run_parser.add_argument(
+        "--token-key",
+        metavar="KEY_FILE",
+        default=DEFAULTS.TOKEN_KEY,
+        type=path_arg,
+        help=(
+            "Also accept the API tokens signed with the key in KEY_FILE, "
+            "sent as the password of the `__token__` user, for the actions "
+            "of `--authenticate` they allow. See the `token` command for "
+            "issuing them."
+        ),
+    )
+    run_parser.add_argument(
+        "--signed-urls",
+        metavar="DURATION",
+        default=DEFAULTS.SIGNED_URLS,
+        type=duration_arg,
+        help=(
+            "When downloads are authenticated, sign the package links of "
+            "the /simple/<project>/ pages with the key of `--token-key`, so "
+            "that they may be downloaded without credentials, and stored by "
+            "shared caches, for DURATION seconds (up to twice as long), "
+            "optionally followed by s, m, h or d (e.g. 1h)."
+        ),
+    )
     run_parser.add_argument(
         "--disable-fallback",
         action="store_true",
@@ -433,6 +790,39 @@ def get_parser() -> argparse.ArgumentParser:
             "index."
         ),
     )
+    run_parser.add_argument(
+        "--proxy-cache",
+        metavar="DIR",
+        default=DEFAULTS.PROXY_CACHE,
+        type=path_arg,
+        help=(
+            "Proxy the projects that the package directories do not hold "
+            "from the index of --fallback-url rather than redirecting to "
+            "it: their pages list the upstream files, which are downloaded "
+            "on demand into DIR and served from there."
+        ),
+    )
+    run_parser.add_argument(
+        "--proxy-index-ttl",
+        metavar="SECONDS",
+        default=DEFAULTS.PROXY_INDEX_TTL,
+        type=timeout_arg,
+        help=(
+            "Cache the upstream project pages for SECONDS "
+            f"(default: {DEFAULTS.PROXY_INDEX_TTL:g}). When upstream fails, "
+            "expired pages are served."
+        ),
+    )
+    run_parser.add_argument(
+        "--proxy-negative-ttl",
+        metavar="SECONDS",
+        default=DEFAULTS.PROXY_NEGATIVE_TTL,
+        type=timeout_arg,
+        help=(
+            "Cache the projects that upstream does not know for SECONDS "
+            f"(default: {DEFAULTS.PROXY_NEGATIVE_TTL:g})."
+        ),
+    )
     run_parser.add_argument(
         "--health-endpoint",
         default=DEFAULTS.HEALTH_ENDPOINT,
@@ -452,15 +842,94 @@ def get_parser() -> argparse.ArgumentParser:
             "gevent",
             "gunicorn",
             "paste",
+            "threaded",
             "twisted",
             "wsgiref",
         ),
         type=str.lower,
         help=(
             "Use METHOD to run the server. Valid values include paste, "
-            "cherrypy, twisted, gunicorn, gevent, wsgiref, and auto. The "
-            'default is to use "auto", which chooses one of paste, cherrypy, '
-            "twisted, or wsgiref."
+            "cherrypy, twisted, gunicorn, gevent, threaded, wsgiref, and "
+            'auto. The default is to use "auto", which chooses one of '
+            "waitress, paste, twisted, cherrypy or cheroot if installed, and "
+            "the built-in threaded server otherwise."
+        ),
+    )
+    run_parser.add_argument(
+        "--threads",
+        metavar="N",
+        default=DEFAULTS.THREADS,
+        type=threads_arg,
+        help=(
+            "Serve up to N connections at once with the threaded server; "
+            "the others wait for a thread "
+            f"(default: {DEFAULTS.THREADS})."
+        ),
+    )
+    run_parser.add_argument(
+        "--offload-threads",
+        metavar="N",
+        default=DEFAULTS.OFFLOAD_THREADS,
+        type=threads_arg,
+        help=(
+            "Under gevent, hash files, check passwords and scan the package "
+            "directories on a pool of N OS threads, so as not to block the "
+            "other requests (default: gevent's own, 10)."
+        ),
+    )
+    run_parser.add_argument(
+        "--backlog",
+        metavar="N",
+        default=DEFAULTS.BACKLOG,
+        type=backlog_arg,
+        help=(
+            "Let up to N connections wait to be accepted by the threaded "
+            f"server (default: {DEFAULTS.BACKLOG})."
+        ),
+    )
+    run_parser.add_argument(
+        "--timeout",
+        metavar="SECONDS",
+        default=DEFAULTS.TIMEOUT,
+        type=timeout_arg,
+        help=(
+            "Close the connections of the threaded server that send or "
+            "receive nothing for SECONDS, or 0 for never "
+            f"(default: {DEFAULTS.TIMEOUT:g})."
+        ),
+    )
+    run_parser.add_argument(
+        "--keepalive-timeout",
+        metavar="SECONDS",
+        default=DEFAULTS.KEEPALIVE_TIMEOUT,
+        type=timeout_arg,
+        help=(
+            "Keep the connections of the threaded server open for SECONDS "
+            "between requests, or 0 to close them after each one "
+            f"(default: {DEFAULTS.KEEPALIVE_TIMEOUT:g})."
+        ),
+    )
+    run_parser.add_argument(
+        "--workers",
+        metavar="N",
+        default=DEFAULTS.WORKERS,
+        type=server_workers_arg,
+        help=(
+            "Serve from N processes, forked once the index is built, which "
+            "accept connections from the same socket. The master process "
+            "restarts the workers that exit. Requires the built-in threaded "
+            f"server (default: {DEFAULTS.WORKERS})."
+        ),
+    )
+    run_parser.add_argument(
+        "--graceful-timeout",
+        metavar="SECONDS",
+        default=DEFAULTS.GRACEFUL_TIMEOUT,
+        type=timeout_arg,
+        help=(
+            "On shutdown, let the workers finish their requests in flight "
+            "for up to SECONDS before killing them "
+            f"(default: {DEFAULTS.GRACEFUL_TIMEOUT:g})."
         ),
     )
     run_parser.add_argument(
@@ -493,6 +962,28 @@ def get_parser() -> argparse.ArgumentParser:
             "AGE is specified in seconds."
         ),
     )
+    run_parser.add_argument(
+        "--compression-level",
+        metavar="LEVEL",
+        default=DEFAULTS.COMPRESSION_LEVEL,
+        type=compression_level_arg,
+        help=(
+            "Compress index and JSON responses with gzip (or brotli, if "
+            "installed) for clients that accept it, at compression LEVEL "
+            "(1-9). Use 0 to disable compression "
+            f"(default: {DEFAULTS.COMPRESSION_LEVEL})."
+        ),
+    )
+    run_parser.add_argument(
+        "--compression-min-size",
+        metavar="BYTES",
+        default=DEFAULTS.COMPRESSION_MIN_SIZE,
+        type=int,
+        help=(
+            "Responses smaller than BYTES are never compressed "
+            f"(default: {DEFAULTS.COMPRESSION_MIN_SIZE})."
+        ),
+    )
     run_parser.add_argument(
         "--log-req-frmt",
         metavar="FORMAT",
@@ -588,6 +1079,128 @@ def get_parser() -> argparse.ArgumentParser:
             "version of the private package, containing arbitrary code."
         ),
     )
+    update_parser.add_argument(
+        "--index-url",
+        default=DEFAULTS.INDEX_URL,
+        help=(
+            "The simple index to look for updates on, which must support "
+            f"its JSON API (default: {DEFAULTS.INDEX_URL})."
+        ),
+    )
+    update_parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="N",
+        default=DEFAULTS.UPDATE_WORKERS,
+        type=threads_arg,
+        help=(
+            "The number of packages looked up on the index at once, over "
+            f"as many kept-alive connections (default: "
+            f"{DEFAULTS.UPDATE_WORKERS})."
+        ),
+    )
+    update_parser.add_argument(
+        "--timeout",
+        metavar="SECONDS",
+        default=DEFAULTS.UPDATE_TIMEOUT,
+        type=timeout_arg,
+        help=(
+            "Give up on the index after this many seconds without a response "
+            f"to a lookup, or 0 to wait forever (default: "
+            f"{DEFAULTS.UPDATE_TIMEOUT})."
+        ),
+    )
+    update_parser.add_argument(
+        "--cache-file",
+        metavar="FILE",
+        type=pathlib.Path,
+        default=DEFAULTS.UPDATE_CACHE,
+        help=(
+            "Keep the responses of the index in this file between runs, and "
+            "only ask whether they changed (with their ETag and "
+            "Last-Modified headers). By default, nothing is kept."
+        ),
+    )
+
+    migrate_parser = subparsers.add_parser(
+        "migrate",
+        help=textwrap.dedent(
+            "Move the packages of the package directories to where --layout "
+            "puts them. By default, the commands doing so are printed to "
+            "stdout for introspection or pipelining. See the `-x` option for "
+            "moving packages directly."
+        ),
+    )
+
+    add_common_args(migrate_parser)
+
+    migrate_parser.add_argument(
+        "package_directory",
+        default=DEFAULTS.PACKAGE_DIRECTORIES,
+        nargs="*",
+        type=package_directory_arg,
+        help="The directory whose packages to move.",
+    )
+
+    migrate_parser.add_argument(
+        "-x",
+        "--execute",
+        action="store_true",
+        help="Move the packages rather than printing commands to stdout",
+    )
+    migrate_parser.add_argument(
+        "-w",
+        "--workers",
+        metavar="N",
+        default=DEFAULTS.MIGRATE_WORKERS,
+        type=scan_workers_arg,
+        help=(
+            "The number of threads listing and moving packages "
+            f"(default: {DEFAULTS.MIGRATE_WORKERS})."
+        ),
+    )
+    token_parser = subparsers.add_parser(
+        "token",
+        help=textwrap.dedent(
+            "Print an API token for --user, signed with the key in "
+            "--token-key, which is created if it does not exist. Pass the "
+            "same --token-key to the `run` command to accept it."
+        ),
+    )
+    token_parser.add_argument(
+        "--token-key",
+        metavar="KEY_FILE",
+        required=True,
+        type=path_arg,
+        help="The file holding the key to sign the token with.",
+    )
+    token_parser.add_argument(
+        "-u",
+        "--user",
+        required=True,
+        help="The user the token is issued to, as logged by the server.",
+    )
+    token_parser.add_argument(
+        "-a",
+        "--actions",
+        default=DEFAULTS.TOKEN_ACTIONS,
+        type=token_actions_arg,
+        help=(
+            "The comma-separated actions the token allows, among "
+            f"{', '.join(ACTIONS)} (default: "
+            f"{','.join(DEFAULTS.TOKEN_ACTIONS)})."
+        ),
+    )
+    token_parser.add_argument(
+        "--expires",
+        metavar="DURATION",
+        type=duration_arg,
+        help=(
+            "Let the token expire after DURATION seconds, optionally "
+            "followed by s, m, h or d (e.g. 90d). By default, it does not "
+            "expire."
+        ),
+    )
     return parser
 
 
@@ -597,6 +1210,15 @@ BackendFactory = t.Callable[["_ConfigCommon"], Backend]
 
 class _ConfigCommon:
     hash_algo: t.Optional[str] = None
+    scan_workers: int = DEFAULTS.SCAN_WORKERS
+    layout: str = DEFAULTS.LAYOUT
+    blob_store: t.Optional[pathlib.Path] = DEFAULTS.BLOB_STORE
+    snapshot: t.Optional[pathlib.Path] = DEFAULTS.SNAPSHOT
+    poll_roots: t.Sequence[pathlib.Path] = ()
+    poll_interval: float = DEFAULTS.POLL_INTERVAL
+    watch_budget: t.Optional[int] = DEFAULTS.WATCH_BUDGET
+    digest_cache_bytes: t.Optional[int] = DEFAULTS.DIGEST_CACHE_BYTES
+    digest_cache_entries: t.Optional[int] = DEFAULTS.DIGEST_CACHE_ENTRIES
 
     def __init__(
         self,
@@ -607,6 +1229,15 @@ class _ConfigCommon:
         log_stream: t.Optional[t.IO],
         hash_algo: t.Optional[str],
         backend_arg: str,
+        scan_workers: int = DEFAULTS.SCAN_WORKERS,
+        layout: str = DEFAULTS.LAYOUT,
+        blob_store: t.Optional[pathlib.Path] = DEFAULTS.BLOB_STORE,
+        snapshot: t.Optional[pathlib.Path] = DEFAULTS.SNAPSHOT,
+        poll_roots: t.Sequence[pathlib.Path] = (),
+        poll_interval: float = DEFAULTS.POLL_INTERVAL,
+        watch_budget: t.Optional[int] = DEFAULTS.WATCH_BUDGET,
+        digest_cache_bytes: t.Optional[int] = DEFAULTS.DIGEST_CACHE_BYTES,
+        digest_cache_entries: t.Optional[int] = DEFAULTS.DIGEST_CACHE_ENTRIES,
     ) -> None:
         """Construct a RuntimeConfig."""
         # Global arguments
@@ -618,6 +1249,15 @@ class _ConfigCommon:
         self.roots = roots
         self.hash_algo = hash_algo
         self.backend_arg = backend_arg
+        self.scan_workers = scan_workers
+        self.layout = layout
+        self.blob_store = blob_store
+        self.snapshot = snapshot
+        self.poll_roots = list(poll_roots)
+        self.poll_interval = poll_interval
+        self.watch_budget = watch_budget
+        self.digest_cache_bytes = digest_cache_bytes
+        self.digest_cache_entries = digest_cache_entries
 
         # Derived properties are directly based on other properties and are not
         # included in equality checks.
@@ -652,6 +1292,15 @@ class _ConfigCommon:
             roots=namespace.package_directory,
             hash_algo=namespace.hash_algo,
             backend_arg=namespace.backend_arg,
+            scan_workers=namespace.scan_workers,
+            layout=namespace.layout,
+            blob_store=namespace.blob_store,
+            snapshot=namespace.snapshot,
+            poll_roots=namespace.poll_roots,
+            poll_interval=namespace.poll_interval,
+            watch_budget=namespace.watch_budget,
+            digest_cache_bytes=namespace.digest_cache_bytes,
+            digest_cache_entries=namespace.digest_cache_entries,
         )
 
     @property
@@ -735,10 +1384,34 @@ class RunConfig(_ConfigCommon):
         log_res_frmt: str,
         log_err_frmt: str,
         server_base_url: str,
+        compression_level: int = DEFAULTS.COMPRESSION_LEVEL,
+        compression_min_size: int = DEFAULTS.COMPRESSION_MIN_SIZE,
+        workers: int = DEFAULTS.WORKERS,
+        graceful_timeout: float = DEFAULTS.GRACEFUL_TIMEOUT,
+        threads: int = DEFAULTS.THREADS,
+        backlog: int = DEFAULTS.BACKLOG,
+        timeout: float = DEFAULTS.TIMEOUT,
+        keepalive_timeout: float = DEFAULTS.KEEPALIVE_TIMEOUT,
+        offload_threads: t.Optional[int] = DEFAULTS.OFFLOAD_THREADS,
+        token_key: t.Optional[pathlib.Path] = DEFAULTS.TOKEN_KEY,
+        signed_urls: t.Optional[float] = DEFAULTS.SIGNED_URLS,
+        proxy_cache: t.Optional[pathlib.Path] = DEFAULTS.PROXY_CACHE,
+        proxy_index_ttl: float = DEFAULTS.PROXY_INDEX_TTL,
+        proxy_negative_ttl: float = DEFAULTS.PROXY_NEGATIVE_TTL,
+        auth_cache_ttl: float = DEFAULTS.AUTH_CACHE_TTL,
+        auth_cache_size: int = DEFAULTS.AUTH_CACHE_SIZE,
         auther: t.Optional[t.Callable[[str, str], bool]] = None,
         **kwargs: t.Any,
     ) -> None:
         """Construct a RuntimeConfig."""
+        if proxy_cache is not None:
+            # Served as one more package directory
+            try:
+                proxy_cache.mkdir(parents=True, exist_ok=True)
+            except OSError as exc:
+                sys.exit(f"Cannot create the proxy cache: {exc}")
+            if proxy_cache not in kwargs["roots"]:
+                kwargs["roots"] = [*kwargs["roots"], proxy_cache]
         super().__init__(**kwargs)
         self.port = port
         self.host = host
@@ -755,9 +1428,33 @@ class RunConfig(_ConfigCommon):
         self.log_res_frmt = log_res_frmt
         self.log_err_frmt = log_err_frmt
         self.server_base_url = server_base_url
+        self.compression_level = compression_level
+        self.compression_min_size = compression_min_size
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        self.threads = threads
+        self.backlog = backlog
+        self.timeout = timeout
+        self.keepalive_timeout = keepalive_timeout
+        self.offload_threads = offload_threads
+        self.token_key = token_key
+        self.signed_urls = signed_urls
+        self.proxy_cache = proxy_cache
+        self.proxy_index_ttl = proxy_index_ttl
+        self.proxy_negative_ttl = proxy_negative_ttl
+        self.auth_cache_ttl = auth_cache_ttl
+        self.auth_cache_size = auth_cache_size
         # Derived properties
-        self._derived_properties = self._derived_properties + ("auther",)
+        self._derived_properties = self._derived_properties + (
+            "auther",
+            "tokens",
+            "url_signer",
+            "proxy",
+        )
         self.auther = self.get_auther(auther)
+        self.tokens = self.get_tokens()
+        self.url_signer = self.get_url_signer()
+        self.proxy = self.get_proxy()
 
     @classmethod
     def kwargs_from_namespace(
@@ -781,6 +1478,22 @@ class RunConfig(_ConfigCommon):
             "log_res_frmt": namespace.log_res_frmt,
             "log_err_frmt": namespace.log_err_frmt,
             "server_base_url": namespace.server_base_url,
+            "compression_level": namespace.compression_level,
+            "compression_min_size": namespace.compression_min_size,
+            "workers": namespace.workers,
+            "graceful_timeout": namespace.graceful_timeout,
+            "threads": namespace.threads,
+            "backlog": namespace.backlog,
+            "timeout": namespace.timeout,
+            "keepalive_timeout": namespace.keepalive_timeout,
+            "offload_threads": namespace.offload_threads,
+            "token_key": namespace.token_key,
+            "signed_urls": namespace.signed_urls,
+            "proxy_cache": namespace.proxy_cache,
+            "proxy_index_ttl": namespace.proxy_index_ttl,
+            "proxy_negative_ttl": namespace.proxy_negative_ttl,
+            "auth_cache_ttl": namespace.auth_cache_ttl,
+            "auth_cache_size": namespace.auth_cache_size,
         }
 
     def get_auther(
@@ -815,15 +1528,50 @@ class RunConfig(_ConfigCommon):
                 "authentication"
             )
 
-        loaded_pw_file = HtpasswdFile(self.password_file)
+        return HtpasswdAuther(
+            HtpasswdFile(self.password_file),
+            cache=(
+                CredentialCache(self.auth_cache_ttl, self.auth_cache_size)
+                if self.auth_cache_ttl
+                else None
+            ),
+        )
+
+    def get_tokens(self) -> t.Optional[TokenSigner]:
+        """Create the verifier of API tokens, if a token key is set."""
+        if self.token_key is None:
+            return None
+        try:
+            return TokenSigner(load_key(self.token_key))
+        except (OSError, ValueError) as exc:
+            sys.exit(f"Cannot read the token key: {exc}")
+
+    def get_url_signer(self) -> t.Optional[URLSigner]:
+        """Create the signer of download URLs, if signing them."""
+        if self.signed_urls is None or "download" not in self.authenticate:
+            return None
+        if self.tokens is None:
+            sys.exit("Signing download URLs (--signed-urls) needs --token-key")
+        return URLSigner(self.tokens.key, self.signed_urls)
 
-        # Construct a local closure over the loaded PW file and return as our
-        # authentication function.
-        def auther(uname: str, pw: str) -> bool:
-            loaded_pw_file.load_if_changed()
-            return loaded_pw_file.check_password(uname, pw)
+    def get_proxy(self) -> t.Optional[Proxy]:
+        """Create the proxy of the fallback index, if proxying it."""
+        if self.proxy_cache is None:
+            return None
+        return Proxy(
+            self.proxy_cache,
+            self.fallback_url,
+            get_layout(self.layout),
+            index_ttl=self.proxy_index_ttl,
+            negative_ttl=self.proxy_negative_ttl,
+        )
 
-        return auther
+    def check_credentials(self, user: str, password: str, action: str) -> bool:
+        """Whether `user` may perform `action` with `password`, either
+        an API token or a password."""
+        if user == TOKEN_USER and self.tokens is not None:
+            return self.tokens.verify(password, action)
+        return bool(self.auther(user, password))
 
 
 class UpdateConfig(_ConfigCommon):
@@ -835,6 +1583,10 @@ class UpdateConfig(_ConfigCommon):
         download_directory: t.Optional[str],
         allow_unstable: bool,
         ignorelist: t.List[str],
+        index_url: str = DEFAULTS.INDEX_URL,
+        workers: int = DEFAULTS.UPDATE_WORKERS,
+        timeout: float = DEFAULTS.UPDATE_TIMEOUT,
+        cache_file: t.Optional[pathlib.Path] = DEFAULTS.UPDATE_CACHE,
         **kwargs: t.Any,
     ) -> None:
         """Construct an UpdateConfig."""
@@ -843,6 +1595,10 @@ class UpdateConfig(_ConfigCommon):
         self.download_directory = download_directory
         self.allow_unstable = allow_unstable
         self.ignorelist = ignorelist
+        self.index_url = index_url
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_file = cache_file
 
     @classmethod
     def kwargs_from_namespace(
@@ -855,10 +1611,67 @@ class UpdateConfig(_ConfigCommon):
             "download_directory": namespace.download_directory,
             "allow_unstable": namespace.allow_unstable,
             "ignorelist": namespace.ignorelist_file,
+            "index_url": namespace.index_url,
+            "workers": namespace.workers,
+            "timeout": namespace.timeout,
+            "cache_file": namespace.cache_file,
+        }
+
+
+class MigrateConfig(_ConfigCommon):
+    """A config for the Migrate command."""
+
+    def __init__(
+        self,
+        execute: bool,
+        workers: int,
+        **kwargs: t.Any,
+    ) -> None:
+        """Construct a MigrateConfig."""
+        super().__init__(**kwargs)
+        self.execute = execute
+        self.workers = workers
+
+    @classmethod
+    def kwargs_from_namespace(
+        cls, namespace: argparse.Namespace
+    ) -> t.Dict[str, t.Any]:
+        """Convert a namespace into __init__ kwargs for this class."""
+        return {
+            **super(MigrateConfig, cls).kwargs_from_namespace(namespace),
+            "execute": namespace.execute,
+            "workers": namespace.workers,
         }
 
 
-Configuration = t.Union[RunConfig, UpdateConfig]
+class TokenConfig:
+    """A config for the Token command."""
+
+    def __init__(
+        self,
+        token_key: pathlib.Path,
+        user: str,
+        actions: t.List[str],
+        expires: t.Optional[float],
+    ) -> None:
+        """Construct a TokenConfig."""
+        self.token_key = token_key
+        self.user = user
+        self.actions = actions
+        self.expires = expires
+
+    @classmethod
+    def from_namespace(cls, namespace: argparse.Namespace) -> "TokenConfig":
+        """Construct a config from an argparse namespace."""
+        return cls(
+            token_key=namespace.token_key,
+            user=namespace.user,
+            actions=namespace.actions,
+            expires=namespace.expires,
+        )
+
+
+Configuration = t.Union[RunConfig, UpdateConfig, MigrateConfig, TokenConfig]
 
 
 class Config:
@@ -949,6 +1762,10 @@ class Config:
             return RunConfig.from_namespace(parsed)
         if parsed.cmd == "update":
             return UpdateConfig.from_namespace(parsed)
+        if parsed.cmd == "migrate":
+            return MigrateConfig.from_namespace(parsed)
+        if parsed.cmd == "token":
+            return TokenConfig.from_namespace(parsed)
         raise SystemExit(parser.format_usage())
 
     @staticmethod
@@ -4,7 +4,11 @@
 import mimetypes
 import typing as t
 
-from pypiserver.pkg_helpers import normalize_pkgname, parse_version
+from pypiserver.pkg_helpers import (
+    normalize_pkgname,
+    parse_version,
+    version_key,
+)
 
 mimetypes.add_type("application/octet-stream", ".egg")
 mimetypes.add_type("application/octet-stream", ".whl")
@@ -38,6 +42,7 @@ class PkgFile:
         root: t.Optional[str] = None,
         relfn: t.Optional[str] = None,
         replaces: t.Optional["PkgFile"] = None,
+        digester: t.Optional[t.Callable[["PkgFile"], t.Optional[str]]] = None,
     ):
         self.pkgname = pkgname
         self.pkgname_norm = normalize_pkgname(pkgname)
@@ -49,7 +54,7 @@ class PkgFile:
         self.relfn_unix = None if relfn is None else relfn.replace("\\", "/")
         self.replaces = replaces
         self.digest = None
-        self.digester = None
+        self.digester = digester
 
     def __repr__(self) -> str:
         return "{}({})".format(
@@ -62,6 +67,11 @@ class PkgFile:
             ),
         )
 
+    @property
+    def version_key(self) -> bytes:
+        """A compact key that sorts like `parsed_version`."""
+        return version_key(self.version)
+
     @property
     def fname_and_hash(self) -> str:
         if self.digest is None and self.digester is not None:
@@ -0,0 +1,133 @@
+"""Password checks against an htpasswd file, with a cache of the verified
+credentials.
+
+Clients send their credentials with every request, and checking a bcrypt
+hash takes some 100 ms, so that a pip install authenticating each of its
+downloads would spend most of its time there. Successful checks are
+therefore remembered for a while, keyed by an HMAC of the user and password
+under a secret drawn per process: the passwords themselves are not kept, and
+the keys are of no use outside of the process. The cache is cleared
+whenever the htpasswd file changes, which is checked at most once per
+`reload_interval` rather than on every request.
+"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+import typing as t
+from collections import OrderedDict
+
+from pypiserver import offload
+
+# How often to check whether the htpasswd file changed, in seconds
+RELOAD_INTERVAL = 1.0
+
+
+class CredentialCache:
+    """A bounded cache of verified credentials, which expire after `ttl`
+    seconds. The least recently used are evicted past `max_entries`."""
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._secret = os.urandom(32)
+        # HMAC of the credentials -> expiry time
+        self._expiries: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+    def _key(self, user: str, password: str) -> bytes:
+        # Prefixed with its length, a user cannot run into the password
+        message = f"{len(user)}:{user}{password}".encode("utf-8")
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def verified(self, user: str, password: str) -> bool:
+        """Whether the credentials were added, and have not expired."""
+        key = self._key(user, password)
+        with self._lock:
+            expiry = self._expiries.get(key)
+            if expiry is None:
+                return False
+            if expiry <= self.clock():
+                del self._expiries[key]
+                return False
+            self._expiries.move_to_end(key)
+            return True
+
+    def add(self, user: str, password: str) -> None:
+        """Remember that the credentials were verified."""
+        key = self._key(user, password)
+        with self._lock:
+            self._expiries[key] = self.clock() + self.ttl
+            self._expiries.move_to_end(key)
+            while len(self._expiries) > self.max_entries:
+                self._expiries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._expiries.clear()
+
+
+class HtpasswdAuther:
+    """Checks passwords against a `passlib.apache.HtpasswdFile`, reloaded
+    when it changes.
+
+    :param cache: the cache of verified credentials, if any
+    """
+
+    def __init__(
+        self,
+        htpasswd: t.Any,
+        cache: t.Optional[CredentialCache] = None,
+        reload_interval: float = RELOAD_INTERVAL,
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        self.htpasswd = htpasswd
+        self.cache = cache
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._next_reload = clock() + reload_interval
+        # Incremented on every reload, so that checks against the previous
+        # passwords are not cached past it
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self) -> None:
+        now = self.clock()
+        if now < self._next_reload:
+            return
+        with self._lock:
+            if now < self._next_reload:
+                return
+            self._next_reload = now + self.reload_interval
+            if self.htpasswd.load_if_changed():
+                self._generation += 1
+                if self.cache is not None:
+                    self.cache.clear()
+
+    def __call__(self, user: str, password: str) -> bool:
+        self._reload_if_changed()
+        if self.cache is not None and self.cache.verified(user, password):
+            return True
+        generation = self._generation
+        # Hashing the password may take long enough to block a gevent server
+        verified = bool(
+            offload.run(self.htpasswd.check_password, user, password)
+        )
+        if (
+            verified
+            and self.cache is not None
+            and generation == self._generation
+        ):
+            self.cache.add(user, password)
+        return verified
@@ -0,0 +1,160 @@
+"""Layouts of the packages within a package root.
+
+A layout tells where the packages of a project are stored, relative to the
+root. With the `flat` layout, packages may be anywhere, and uploads are
+stored in the root itself. The other layouts keep all the packages of a
+project in a directory of its own, so that looking a project up, uploading
+or removing one of its packages only touches that directory:
+
+- `project`: `<root>/<project>/<files>`
+- `sharded`: `<root>/<h[0:2]>/<h[2:4]>/<project>/<files>`, `h` being the
+  SHA-256 hex digest of the project name, for roots with so many projects
+  that a single directory would not do
+
+Project names are PEP 503 normalized in both cases. `migrate` moves the
+packages of existing roots to where a layout puts them.
+"""
+
+import concurrent.futures
+import hashlib
+import logging
+import os
+import shlex
+import sys
+import typing as t
+
+from .pkg_helpers import guess_pkgname_and_version, normalize_pkgname
+from .scan import PathLike, scan_listed_files_parallel
+
+log = logging.getLogger(__name__)
+
+
+class Layout:
+    """The `flat` layout: packages may be anywhere within the root."""
+
+    name = "flat"
+    # Whether all the packages of a project are within its directory
+    indexed = False
+
+    def project_dir(self, project: str) -> str:
+        """The directory, relative to the root, where the packages of
+        `project` are stored."""
+        return ""
+
+    def package_path(self, filename: str) -> t.Optional[str]:
+        """The path, relative to the root, where a package file is stored,
+        or None if `filename` is not a package."""
+        guessed = guess_pkgname_and_version(filename)
+        if guessed is None:
+            return None
+        return os.path.join(self.project_dir(guessed[0]), filename)
+
+
+class ProjectLayout(Layout):
+    """The `project` layout: one directory per project."""
+
+    name = "project"
+    indexed = True
+
+    def project_dir(self, project: str) -> str:
+        return normalize_pkgname(project)
+
+
+class ShardedLayout(ProjectLayout):
+    """The `sharded` layout: one directory per project, within two levels
+    of directories named after the hash of the project name."""
+
+    name = "sharded"
+
+    def project_dir(self, project: str) -> str:
+        project = normalize_pkgname(project)
+        digest = hashlib.sha256(project.encode("utf-8")).hexdigest()
+        return os.path.join(digest[:2], digest[2:4], project)
+
+
+LAYOUTS: t.Dict[str, Layout] = {
+    layout.name: layout
+    for layout in (Layout(), ProjectLayout(), ShardedLayout())
+}
+
+
+def get_layout(name: str) -> Layout:
+    return LAYOUTS[name]
+
+
+def planned_moves(
+    roots: t.Sequence[PathLike], layout: Layout, workers: int = 1
+) -> t.List[t.Tuple[str, str]]:
+    """List the `(source, destination)` of the packages within `roots` that
+    are not where `layout` puts them. Files that are not packages stay where
+    they are, and so do all files with the `flat` layout, which serves
+    packages from anywhere."""
+    if not layout.indexed:
+        return []
+    moves = []
+    for root, files in zip(
+        roots, scan_listed_files_parallel(roots, max(workers, 1))
+    ):
+        root = os.fspath(root)
+        for file in files:
+            relpath = layout.package_path(file.name)
+            if relpath is None:
+                continue
+            destination = os.path.join(root, relpath)
+            if destination != file.path:
+                moves.append((file.path, destination))
+    return moves
+
+
+def move_package(source: str, destination: str) -> bool:
+    """Move a package file, unless its destination is already taken."""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        # Unlike renaming, linking never replaces the destination
+        os.link(source, destination)
+    except FileExistsError:
+        log.warning("Not moving %s: %s already exists", source, destination)
+        return False
+    except OSError:
+        # No hard links on this file system
+        if os.path.lexists(destination):
+            log.warning("Not moving %s: %s already exists", source, destination)
+            return False
+        os.rename(source, destination)
+        return True
+    os.unlink(source)
+    return True
+
+
+def migrate(
+    roots: t.Sequence[PathLike],
+    layout: Layout,
+    workers: int = 1,
+    dry_run: bool = True,
+    out: t.Optional[t.IO] = None,
+) -> int:
+    """Move the packages within `roots` to where `layout` puts them, with up
+    to `workers` threads, and return the number of packages moved.
+
+    With `dry_run`, the `mv` commands doing so are printed instead.
+    """
+    moves = planned_moves(roots, layout, workers)
+    if dry_run:
+        out = out or sys.stdout
+        for source, destination in moves:
+            print(
+                "mkdir -p {} && mv -n {} {}".format(
+                    shlex.quote(os.path.dirname(destination)),
+                    shlex.quote(source),
+                    shlex.quote(destination),
+                ),
+                file=out,
+            )
+        return 0
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(workers, 1), thread_name_prefix="pypiserver-migrate"
+    ) as pool:
+        moved = sum(pool.map(lambda move: move_package(*move), moves))
+    log.info("Moved %d of %d packages", moved, len(moves))
+    return moved
@@ -2,22 +2,28 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import base64
+import concurrent.futures
+import http.client
 import itertools
 import json
 import os
 import sys
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
 from collections.abc import Generator, Iterable, Sequence, ValuesView
 from pathlib import Path
 from subprocess import call
-from urllib.error import URLError
-from urllib.request import Request, urlopen
+from typing import NamedTuple, Optional
 
 import pip
 from packaging.version import parse as packaging_parse
 
 from .backend import listdir
 from .core import PkgFile
-from .pkg_helpers import normalize_pkgname, parse_version
+from .pkg_helpers import normalize_pkgname, version_key
 
 
 def is_stable_version(pversion: Sequence[str]) -> bool:
@@ -46,7 +52,7 @@ def filter_latest_pkgs(pkgs: Iterable[PkgFile]) -> ValuesView[PkgFile]:
 
         if (
             pkgname not in pkgname2latest
-            or x.parsed_version > pkgname2latest[pkgname].parsed_version
+            or x.version_key > pkgname2latest[pkgname].version_key
         ):
             pkgname2latest[pkgname] = x
 
@@ -55,30 +61,246 @@ def filter_latest_pkgs(pkgs: Iterable[PkgFile]) -> ValuesView[PkgFile]:
 
 def build_releases(pkg: PkgFile, versions: Iterable[str]) -> Generator[PkgFile]:
     for x in versions:
-        parsed_version = parse_version(x)
-        if parsed_version > pkg.parsed_version:
+        if version_key(x) > pkg.version_key:
             yield PkgFile(pkgname=pkg.pkgname, version=x, replaces=pkg)
 
 
-def get_package_releases(pkgname: str) -> str | None:
-    pypi_json_content_type = "application/vnd.pypi.simple.v1+json"
+PYPI_SIMPLE_URL = "https://pypi.org/simple/"
+# The number of concurrent queries to the index
+UPDATE_WORKERS = 8
+# Seconds to wait for the index
+UPDATE_TIMEOUT = 30.0
+_MAX_REDIRECTS = 5
 
-    req = Request(
-        f"https://pypi.org/simple/{pkgname}",
-        headers={"Accept": pypi_json_content_type},
-    )
+
+class IndexLookupError(Exception):
+    """The index could not be queried."""
+
+
+class _Connection(NamedTuple):
+    conn: http.client.HTTPConnection
+    # Prepended to the paths requested, for plain HTTP proxies
+    prefix: str
+    # Sent along with every request
+    headers: dict[str, str]
+
+
+class IndexClient:
+    """Queries the versions of projects from the PEP 691 JSON API of a
+    package index.
+
+    Each thread keeps one connection alive per host, rather than connecting
+    (and negotiating TLS) for every project. The proxies of the environment
+    (`HTTPS_PROXY`, `NO_PROXY`, etc.) are honored as they are by `urllib`.
+    With `cache_file`, responses are cached between runs, and revalidated
+    with their `ETag` and `Last-Modified` headers, so that unchanged projects
+    are not sent again.
+    """
+
+    accept = "application/vnd.pypi.simple.v1+json"
+
+    def __init__(
+        self,
+        index_url: str = PYPI_SIMPLE_URL,
+        timeout: float | None = UPDATE_TIMEOUT,
+        cache_file: Path | None = None,
+    ):
+        self.index_url = index_url.rstrip("/") + "/"
+        self.timeout = timeout or None
+        self.cache_file = cache_file
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # The connections of all threads, to be closed
+        self._connections: list[http.client.HTTPConnection] = []
+        self._proxies = urllib.request.getproxies()
+        # URL -> {"etag", "last_modified", "versions"}
+        self._cache: dict[str, dict] = {}
+        if cache_file is not None:
+            try:
+                with open(cache_file, encoding="utf-8") as f:
+                    cache = json.load(f)
+                if isinstance(cache, dict):
+                    self._cache = cache
+            except (OSError, ValueError):
+                pass
+
+    def _proxy(
+        self, scheme: str, netloc: str
+    ) -> Optional[urllib.parse.SplitResult]:
+        """The proxy to reach `netloc` through, if any."""
+        proxy = self._proxies.get(scheme)
+        if not proxy or urllib.request.proxy_bypass(netloc):
+            return None
+        if "://" not in proxy:
+            proxy = f"http://{proxy}"
+        return urllib.parse.urlsplit(proxy)
+
+    def _connect(self, scheme: str, netloc: str) -> _Connection:
+        conn_class = (
+            http.client.HTTPSConnection
+            if scheme == "https"
+            else http.client.HTTPConnection
+        )
+        proxy = self._proxy(scheme, netloc)
+        if proxy is None:
+            return _Connection(conn_class(netloc, timeout=self.timeout), "", {})
+
+        headers: dict[str, str] = {}
+        if proxy.username is not None:
+            credentials = ":".join(
+                urllib.parse.unquote(part or "")
+                for part in (proxy.username, proxy.password)
+            )
+            headers["Proxy-Authorization"] = "Basic " + base64.b64encode(
+                credentials.encode()
+            ).decode("ascii")
+        proxy_netloc = proxy.netloc.rpartition("@")[2]
+        if scheme == "https":
+            # Tunneled through the proxy
+            conn = conn_class(proxy_netloc, timeout=self.timeout)
+            conn.set_tunnel(netloc, headers=headers)
+            return _Connection(conn, "", {})
+        conn = http.client.HTTPConnection(proxy_netloc, timeout=self.timeout)
+        return _Connection(conn, f"{scheme}://{netloc}", headers)
+
+    def _connection(self, scheme: str, netloc: str) -> tuple[_Connection, bool]:
+        """The connection of this thread to `netloc`, and whether it was
+        used already."""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get((scheme, netloc))
+        if connection is not None:
+            return connection, True
+        connection = connections[(scheme, netloc)] = self._connect(
+            scheme, netloc
+        )
+        with self._lock:
+            self._connections.append(connection.conn)
+        return connection, False
+
+    def _close(self, scheme: str, netloc: str) -> None:
+        self._local.connections.pop((scheme, netloc)).conn.close()
+
+    def __enter__(self) -> "IndexClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close the connections of all threads."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._local = threading.local()
+        for conn in connections:
+            conn.close()
+
+    def _get(
+        self, url: str, headers: dict[str, str]
+    ) -> tuple[int, http.client.HTTPMessage, bytes]:
+        """GET `url`, following redirects, and return the status, headers and
+        body of the response."""
+        for _ in range(_MAX_REDIRECTS):
+            parts = urllib.parse.urlsplit(url)
+            path = urllib.parse.urlunsplit(("", "", *parts[2:4], ""))
+            connection, reused = self._connection(parts.scheme, parts.netloc)
+            try:
+                connection.conn.request(
+                    "GET",
+                    connection.prefix + (path or "/"),
+                    headers={**headers, **connection.headers},
+                )
+                resp = connection.conn.getresponse()
+                body = resp.read()
+            except (http.client.HTTPException, OSError) as exc:
+                self._close(parts.scheme, parts.netloc)
+                if not reused or isinstance(exc, TimeoutError):
+                    raise IndexLookupError(f"{url}: {exc}") from exc
+                # The server closed the connection kept alive: retry on a new
+                # one
+                continue
+            if resp.will_close:
+                self._close(parts.scheme, parts.netloc)
+            location = resp.getheader("Location")
+            if resp.status in (301, 302, 303, 307, 308) and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return resp.status, resp.headers, body
+        raise IndexLookupError(f"{url}: too many redirects")
+
+    def releases(self, pkgname: str) -> list[str] | None:
+        """The versions of `pkgname` on the index, or None if it has none.
+
+        :raises IndexLookupError: if the index could not be queried
+        """
+        url = f"{self.index_url}{normalize_pkgname(pkgname)}/"
+        headers = {"Accept": self.accept}
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        status, resp_headers, body = self._get(url, headers)
+        if status == 304 and cached is not None:
+            return cached["versions"]
+        if status == 404:
+            return None
+        if status != 200:
+            raise IndexLookupError(f"{url}: HTTP {status}")
+        try:
+            versions = json.loads(body)["versions"]
+        except (ValueError, KeyError, TypeError) as exc:
+            raise IndexLookupError(f"{url}: invalid response: {exc}") from exc
+        etag = resp_headers.get("ETag")
+        last_modified = resp_headers.get("Last-Modified")
+        if etag or last_modified:
+            with self._lock:
+                self._cache[url] = {
+                    "etag": etag,
+                    "last_modified": last_modified,
+                    "versions": versions,
+                }
+        return versions
+
+    def save(self) -> None:
+        """Write the cached responses to `cache_file`."""
+        if self.cache_file is None:
+            return
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_file))
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=cache_dir, delete=False, encoding="utf-8"
+            ) as f:
+                with self._lock:
+                    json.dump(self._cache, f)
+            os.replace(f.name, self.cache_file)
+        except OSError as error:
+            print(f"cannot write the cache {self.cache_file}: {error}")
+
+
+def get_package_releases(
+    pkgname: str, client: IndexClient | None = None
+) -> list[str] | None:
     try:
-        with urlopen(req) as resp:
-            parsed = json.load(resp)
-            return parsed["versions"]
-    except URLError as error:
+        if client is None:
+            with IndexClient() as client:
+                return client.releases(pkgname)
+        return client.releases(pkgname)
+    except IndexLookupError as error:
         # TODO(tech-debt): use a proper logging approach
-        print(type(error), error.reason, sep=": ")
+        print(type(error), error, sep=": ")
         return None
 
 
 def find_updates(
-    pkgset: Iterable[PkgFile], stable_only: bool = True
+    pkgset: Iterable[PkgFile],
+    stable_only: bool = True,
+    client: IndexClient | None = None,
+    workers: int = UPDATE_WORKERS,
 ) -> set[PkgFile]:
     no_releases = set()
     if stable_only:
@@ -90,32 +312,41 @@ def find_updates(
         sys.stdout.write(s)
         sys.stdout.flush()
 
-    latest_pkgs = frozenset(filter_latest_pkgs(pkgset))
+    latest_pkgs = list(frozenset(filter_latest_pkgs(pkgset)))
 
     sys.stdout.write(
         f"checking {len(latest_pkgs)} packages for newer version\n"
     )
     need_update = set()
+    client = client or IndexClient()
 
-    for count, pkg in enumerate(latest_pkgs):
-        if count % 40 == 0:
-            write("\n")
-
-        pypi_versions = get_package_releases(pkg.pkgname)
-        if pypi_versions:
-            releases = filter_releases(build_releases(pkg, pypi_versions))
-            status = "."
-            try:
-                need_update.add(max(releases, key=lambda x: x.parsed_version))
-                status = "u"
-            except ValueError:
-                pass
-        else:
-            status = "e"
-            no_releases.add(pkg.pkgname)
-
-        write(status)
-
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        # The packages are reported in order, as they were checked serially
+        all_versions = pool.map(
+            lambda pkg: get_package_releases(pkg.pkgname, client), latest_pkgs
+        )
+        for count, (pkg, pypi_versions) in enumerate(
+            zip(latest_pkgs, all_versions)
+        ):
+            if count % 40 == 0:
+                write("\n")
+
+            if pypi_versions:
+                releases = filter_releases(build_releases(pkg, pypi_versions))
+                status = "."
+                try:
+                    need_update.add(max(releases, key=lambda x: x.version_key))
+                    status = "u"
+                except ValueError:
+                    pass
+            else:
+                status = "e"
+                no_releases.add(pkg.pkgname)
+
+            write(status)
+
+    client.close()
+    client.save()
     write("\n\n")
 
     if no_releases:
@@ -158,7 +389,10 @@ class PipCmd:
 
 
 def update_package(
-    pkg: PkgFile, destdir: str | None, dry_run: bool = False
+    pkg: PkgFile,
+    destdir: str | None,
+    dry_run: bool = False,
+    index: str = "https://pypi.org/simple",
 ) -> None:
     """Print and optionally execute a package update."""
     assert pkg.replaces is not None
@@ -172,6 +406,7 @@ def update_package(
             destdir or os.path.dirname(pkg.replaces.fn),  # type: ignore
             pkg.pkgname,
             pkg.version,
+            index=index,
         )
     )
 
@@ -185,6 +420,8 @@ def update(
     destdir: str | None = None,
     dry_run: bool = False,
     stable_only: bool = True,
+    client: IndexClient | None = None,
+    workers: int = UPDATE_WORKERS,
 ) -> None:
     """Print and optionally execute pip update commands.
 
@@ -194,10 +431,17 @@ def update(
         just being printed)
     :param stable_only: whether only stable (non prerelease) updates
         should be considered.
+    :param client: the client querying the index, PyPI by default
+    :param workers: the number of concurrent queries to the index
     """
-    need_update = find_updates(pkgset, stable_only=stable_only)
+    client = client or IndexClient()
+    need_update = find_updates(
+        pkgset, stable_only=stable_only, client=client, workers=workers
+    )
     for pkg in sorted(need_update, key=lambda x: x.pkgname):
-        update_package(pkg, destdir, dry_run=dry_run)
+        update_package(
+            pkg, destdir, dry_run=dry_run, index=client.index_url.rstrip("/")
+        )
 
 
 def update_all_packages(
@@ -206,6 +450,11 @@ def update_all_packages(
     dry_run: bool = False,
     stable_only: bool = True,
     ignorelist: Iterable[str] | None = None,
+    *,
+    index_url: str = PYPI_SIMPLE_URL,
+    workers: int = UPDATE_WORKERS,
+    timeout: float | None = UPDATE_TIMEOUT,
+    cache_file: Path | None = None,
 ) -> None:
     all_packages = itertools.chain.from_iterable(
         listdir(Path(r)) for r in roots
@@ -217,4 +466,7 @@ def update_all_packages(
         [pkg for pkg in all_packages if pkg.pkgname not in skip_packages]
     )
 
-    update(packages, destdir, dry_run, stable_only)
+    client = IndexClient(index_url, timeout=timeout, cache_file=cache_file)
+    update(
+        packages, destdir, dry_run, stable_only, client=client, workers=workers
+    )
@@ -0,0 +1,61 @@
+"""Run blocking work on OS threads under cooperative servers.
+
+Under gevent (`--server gevent`, or the gevent workers of gunicorn), every
+request is served by a greenlet of the same OS thread: hashing a large
+file, checking a bcrypt password or scanning a package tree there stalls
+all the other requests. Once gevent has patched the standard library, `run`
+hands such work to gevent's pool of OS threads, and only the greenlet
+calling it waits. Otherwise, the work runs right away.
+"""
+
+import sys
+import typing as t
+
+T = t.TypeVar("T")
+
+# The size of gevent's pool, if not its own default
+_threads: t.Optional[int] = None
+
+
+def set_threads(threads: t.Optional[int]) -> None:
+    """Set the number of OS threads to run blocking work on."""
+    global _threads
+    _threads = threads
+
+
+def _threadpool() -> t.Any:
+    """gevent's pool of OS threads, if gevent patched the standard library
+    and runs in this thread."""
+    monkey = sys.modules.get("gevent.monkey")
+    if monkey is None or not monkey.is_module_patched("socket"):
+        return None
+    # pylint: disable=import-outside-toplevel
+    from gevent.hub import get_hub_if_exists
+
+    hub = get_hub_if_exists()
+    if hub is None:
+        # Not a greenlet, such as a thread of the pool itself
+        return None
+    pool = hub.threadpool
+    if _threads is not None and pool.maxsize != _threads:
+        pool.maxsize = _threads
+    return pool
+
+
+def run(fn: t.Callable[..., T], *args: t.Any, **kwargs: t.Any) -> T:
+    """Call `fn`, on an OS thread under a cooperative server."""
+    pool = _threadpool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.apply(fn, args, kwargs)
+
+
+def iterate(
+    fn: t.Callable[..., t.Iterable[T]], *args: t.Any, **kwargs: t.Any
+) -> t.Iterable[T]:
+    """Like `run`, for a function returning an iterable, which is then
+    exhausted on the OS thread too."""
+    pool = _threadpool()
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.apply(lambda: list(fn(*args, **kwargs)))
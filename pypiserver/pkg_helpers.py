@@ -1,10 +1,16 @@
+import functools
 import os
 import re
 import typing as t
 from pathlib import PurePath
 from urllib.parse import quote
 
+# The number of distinct project names and file names whose normalized
+# forms and classifications are memoized.
+NAME_CACHE_SIZE = 2**18
 
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
 def normalize_pkgname(name: str) -> str:
     """Perform PEP 503 normalization"""
     return re.sub(r"[-_.]+", "-", name).lower()
@@ -36,6 +42,11 @@ def _parse_version_parts(s):
     yield "*final"  # ensure that alpha/beta/candidate are before final
 
 
+# The number of distinct version strings whose parsed forms are memoized.
+VERSION_CACHE_SIZE = 2**16
+
+
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
 def parse_version(s: str) -> tuple:
     parts = []
     for part in _parse_version_parts(s.lower()):
@@ -51,6 +62,18 @@ def parse_version(s: str) -> tuple:
 # ### -- End of distribute's code.
 
 
+@functools.lru_cache(maxsize=VERSION_CACHE_SIZE)
+def version_key(s: str) -> bytes:
+    """Return a compact sort key for a version, which orders versions exactly
+    like `parse_version`, but compares in a single `memcmp`.
+
+    The key is the UTF-8 encoding of the parsed parts joined with NUL bytes,
+    which sort before any other character, so that a part that is a prefix
+    of another one still sorts first.
+    """
+    return "\0".join(parse_version(s)).encode("utf-8", "surrogatepass")
+
+
 def is_listed_path(path_part: t.Union[PurePath, str]) -> bool:
     if isinstance(path_part, str):
         path_part = PurePath(path_part)
@@ -89,15 +112,35 @@ def _guess_pkgname_and_version_wheel(
         return name, ver
 
 
+# Archive suffixes that can be stripped without running `_archive_suffix_rx`,
+# as long as the file name contains none of the platform markers it also
+# looks for (all of which contain "-py" or ".win").
+_short_archive_suffixes = (".zip", ".tgz", ".egg")
+_tar_archive_suffixes = (".tar.gz", ".tar.bz2", ".tar.xz")
+
+
 def guess_pkgname_and_version(path: str) -> t.Optional[t.Tuple[str, str]]:
-    path = os.path.basename(path)
+    return _guess_pkgname_and_version(os.path.basename(path))
+
+
+@functools.lru_cache(maxsize=NAME_CACHE_SIZE)
+def _guess_pkgname_and_version(path: str) -> t.Optional[t.Tuple[str, str]]:
     if path.endswith(".asc"):
         path = path.rstrip(".asc")
     if path.endswith(".whl"):
         return _guess_pkgname_and_version_wheel(path)
-    if not _archive_suffix_rx.search(path):
+    lowered = path.lower()
+    if "-py" in lowered or ".win" in lowered or not lowered.isascii():
+        if not _archive_suffix_rx.search(path):
+            return None
+        path = _archive_suffix_rx.sub("", path)
+    elif lowered.endswith(_short_archive_suffixes):
+        # Dispatch on the suffix alone
+        path = path[:-4]
+    elif lowered.endswith(_tar_archive_suffixes):
+        path = path[: lowered.rindex(".tar.")]
+    else:
         return None
-    path = _archive_suffix_rx.sub("", path)
     if "-" not in path:
         pkgname, version = path, ""
     elif path.count("-") == 1:
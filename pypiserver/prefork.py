@@ -0,0 +1,217 @@
+"""Pre-forking multi-process serving, for `pypi-server run --workers N`.
+
+The master process binds the listening socket and warms the index, then
+forks the workers, which all accept connections from the inherited socket
+and start with the index already built (shared copy-on-write until they
+update it). The master then only supervises: workers that exit are
+restarted, with a growing delay if they keep failing right away.
+
+On SIGTERM or SIGINT, the master stops the workers with SIGTERM. A worker
+then stops accepting connections and finishes the requests in flight; the
+ones still running after `graceful_timeout` seconds are killed.
+"""
+
+import contextlib
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import typing as t
+
+from .server import RequestHandler, ThreadPoolWSGIServer
+
+log = logging.getLogger(__name__)
+
+DEFAULT_GRACEFUL_TIMEOUT = 30.0
+
+# How often the master checks on its workers
+_SUPERVISE_INTERVAL = 0.5
+# Workers exiting sooner than this after being started are failing
+_MIN_WORKER_LIFETIME = 1.0
+_MAX_RESPAWN_DELAY = 30.0
+
+
+def listen(
+    host: str, port: int, backlog: int = socket.SOMAXCONN
+) -> socket.socket:
+    """Bind a listening socket that forked workers inherit."""
+    family, _, _, _, address = socket.getaddrinfo(
+        host or None,
+        port,
+        type=socket.SOCK_STREAM,
+        flags=socket.AI_PASSIVE,
+    )[0]
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(address)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class SocketWSGIServer(ThreadPoolWSGIServer):
+    """A threaded WSGI server accepting from an already listening socket."""
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        handler_class: t.Type[RequestHandler] = RequestHandler,
+        **kwargs: t.Any,
+    ):
+        self.address_family = sock.family
+        super().__init__(
+            sock.getsockname()[:2],
+            handler_class,
+            bind_and_activate=False,
+            **kwargs,
+        )
+        self.socket.close()
+        self.socket = sock
+        self.server_bind()
+
+    def server_bind(self) -> None:
+        # The socket is bound already
+        host, port = self.socket.getsockname()[:2]
+        self.server_address = (host, port)
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+
+
+def serve_socket(
+    app: t.Callable,
+    sock: socket.socket,
+    handler_class: t.Type[RequestHandler] = RequestHandler,
+    **kwargs: t.Any,
+) -> None:
+    """Serve `app` from `sock` until SIGTERM, then finish the requests in
+    flight. The other arguments are those of `ThreadPoolWSGIServer`."""
+    server = SocketWSGIServer(sock, handler_class, **kwargs)
+    server.set_app(app)
+
+    def stop(signum, frame):
+        # `shutdown` waits for `serve_forever`, which this very thread runs
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    # Interrupts are for the master, which stops the workers in turn
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class Master:
+    """Forks `workers` processes running `worker(sock)`, and keeps them
+    running until stopped."""
+
+    def __init__(
+        self,
+        sock: socket.socket,
+        worker: t.Callable[[socket.socket], None],
+        workers: int,
+        graceful_timeout: float = DEFAULT_GRACEFUL_TIMEOUT,
+    ):
+        self.sock = sock
+        self.worker = worker
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        # -> key: pid, value: when the worker was started
+        self.children: t.Dict[int, float] = {}
+        self.stopping = False
+        self.respawn_delay = 0.0
+
+    def spawn(self) -> int:
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover (in the worker)
+            status = 1
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            try:
+                self.worker(self.sock)
+                status = 0
+            except BaseException:
+                log.exception("Worker %d failed", os.getpid())
+            finally:
+                logging.shutdown()
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+        log.info("Started worker %d", pid)
+        return pid
+
+    def reap(self) -> t.List[int]:
+        """Collect the workers that exited, and return their pids."""
+        exited = []
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            exited.append(pid)
+            if self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if time.monotonic() - started < _MIN_WORKER_LIFETIME:
+                self.respawn_delay = min(
+                    max(2 * self.respawn_delay, _SUPERVISE_INTERVAL),
+                    _MAX_RESPAWN_DELAY,
+                )
+            else:
+                self.respawn_delay = 0.0
+            log.warning(
+                "Worker %d exited (%d), restarting it in %gs",
+                pid,
+                code,
+                self.respawn_delay,
+            )
+        return exited
+
+    def stop(self, signum: int = signal.SIGTERM, frame: t.Any = None):
+        self.stopping = True
+
+    def run(self) -> None:
+        previous = {
+            sig: signal.signal(sig, self.stop)
+            for sig in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while not self.stopping:
+                time.sleep(_SUPERVISE_INTERVAL)
+                if self.reap() and self.respawn_delay and not self.stopping:
+                    time.sleep(self.respawn_delay)
+                while len(self.children) < self.workers and not self.stopping:
+                    self.spawn()
+        finally:
+            self.shutdown()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def shutdown(self) -> None:
+        """Stop the workers gracefully, killing the ones that do not stop
+        in time."""
+        self.stopping = True
+        for pid in self.children:
+            with contextlib.suppress(ProcessLookupError, ChildProcessError):
+                os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            if not self.reap():
+                time.sleep(0.05)
+        for pid in list(self.children):
+            log.warning("Killing worker %d", pid)
+            with contextlib.suppress(ProcessLookupError, ChildProcessError):
+                os.kill(pid, signal.SIGKILL)
+            with contextlib.suppress(ProcessLookupError, ChildProcessError):
+                os.waitpid(pid, 0)
+            self.children.pop(pid)
+        self.sock.close()
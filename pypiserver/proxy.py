@@ -0,0 +1,296 @@
+"""A caching pull-through proxy of an upstream package index.
+
+With `--proxy-cache`, the projects that no package directory holds are
+looked up on the upstream index of `--fallback-url` rather than redirected
+to it. Their `/simple/<project>/` pages list the upstream files, linked
+through this server: a file is downloaded from upstream the first time it is
+requested, checked against the upstream digest, and stored in the proxy
+cache directory, which is served as one more package directory.
+
+The upstream pages are cached in memory for `--proxy-index-ttl` seconds,
+and the projects upstream does not know for `--proxy-negative-ttl`. When
+upstream cannot be reached, the expired pages are served. Concurrent
+requests for the same page or file share a single upstream request.
+"""
+
+import concurrent.futures
+import hashlib
+import html.parser
+import logging
+import os
+import posixpath
+import tempfile
+import threading
+import time
+import typing as t
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+
+from .layout import Layout
+from .pkg_helpers import guess_pkgname_and_version, normalize_pkgname
+
+log = logging.getLogger(__name__)
+
+# Seconds to wait for upstream
+TIMEOUT = 30.0
+# The number of upstream pages cached
+MAX_CACHED_PAGES = 4096
+# The attributes of upstream links passed on, among PEP 503 and 592 ones
+LINK_ATTRIBUTES = ("data-requires-python", "data-yanked")
+_CHUNK_SIZE = 2**16
+
+T = t.TypeVar("T")
+# The expiry of a cached page, and its links, or None if upstream does not
+# know the project
+CachedPage = t.Tuple[float, t.Optional[t.List["Link"]]]
+
+
+class UpstreamError(Exception):
+    """Upstream could not be reached, or failed."""
+
+
+class Link(t.NamedTuple):
+    """A file of an upstream project page."""
+
+    filename: str
+    url: str
+    # The `<algorithm>=<hex digest>` fragment of the link, if any
+    digest: t.Optional[str]
+    # The attributes among `LINK_ATTRIBUTES`
+    attributes: t.Tuple[t.Tuple[str, str], ...]
+
+
+class _LinkParser(html.parser.HTMLParser):
+    def __init__(self, page_url: str):
+        super().__init__()
+        self.page_url = page_url
+        self.links: t.List[Link] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        attributes = dict(attrs)
+        href = attributes.get("href")
+        if not href:
+            return
+        url = urllib.parse.urljoin(self.page_url, href)
+        url, _, fragment = url.partition("#")
+        filename = urllib.parse.unquote(
+            posixpath.basename(urllib.parse.urlsplit(url).path)
+        )
+        # Nothing but package files, stored where the layout puts them
+        if filename.startswith(".") or "\\" in filename:
+            return
+        if guess_pkgname_and_version(filename) is None:
+            return
+        self.links.append(
+            Link(
+                filename,
+                url,
+                fragment if "=" in fragment else None,
+                tuple(
+                    (name, value or "")
+                    for name, value in attrs
+                    if name in LINK_ATTRIBUTES
+                ),
+            )
+        )
+
+
+def parse_links(page: str, page_url: str) -> t.List[Link]:
+    """The package links of a PEP 503 project page."""
+    parser = _LinkParser(page_url)
+    parser.feed(page)
+    parser.close()
+    return parser.links
+
+
+class _SharedCalls:
+    """Runs a single call at a time per key, whose result is shared with the
+    callers asking for the same key meanwhile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: t.Dict[t.Hashable, concurrent.futures.Future] = {}
+
+    def run(self, key: t.Hashable, fn: t.Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            first = call is None
+            if first:
+                call = self._calls[key] = concurrent.futures.Future()
+        if not first:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class Proxy:
+    """Proxies the upstream index at `upstream_url`, storing its files in
+    `cache_root` where `layout` puts them."""
+
+    def __init__(
+        self,
+        cache_root: Path,
+        upstream_url: str,
+        layout: Layout,
+        index_ttl: float,
+        negative_ttl: float,
+        timeout: float = TIMEOUT,
+        clock: t.Callable[[], float] = time.monotonic,
+    ):
+        self.cache_root = Path(cache_root)
+        self.upstream_url = upstream_url.rstrip("/") + "/"
+        self.layout = layout
+        self.index_ttl = index_ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.clock = clock
+        # Normalized project name -> cached page
+        self._pages: "OrderedDict[str, CachedPage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._calls = _SharedCalls()
+
+    def _open(self, url: str, accept: str) -> t.Any:
+        # pylint: disable=import-outside-toplevel
+        from pypiserver import __version__
+
+        request = urllib.request.Request(
+            url,
+            headers={
+                "Accept": accept,
+                "User-Agent": f"pypiserver/{__version__}",
+            },
+        )
+        return urllib.request.urlopen(request, timeout=self.timeout)
+
+    def _fetch_links(self, project: str) -> t.Optional[t.List[Link]]:
+        url = f"{self.upstream_url}{urllib.parse.quote(project)}/"
+        try:
+            with self._open(url, "text/html") as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                page = response.read().decode(charset, "replace")
+                page_url = response.geturl()
+        except urllib.error.HTTPError as exc:
+            if exc.code in (404, 410):
+                return None
+            raise UpstreamError(f"{url}: {exc}") from exc
+        except (OSError, ValueError) as exc:
+            raise UpstreamError(f"{url}: {exc}") from exc
+        return parse_links(page, page_url)
+
+    def _cache_links(
+        self, project: str, links: t.Optional[t.List[Link]]
+    ) -> t.Optional[t.List[Link]]:
+        ttl = self.negative_ttl if links is None else self.index_ttl
+        with self._lock:
+            self._pages[project] = (self.clock() + ttl, links)
+            self._pages.move_to_end(project)
+            while len(self._pages) > MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        return links
+
+    def project_links(self, project: str) -> t.Optional[t.List[Link]]:
+        """The links of the upstream page of `project`, or None if upstream
+        does not know it.
+
+        :raises UpstreamError: if upstream failed, and the page was never
+            fetched
+        """
+        project = normalize_pkgname(project)
+        with self._lock:
+            cached = self._pages.get(project)
+        if cached is not None and cached[0] > self.clock():
+            return cached[1]
+        try:
+            return self._calls.run(
+                ("page", project),
+                lambda: self._cache_links(project, self._fetch_links(project)),
+            )
+        except UpstreamError:
+            if cached is None:
+                raise
+            log.warning("Serving the expired upstream page of %s", project)
+            return cached[1]
+
+    def package_path(self, filename: str) -> str:
+        """The path of a proxied file, relative to the cache root and the
+        `/packages/` listing."""
+        path = self.layout.package_path(filename)
+        assert path is not None, filename
+        return path.replace(os.sep, "/")
+
+    def _download(self, link: Link, path: Path) -> Path:
+        if path.exists():
+            return path
+        algorithm, _, expected = (link.digest or "").partition("=")
+        try:
+            digest = hashlib.new(algorithm) if expected else None
+        except ValueError:
+            digest = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Hidden until complete, for the package directory scans to skip it
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, prefix=f".{path.name}.", delete=False
+        ) as part:
+            try:
+                try:
+                    with self._open(link.url, "*/*") as response:
+                        for chunk in iter(
+                            lambda: response.read(_CHUNK_SIZE), b""
+                        ):
+                            part.write(chunk)
+                            if digest is not None:
+                                digest.update(chunk)
+                except (OSError, ValueError) as exc:
+                    raise UpstreamError(f"{link.url}: {exc}") from exc
+                if digest is not None and digest.hexdigest() != expected:
+                    raise UpstreamError(
+                        f"{link.url}: the {algorithm} digest does not match"
+                    )
+            except BaseException:
+                part.close()
+                os.unlink(part.name)
+                raise
+        os.replace(part.name, path)
+        log.info("Cached %s from upstream", path.name)
+        return path
+
+    def fetch(self, filename: str) -> t.Optional[Path]:
+        """The path of the proxied file `filename` in the cache root,
+        downloading it first if needed, or None if upstream does not have
+        it.
+
+        :raises UpstreamError: if upstream failed
+        """
+        path = self.cache_root / self.package_path(filename)
+        if path.exists():
+            return path
+        guessed = guess_pkgname_and_version(filename)
+        if guessed is None:
+            return None
+        link = next(
+            (
+                link
+                for link in self.project_links(guessed[0]) or ()
+                if link.filename == filename
+            ),
+            None,
+        )
+        if link is None:
+            return None
+        return self._calls.run(
+            ("file", filename), lambda: self._download(link, path)
+        )
@@ -0,0 +1,149 @@
+"""Precompiled renderers for the index pages.
+
+The hot routes (`/simple/`, `/simple/<project>/` and `/packages/`) used to
+render inline `SimpleTemplate` strings, which evaluates and escapes every
+link in Python on each request. The renderers below produce byte-identical
+HTML with plain string joins. Link targets are built by appending each
+package's path to the (pre-escaped) URL of the `/packages/` listing, rather
+than resolving every link against the request URL.
+
+Run `benchmarks/bench_render.py` to compare them with the templates.
+"""
+
+import itertools
+import os
+import typing as t
+
+from .bottle_wrapper import html_escape
+
+if t.TYPE_CHECKING:
+    from .core import PkgFile
+    from .proxy import Link
+
+# The number of links rendered at once when streaming a listing.
+LISTING_CHUNK_SIZE = 1000
+
+_HEADER = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+        <title>{title}</title>
+    </head>
+    <body>
+        <h1>{title}</h1>
+"""
+_FOOTER = """    </body>
+</html>
+    """
+
+
+def render_simple_index(projects: t.Iterable[str]) -> str:
+    """Render the `/simple/` page, linking to every project."""
+    esc = html_escape
+    return "".join(
+        [
+            _HEADER.format(title="Simple Index"),
+            *[
+                f'                <a href="{p}/">{p}</a><br>\n'
+                for p in map(esc, projects)
+            ],
+            _FOOTER,
+        ]
+    )
+
+
+def render_project_links(
+    project: str,
+    packages_url: str,
+    packages: t.Iterable["PkgFile"],
+    sign: t.Optional[t.Callable[[str], str]] = None,
+) -> str:
+    """Render the `/simple/<project>/` page.
+
+    :param project: the (normalized) project name
+    :param packages_url: the URL of the `/packages/` listing, which package
+        links are relative to
+    :param packages: the packages of the project, in display order
+    :param sign: if given, returns the query string added to the link of the
+        package at the given path
+    """
+    esc = html_escape
+    base = esc(packages_url)
+    parts = [_HEADER.format(title=f"Links for {esc(project)}")]
+    append = parts.append
+    for pkg in packages:
+        href = pkg.fname_and_hash
+        if sign is not None:
+            path = pkg.relfn_unix
+            href = f"{path}?{sign(path)}{href[len(path) :]}"  # type: ignore
+        append(
+            f'            <a href="{base}{esc(href)}">'
+            f"{esc(os.path.basename(pkg.relfn))}</a><br>\n"  # type: ignore
+        )
+    append(_FOOTER)
+    return "".join(parts)
+
+
+def render_proxied_links(
+    project: str,
+    packages_url: str,
+    links: t.Iterable[t.Tuple[str, "Link"]],
+    sign: t.Optional[t.Callable[[str], str]] = None,
+) -> str:
+    """Render the `/simple/<project>/` page of a proxied project.
+
+    :param project: the (normalized) project name
+    :param packages_url: the URL of the `/packages/` listing, which links are
+        relative to
+    :param links: the path of each upstream file, relative to the listing,
+        and its upstream link
+    :param sign: if given, returns the query string added to the link of the
+        file at the given path
+    """
+    esc = html_escape
+    base = esc(packages_url)
+    parts = [_HEADER.format(title=f"Links for {esc(project)}")]
+    append = parts.append
+    for path, link in links:
+        href = f"{path}?{sign(path)}" if sign is not None else path
+        if link.digest:
+            href = f"{href}#{link.digest}"
+        attributes = "".join(
+            f' {name}="{esc(value)}"' for name, value in link.attributes
+        )
+        append(
+            f'            <a href="{base}{esc(href)}"{attributes}>'
+            f"{esc(link.filename)}</a><br>\n"
+        )
+    append(_FOOTER)
+    return "".join(parts)
+
+
+def render_listing(
+    title: str, packages_url: str, packages: t.Iterable["PkgFile"]
+) -> t.Iterator[str]:
+    """Render a package listing page in chunks of `LISTING_CHUNK_SIZE` links,
+    without ever building the whole page in memory.
+
+    :param title: the page title
+    :param packages_url: the URL of the `/packages/` listing, which package
+        links are relative to
+    :param packages: the packages to list, in display order
+    """
+    esc = html_escape
+    base = esc(packages_url)
+    yield _HEADER.format(title=esc(title))
+    packages = iter(packages)
+    while True:
+        chunk = list(itertools.islice(packages, LISTING_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield "".join(
+            [
+                f'            <a href="{base}{esc(pkg.fname_and_hash)}">'
+                f"{esc(pkg.relfn_unix)}</a><br>\n"  # type: ignore
+                for pkg in chunk
+            ]
+        )
+    yield _FOOTER
@@ -0,0 +1,147 @@
+"""Listing of the files within package roots.
+
+Roots are walked with `os.scandir`, relying on the file types it reports so
+that regular files are not stat-ed one by one. Hidden files and directories
+(and whatever they contain) are never listed, and symlinked directories are
+not followed.
+"""
+
+import concurrent.futures
+import os
+import typing as t
+
+PathLike = t.Union[str, os.PathLike]
+
+
+class ListedFile(t.NamedTuple):
+    """A file found by `scan_listed_files`."""
+
+    path: str
+    name: str
+    # Only collected on request
+    size: t.Optional[int] = None
+    mtime: t.Optional[float] = None
+
+    def __fspath__(self) -> str:
+        return self.path
+
+
+def scan_directory(
+    path: str, with_stat: bool = False
+) -> t.Tuple[t.List[ListedFile], t.List[str]]:
+    """List the files and the subdirectories (that are to be walked) of a
+    single directory, in directory order.
+    """
+    files: t.List[ListedFile] = []
+    subdirs: t.List[str] = []
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return files, subdirs
+    with entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                try:
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                except OSError:
+                    pass
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                if with_stat:
+                    stat = entry.stat()
+                    files.append(
+                        ListedFile(
+                            entry.path, entry.name, stat.st_size, stat.st_mtime
+                        )
+                    )
+                    continue
+            except OSError:
+                continue
+            files.append(ListedFile(entry.path, entry.name))
+    return files, subdirs
+
+
+def scan_listed_files(
+    root: PathLike, with_stat: bool = False
+) -> t.Iterator[ListedFile]:
+    """Walk `root` like `os.walk` (top-down, not following symlinked
+    directories) and yield the regular files that are not hidden, and not
+    within hidden directories.
+
+    The walk relies on the file types reported by `os.scandir`, so that
+    regular files are not stat-ed one by one. With `with_stat`, the size and
+    mtime of every file are collected from the same directory entry.
+    """
+    pending = [os.fspath(root)]
+    while pending:
+        files, subdirs = scan_directory(pending.pop(), with_stat)
+        yield from files
+        # Depth-first, in directory order
+        pending.extend(reversed(subdirs))
+
+
+def scan_listed_files_parallel(
+    roots: t.Sequence[PathLike], workers: int, with_stat: bool = False
+) -> t.List[t.List[ListedFile]]:
+    """Scan several roots at once with up to `workers` threads, returning
+    the files of each root exactly as `scan_listed_files` would list them.
+
+    The roots are listed first, then every one of their top-level
+    subdirectories is walked as a separate task. The results are merged in
+    the serial walk order, whichever task finishes first.
+    """
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="pypiserver-scan"
+    ) as pool:
+        tops = list(
+            pool.map(
+                lambda root: scan_directory(os.fspath(root), with_stat), roots
+            )
+        )
+        subdir_files = pool.map(
+            lambda subdir: list(scan_listed_files(subdir, with_stat)),
+            [subdir for _, subdirs in tops for subdir in subdirs],
+        )
+        results = []
+        for files, subdirs in tops:
+            files = list(files)
+            for _ in subdirs:
+                files.extend(next(subdir_files))
+            results.append(files)
+    return results
+
+
+def count_directories(root: PathLike, limit: t.Optional[int] = None) -> int:
+    """Count `root` and all the directories below it, hidden ones included,
+    without following symlinks: the directories that watching `root`
+    recursively takes an inotify watch for.
+
+    Counting stops as soon as the count goes past `limit`.
+    """
+    count = 0
+    pending = [os.fspath(root)]
+    while pending:
+        path = pending.pop()
+        count += 1
+        if limit is not None and count > limit:
+            break
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            continue
+    return count
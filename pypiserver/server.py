@@ -0,0 +1,255 @@
+"""The built-in threaded WSGI server, used when no other one is installed.
+
+Unlike the single-threaded `wsgiref` server, it serves connections from a
+bounded pool of threads: one slow download no longer blocks the indexes.
+Connections waiting for a thread are queued, up to one per thread, then
+left in the listen backlog. Connections are kept alive between HTTP/1.1
+requests with a known length and no body, for `keepalive_timeout` seconds,
+unless other connections are waiting for their threads.
+"""
+
+import logging
+import queue
+import socket
+import threading
+import time
+import typing as t
+from wsgiref.simple_server import (
+    ServerHandler,
+    WSGIRequestHandler,
+    WSGIServer,
+)
+
+from .bottle_wrapper import ServerAdapter
+
+log = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 16
+DEFAULT_BACKLOG = 128
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_KEEPALIVE_TIMEOUT = 5.0
+
+# How long accepting waits for a free thread before checking for shutdown
+_QUEUE_POLL_INTERVAL = 0.5
+
+
+class _ServerHandler(ServerHandler):
+    http_version = "1.1"
+
+    def cleanup_headers(self) -> None:
+        super().cleanup_headers()
+        request_handler = self.request_handler
+        # Without a length, the end of the body is the end of the connection
+        if (
+            "Content-Length" not in self.headers
+            or self.headers.get("Connection", "").lower() == "close"
+        ):
+            request_handler.close_connection = True
+        if request_handler.close_connection and "Connection" not in (
+            self.headers
+        ):
+            self.headers["Connection"] = "close"
+
+    def handle_error(self) -> None:
+        # The response may be cut short
+        self.request_handler.close_connection = True
+        super().handle_error()
+
+
+class RequestHandler(WSGIRequestHandler):
+    """Handles the requests of a connection until it is closed."""
+
+    protocol_version = "HTTP/1.1"
+    server: "ThreadPoolWSGIServer"
+
+    def setup(self) -> None:
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+    def handle(self) -> None:
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.server.keep_alive(self):
+            self.handle_one_request(idle=True)
+
+    def handle_one_request(self, idle: bool = False) -> None:
+        self.close_connection = True
+        if idle:
+            self.connection.settimeout(self.server.keepalive_timeout)
+            self.server.idle.add(self.connection)
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (TimeoutError, ConnectionError):
+            return
+        finally:
+            if idle:
+                self.server.idle.discard(self.connection)
+                self.connection.settimeout(self.timeout)
+        if not self.raw_requestline:
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            return
+        if not self.parse_request():
+            return
+        if (
+            self.request_version != "HTTP/1.1"
+            # Whatever the application did not read would be taken for the
+            # next request
+            or self.headers.get("Content-Length", "0") != "0"
+            or "Transfer-Encoding" in self.headers
+            or not self.server.keep_alive(self)
+        ):
+            self.close_connection = True
+
+        handler = _ServerHandler(
+            self.rfile,
+            self.wfile,
+            self.get_stderr(),
+            self.get_environ(),
+            multithread=True,
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+class ThreadPoolWSGIServer(WSGIServer):
+    """A WSGI server handling connections with a fixed number of threads.
+
+    Closing the server finishes the requests in flight and the queued
+    connections, waiting up to `graceful_timeout` seconds (forever if None).
+    """
+
+    def __init__(
+        self,
+        server_address: t.Tuple[str, int],
+        handler_class: t.Type[RequestHandler] = RequestHandler,
+        threads: int = DEFAULT_THREADS,
+        backlog: int = DEFAULT_BACKLOG,
+        timeout: t.Optional[float] = DEFAULT_TIMEOUT,
+        keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+        graceful_timeout: t.Optional[float] = None,
+        bind_and_activate: bool = True,
+    ):
+        if ":" in server_address[0]:
+            self.address_family = socket.AF_INET6
+        self.request_queue_size = backlog
+        # 0 disables the timeouts
+        self.request_timeout = timeout or None
+        self.keepalive_timeout = keepalive_timeout
+        self.graceful_timeout = graceful_timeout
+        self.requests: "queue.Queue[t.Tuple[t.Any, t.Any]]" = queue.Queue(
+            maxsize=threads
+        )
+        # The connections waiting for their next request
+        self.idle: t.Set[socket.socket] = set()
+        self.closing = False
+        # The number of threads serving a connection
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+        self.threads = [
+            threading.Thread(
+                target=self._work,
+                name=f"pypiserver-http-{i}",
+                daemon=True,
+            )
+            for i in range(threads)
+        ]
+        super().__init__(server_address, handler_class, bind_and_activate)
+        for thread in self.threads:
+            thread.start()
+
+    def keep_alive(self, handler: RequestHandler) -> bool:
+        """Whether a connection may wait for its next request, rather than
+        leave its thread to the connections queued."""
+        return self.keepalive_timeout > 0 and not (
+            self.closing or self.requests.qsize()
+        )
+
+    def process_request(self, request, client_address) -> None:
+        while True:
+            try:
+                self.requests.put(
+                    (request, client_address), timeout=_QUEUE_POLL_INTERVAL
+                )
+                if self.busy >= len(self.threads):
+                    self._close_idle()
+                return
+            except queue.Full:
+                if self.closing:
+                    self.shutdown_request(request)
+                    return
+
+    def _work(self) -> None:
+        while True:
+            try:
+                request, client_address = self.requests.get(
+                    timeout=_QUEUE_POLL_INTERVAL
+                )
+            except queue.Empty:
+                # Once closing, the queued connections are served first
+                if self.closing:
+                    return
+                continue
+            with self._busy_lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:  # pylint: disable=broad-except
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._busy_lock:
+                    self.busy -= 1
+
+    def _close_idle(self) -> None:
+        """Close a connection waiting for its next request, so that its
+        thread serves the connections queued."""
+        try:
+            conn = self.idle.pop()
+        except KeyError:
+            return
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def shutdown(self) -> None:
+        self.closing = True
+        super().shutdown()
+
+    def server_close(self) -> None:
+        self.closing = True
+        super().server_close()
+        while self.idle:
+            self._close_idle()
+        deadline = (
+            None
+            if self.graceful_timeout is None
+            else time.monotonic() + self.graceful_timeout
+        )
+        for thread in self.threads:
+            thread.join(
+                None
+                if deadline is None
+                else max(deadline - time.monotonic(), 0)
+            )
+        busy = sum(thread.is_alive() for thread in self.threads)
+        if busy:
+            log.warning("Left %d requests unfinished", busy)
+
+
+class ThreadedServer(ServerAdapter):
+    """Runs a `ThreadPoolWSGIServer` for bottle."""
+
+    def run(self, handler):  # pragma: no cover
+        server = ThreadPoolWSGIServer((self.host, self.port), **self.options)
+        server.set_app(handler)
+        self.port = server.server_port
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
@@ -0,0 +1,343 @@
+"""Immutable catalog snapshots, shared between processes.
+
+Under a pre-fork server, every worker would otherwise scan the package roots
+and hold a catalog of its own. Instead, the packages can be written once to
+a snapshot file, which all workers memory-map read-only: its pages are
+shared through the page cache, and nothing is parsed up front. `PkgFile`
+objects are only materialized for the packages a request iterates over.
+
+A snapshot is published by writing it to a temporary file, then renaming it
+over the previous one. Readers that mapped the previous generation keep
+using it until they notice the new file (see `SnapshotReader`).
+
+The file holds, in native byte order and 8-byte aligned sections:
+
+- a header (see `_HEADER`)
+- the interned strings (roots, relative paths, names, versions, digests),
+  encoded back to back, and where each one ends
+- one row of 5 string indexes per package, in listing order: root,
+  relative path, name, version and digest (`_NONE` if unknown)
+- the sorted projects, as (name, start, end) into the next section
+- the rows of every project, in project order
+"""
+
+import bisect
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import typing as t
+from array import array
+
+from .core import PkgFile
+from .pkg_helpers import normalize_pkgname, parse_version
+
+log = logging.getLogger(__name__)
+
+PathLike = t.Union[str, os.PathLike]
+
+_MAGIC = b"PYPISNP1"
+# magic, generation, strings, rows, projects
+_HEADER = struct.Struct("=8sQQQQ")
+_ROW_FIELDS = 5
+_NONE = 0xFFFFFFFF
+_ENCODING = ("utf-8", "surrogateescape")
+
+
+class SnapshotError(ValueError):
+    """A file is not a valid snapshot."""
+
+
+def _padded(data: bytes) -> bytes:
+    return data + b"\0" * (-len(data) % 8)
+
+
+def write_snapshot(
+    path: PathLike,
+    packages: t.Iterable[PkgFile],
+    projects: t.Iterable[t.Tuple[str, t.Iterable[PkgFile]]],
+    generation: int,
+    digest: t.Callable[[PkgFile], t.Optional[str]] = lambda pkg: None,
+) -> None:
+    """Atomically publish a snapshot.
+
+    :param packages: all packages, in listing order
+    :param projects: the normalized project names, sorted, along with their
+        packages in project order
+    :param digest: the known digest of a package, if any
+    """
+    strings: t.Dict[str, int] = {}
+    data = bytearray()
+    ends = array("Q")
+
+    def intern(value: t.Optional[str]) -> int:
+        if value is None:
+            return _NONE
+        idx = strings.get(value)
+        if idx is None:
+            idx = strings[value] = len(ends)
+            data.extend(value.encode(*_ENCODING))
+            ends.append(len(data))
+        return idx
+
+    rows = array("I")
+    row_numbers: t.Dict[t.Optional[str], int] = {}
+    for pkg in packages:
+        row_numbers[pkg.fn] = len(rows) // _ROW_FIELDS
+        rows.extend(
+            (
+                intern(pkg.root or ""),
+                intern(pkg.relfn or ""),
+                intern(pkg.pkgname),
+                intern(pkg.version),
+                intern(pkg.digest or digest(pkg)),
+            )
+        )
+    row_count = len(rows) // _ROW_FIELDS
+
+    project_table = array("I")
+    project_rows = array("I")
+    for name, project_packages in projects:
+        start = len(project_rows)
+        project_rows.extend(row_numbers[pkg.fn] for pkg in project_packages)
+        project_table.extend((intern(name), start, len(project_rows)))
+
+    header = _HEADER.pack(
+        _MAGIC, generation, len(ends), row_count, len(project_table) // 3
+    )
+    tmp = f"{os.fspath(path)}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            for section in (
+                header,
+                ends.tobytes(),
+                data,
+                rows.tobytes(),
+                project_table.tobytes(),
+                project_rows.tobytes(),
+            ):
+                f.write(_padded(section))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class _Packages(t.Sequence[PkgFile]):
+    """A read-only sequence of the packages of a snapshot."""
+
+    __slots__ = ("_snapshot", "_rows")
+
+    def __init__(self, snapshot: "Snapshot", rows: t.Union[memoryview, range]):
+        self._snapshot = snapshot
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return _Packages(self._snapshot, self._rows[index])
+        return self._snapshot.package(self._rows[index])
+
+    def __iter__(self) -> t.Iterator[PkgFile]:
+        package = self._snapshot.package
+        for row in self._rows:
+            yield package(row)
+
+
+class _ProjectNames(t.Sequence[str]):
+    """The sorted project names of a snapshot, decoded on access."""
+
+    __slots__ = ("_snapshot",)
+
+    def __init__(self, snapshot: "Snapshot"):
+        self._snapshot = snapshot
+
+    def __len__(self) -> int:
+        return len(self._snapshot._projects) // 3
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        snapshot = self._snapshot
+        return snapshot.string(snapshot._projects[3 * index])
+
+
+class Snapshot:
+    """A snapshot, memory-mapped read-only.
+
+    :param digester: set on the packages whose digest is not in the
+        snapshot
+    """
+
+    def __init__(
+        self,
+        path: PathLike,
+        digester: t.Optional[t.Callable[[PkgFile], t.Optional[str]]] = None,
+    ):
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as exc:
+                raise SnapshotError(f"{path}: {exc}") from exc
+        self.digester = digester
+        buffer = memoryview(self._mmap)
+        if len(buffer) < _HEADER.size:
+            raise SnapshotError(f"{path}: truncated")
+        magic, self.generation, strings, rows, projects = _HEADER.unpack_from(
+            buffer
+        )
+        if magic != _MAGIC:
+            raise SnapshotError(f"{path}: not a snapshot")
+
+        offset = _HEADER.size + (-_HEADER.size % 8)
+
+        def section(size: int, fmt: str = "B") -> memoryview:
+            nonlocal offset
+            end = offset + size * struct.calcsize(fmt)
+            if end > len(buffer):
+                raise SnapshotError(f"{path}: truncated")
+            view = buffer[offset:end].cast(fmt)
+            offset = end + (-end % 8)
+            return view
+
+        self._ends = section(strings, "Q")
+        self._data = section(self._ends[-1] if strings else 0)
+        self._rows = section(rows * _ROW_FIELDS, "I")
+        # The rows are in listing order
+        self._listing = range(rows)
+        self._projects = section(projects * 3, "I")
+        self._project_rows = section(self._projects[-1] if projects else 0, "I")
+        self._names = _ProjectNames(self)
+
+    def __len__(self) -> int:
+        return len(self._listing)
+
+    def __iter__(self) -> t.Iterator[PkgFile]:
+        return iter(self.sorted_packages())
+
+    def string(self, idx: int) -> str:
+        start = self._ends[idx - 1] if idx else 0
+        return bytes(self._data[start : self._ends[idx]]).decode(*_ENCODING)
+
+    def package(self, row: int) -> PkgFile:
+        """Materialize the package of a row."""
+        fields = self._rows[row * _ROW_FIELDS : (row + 1) * _ROW_FIELDS]
+        root_idx, relfn_idx, name_idx, version_idx, digest_idx = fields
+        root, relfn = self.string(root_idx), self.string(relfn_idx)
+        pkg = PkgFile.__new__(PkgFile)
+        pkg.pkgname = self.string(name_idx)
+        pkg.pkgname_norm = normalize_pkgname(pkg.pkgname)
+        pkg.version = self.string(version_idx)
+        pkg.parsed_version = parse_version(pkg.version)
+        pkg.fn = f"{root}{os.sep}{relfn}"
+        pkg.root = root
+        pkg.relfn = relfn
+        pkg.relfn_unix = relfn.replace("\\", "/")
+        pkg.replaces = None
+        pkg.digest = None if digest_idx == _NONE else self.string(digest_idx)
+        pkg.digester = self.digester
+        return pkg
+
+    def sorted_packages(self) -> t.Sequence[PkgFile]:
+        """Return all packages in listing order."""
+        return _Packages(self, self._listing)
+
+    def projects(self) -> t.Sequence[str]:
+        """Return the sorted normalized names of all projects."""
+        return self._names
+
+    def find_project(self, project_norm: str) -> t.Sequence[PkgFile]:
+        """Return the packages of a project, in project order."""
+        idx = bisect.bisect_left(self._names, project_norm)
+        if idx == len(self._names) or self._names[idx] != project_norm:
+            return ()
+        _, start, end = self._projects[3 * idx : 3 * idx + 3]
+        return _Packages(self, self._project_rows[start:end])
+
+
+class SnapshotReader:
+    """Hands out the latest published snapshot of a file, checking for a
+    new generation at most every `interval` seconds."""
+
+    def __init__(
+        self,
+        path: PathLike,
+        interval: float,
+        digester: t.Optional[t.Callable[[PkgFile], t.Optional[str]]] = None,
+    ):
+        self.path = path
+        self.interval = interval
+        self.digester = digester
+        self._snapshot: t.Optional[Snapshot] = None
+        # The stat of the file last found invalid, not to map it again
+        self._invalid: t.Optional[os.stat_result] = None
+        self._checked_at: t.Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> t.Optional[Snapshot]:
+        """The latest snapshot, or None if none was published yet."""
+        now = time.monotonic()
+        if self._checked_at is not None and (
+            now - self._checked_at < self.interval
+        ):
+            return self._snapshot
+        with self._lock:
+            self._checked_at = now
+            return self._reload()
+
+    def _reload(self) -> t.Optional[Snapshot]:
+        snapshot = self._snapshot
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return snapshot
+        if snapshot is not None and _same_file(stat, snapshot.stat):
+            return snapshot
+        if self._invalid is not None and _same_file(stat, self._invalid):
+            return snapshot
+        # The previous generation stays mapped as long as it is referenced
+        try:
+            self._snapshot = Snapshot(self.path, self.digester)
+        except SnapshotError as exc:
+            self._invalid = stat
+            log.error("Keeping the previous snapshot: %s", exc)
+            return snapshot
+        self._invalid = None
+        return self._snapshot
+
+    def refresh(self) -> t.Optional[Snapshot]:
+        """Check for a new generation right away."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            return self._reload()
+
+
+def _same_file(stat: os.stat_result, other: os.stat_result) -> bool:
+    return (
+        os.path.samestat(stat, other) and stat.st_mtime_ns == other.st_mtime_ns
+    )
+
+
+def snapshot_generation(path: PathLike) -> int:
+    """The generation of a published snapshot, or 0 if there is none."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+    except FileNotFoundError:
+        return 0
+    if len(header) < _HEADER.size:
+        return 0
+    magic, generation, *_ = _HEADER.unpack(header)
+    return generation if magic == _MAGIC else 0
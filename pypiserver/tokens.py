@@ -0,0 +1,168 @@
+"""API tokens, signed with a secret key rather than checked against a
+password file.
+
+A token names a user, the actions it allows (as for `--authenticate`) and
+when it expires, if ever, signed with an HMAC of the key of `--token-key`.
+Clients send it as the password of the `__token__` user, as for PyPI, and
+checking it is a constant-time comparison of the HMAC: the key is read once
+at startup, and no password hash is computed. All tokens are revoked by
+replacing the key.
+
+The same key signs the download URLs of `--signed-urls`: the links of the
+`/simple/<project>/` pages then carry an expiry and an HMAC of it and of the
+package path, which are accepted instead of credentials. The URLs of all
+pages rendered within a window of the URL lifetime expire at the same time,
+so that they are the same for every client, and shared caches may serve a
+package to all of them.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import time
+import typing as t
+
+# The user name tokens are sent with
+TOKEN_USER = "__token__"
+ACTIONS = ("download", "list", "update")
+# The size of new keys, in bytes
+KEY_SIZE = 32
+# Keys shorter than this are refused, in bytes
+MIN_KEY_SIZE = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def create_key(path: pathlib.Path) -> bytes:
+    """Write a new random key to `path`, readable by its owner only.
+
+    :raises FileExistsError: if `path` exists
+    """
+    key = os.urandom(KEY_SIZE)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key.hex() + "\n")
+    return key
+
+
+def load_key(path: pathlib.Path) -> bytes:
+    """Read the hex-encoded key at `path`.
+
+    :raises ValueError: if it is not a key
+    """
+    try:
+        key = bytes.fromhex(path.read_text().strip())
+    except ValueError:
+        key = b""
+    if len(key) < MIN_KEY_SIZE:
+        raise ValueError(
+            f"{path} is not a token key: it should hold at least "
+            f"{MIN_KEY_SIZE} hex-encoded bytes"
+        )
+    return key
+
+
+class Token(t.NamedTuple):
+    user: str
+    actions: t.Tuple[str, ...]
+    # Seconds since the epoch, or None for never
+    expires: t.Optional[int]
+
+
+class TokenSigner:
+    """Issues and verifies tokens signed with `key`."""
+
+    def __init__(self, key: bytes, clock: t.Callable[[], float] = time.time):
+        self.key = key
+        self.clock = clock
+
+    def _sign(self, payload: str) -> bytes:
+        return hmac.new(
+            self.key, payload.encode("ascii"), hashlib.sha256
+        ).digest()
+
+    def issue(
+        self,
+        user: str,
+        actions: t.Iterable[str],
+        lifetime: t.Optional[float] = None,
+    ) -> str:
+        """A token for `user`, allowing `actions`, valid for `lifetime`
+        seconds, or forever."""
+        expires = None if lifetime is None else int(self.clock() + lifetime)
+        claims = {"u": user, "a": sorted(set(actions)), "e": expires}
+        payload = _b64encode(
+            json.dumps(claims, separators=(",", ":")).encode("utf-8")
+        )
+        return f"{payload}.{_b64encode(self._sign(payload))}"
+
+    def decode(self, token: str) -> t.Optional[Token]:
+        """The token signed in `token`, if valid and not expired."""
+        payload, _, signature = token.partition(".")
+        try:
+            valid = hmac.compare_digest(
+                _b64decode(signature), self._sign(payload)
+            )
+        except (binascii.Error, ValueError):
+            return None
+        if not valid:
+            return None
+        claims = json.loads(_b64decode(payload))
+        decoded = Token(claims["u"], tuple(claims["a"]), claims["e"])
+        if decoded.expires is not None and decoded.expires <= self.clock():
+            return None
+        return decoded
+
+    def verify(self, token: str, action: str) -> bool:
+        """Whether `token` is valid, and allows `action`."""
+        decoded = self.decode(token)
+        return decoded is not None and action in decoded.actions
+
+
+class URLSigner:
+    """Signs the download URLs of packages, with a key derived from `key`,
+    so that no signature is ever a valid token. They are valid for
+    `lifetime` to twice as many seconds."""
+
+    def __init__(
+        self,
+        key: bytes,
+        lifetime: float,
+        clock: t.Callable[[], float] = time.time,
+    ):
+        self.key = hmac.new(key, b"download URLs", hashlib.sha256).digest()
+        self.lifetime = max(int(lifetime), 1)
+        self.clock = clock
+
+    def _sign(self, path: str, expires: int) -> str:
+        message = f"{expires}:{path}".encode("utf-8")
+        return _b64encode(hmac.new(self.key, message, hashlib.sha256).digest())
+
+    def query(self, path: str) -> str:
+        """The query string signing the package at `path`, relative to the
+        `/packages/` listing."""
+        # The end of the next window
+        expires = (int(self.clock()) // self.lifetime + 2) * self.lifetime
+        return f"expires={expires}&signature={self._sign(path, expires)}"
+
+    def verify(self, path: str, expires: str, signature: str) -> bool:
+        """Whether the `expires` and `signature` query parameters sign the
+        package at `path`, and have not expired."""
+        try:
+            expiry = int(expires)
+        except ValueError:
+            return False
+        return expiry > self.clock() and hmac.compare_digest(
+            signature.encode("ascii", "replace"),
+            self._sign(path, expiry).encode("ascii"),
+        )
@@ -0,0 +1,54 @@
+"""The `SimpleTemplate` sources the index pages used to be rendered with.
+
+They are kept as the reference for `pypiserver.render`: the tests check that
+the precompiled renderers produce byte-identical HTML, and the benchmarks
+compare against them.
+"""
+
+SIMPLE_INDEX = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+        <title>Simple Index</title>
+    </head>
+    <body>
+        <h1>Simple Index</h1>
+        % for p in links:
+                <a href="{{p}}/">{{p}}</a><br>
+        % end
+    </body>
+</html>
+    """
+
+PROJECT_LINKS = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+        <title>Links for {{project}}</title>
+    </head>
+    <body>
+        <h1>Links for {{project}}</h1>
+        % for file, href in links:
+            <a href="{{href}}">{{file}}</a><br>
+        % end
+    </body>
+</html>
+    """
+
+LISTING = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <meta charset="utf-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1">
+        <title>Index of packages</title>
+    </head>
+    <body>
+        <h1>Index of packages</h1>
+        % for file, href in links:
+            <a href="{{href}}">{{file}}</a><br>
+        % end
+    </body>
+</html>
+    """
@@ -1,6 +1,7 @@
 #! /usr/bin/env py.test
 
 # Builtin imports
+import gzip
 import os
 import pathlib
 import xmlrpc.client as xmlrpclib
@@ -192,6 +193,44 @@ def test_packages_empty(testapp):
     assert len(resp.html("a")) == 0
 
 
+def test_packages_sorted(root, testapp):
+    root.mkdir("sub").join("aaa-1.0.zip").write("")
+    root.join("bbb-1.10.zip").write("")
+    root.join("bbb-1.9.zip").write("")
+    root.join("aaa-2.0.zip").write("")
+    resp = testapp.get("/packages/")
+    assert [a.text for a in resp.html("a")] == [
+        "aaa-2.0.zip",
+        "bbb-1.9.zip",
+        "bbb-1.10.zip",
+        "sub/aaa-1.0.zip",
+    ]
+
+
+def test_packages_subdir(root, testapp):
+    root.join("foo-1.0.zip").write("")
+    root.mkdir("sub").join("foo-2.0.zip").write("")
+    root.join("sub").mkdir("nested").join("foo-3.0.zip").write("")
+    root.mkdir("sub2").join("foo-4.0.zip").write("")
+
+    resp = testapp.get("/packages/sub/")
+    assert [a.text for a in resp.html("a")] == [
+        "sub/foo-2.0.zip",
+        "sub/nested/foo-3.0.zip",
+    ]
+    assert resp.html("a")[0]["href"].startswith("/packages/sub/foo-2.0.zip#")
+
+    resp = testapp.get("/packages/sub/nested/")
+    assert [a["href"].split("#")[0] for a in resp.html("a")] == [
+        "/packages/sub/nested/foo-3.0.zip"
+    ]
+
+
+def test_packages_subdir_not_found(root, testapp):
+    root.join("foo-1.0.zip").write("")
+    testapp.get("/packages/sub/", status=404)
+
+
 def test_health_default_endpoint(testapp):
     resp = testapp.get("/health")
     assert resp.status_int == 200
@@ -500,6 +539,53 @@ def test_cache_control_set(root):
     assert resp.headers["Cache-Control"] == f"public, max-age={AGE}"
 
 
+def test_index_not_compressed_by_default(root, testapp):
+    for i in range(100):
+        root.join(f"foobar-1.{i}.zip").write("")
+    resp = testapp.get("/simple/foobar/")
+    assert "Content-Encoding" not in resp.headers
+    assert resp.headers["Vary"] == "Accept-Encoding"
+
+
+@pytest.mark.parametrize(
+    "url", ["/simple/", "/simple/foobar/", "/packages/", "/foobar/json"]
+)
+def test_index_gzip_compressed(root, testapp, url):
+    for i in range(100):
+        root.join(f"foobar-{i}.0.zip").write("")
+        root.join(f"other{i}-1.0.zip").write("")
+    plain = testapp.get(url)
+    # webtest transparently decodes responses, so go through webob directly
+    req = webtest.TestRequest.blank(
+        url, headers={"Accept-Encoding": "gzip, deflate"}
+    )
+    resp = req.get_response(testapp.app)
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert len(resp.body) < len(plain.body)
+    assert gzip.decompress(resp.body) == plain.body
+
+
+def test_index_small_responses_not_compressed(root, testapp):
+    root.join("foobar-1.0.zip").write("")
+    req = webtest.TestRequest.blank(
+        "/simple/", headers={"Accept-Encoding": "gzip"}
+    )
+    resp = req.get_response(testapp.app)
+    assert "Content-Encoding" not in resp.headers
+
+
+def test_index_compression_disabled(root):
+    from pypiserver import app
+
+    for i in range(100):
+        root.join(f"foobar-1.{i}.zip").write("")
+    req = webtest.TestRequest.blank(
+        "/simple/foobar/", headers={"Accept-Encoding": "gzip"}
+    )
+    resp = req.get_response(app(root=root.strpath, compression_level=0))
+    assert "Content-Encoding" not in resp.headers
+
+
 def test_upload_noAction(testapp):
     resp = testapp.post("/", expect_errors=1)
     assert resp.status == "400 Bad Request"
@@ -0,0 +1,290 @@
+"""Tests for the ASGI entry point, run in-process."""
+
+import asyncio
+import base64
+import concurrent.futures
+import os
+import time
+
+import pytest
+import webtest
+
+from pypiserver import asgi, tokens
+from pypiserver.config import Config
+
+CONTENT = b"0123456789" * 100
+
+
+def call(app, method, path, headers=(), body=b"", disconnect=False):
+    """Run a request through `app`, and return its status, headers and
+    body."""
+    messages = []
+
+    async def run():
+        requests = [
+            {"type": "http.request", "body": body, "more_body": False}
+        ]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            if not disconnect:
+                # Until the response is sent
+                await asyncio.Event().wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path.partition("?")[0],
+            "query_string": path.partition("?")[2].encode(),
+            "root_path": "",
+            "headers": [
+                (name.lower().encode(), value.encode())
+                for name, value in [("Host", "testserver"), *headers]
+            ],
+            "client": ("127.0.0.1", 12345),
+            "server": ("testserver", 80),
+        }
+        await app(scope, receive, send)
+
+    asyncio.run(run())
+    start, *bodies = messages
+    assert start["type"] == "http.response.start"
+    assert bodies[-1].get("more_body", False) is False
+    return (
+        start["status"],
+        {name.decode(): value.decode() for name, value in start["headers"]},
+        b"".join(message.get("body", b"") for message in bodies),
+    )
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "packages"
+    (root / "sub").mkdir(parents=True)
+    (root / "foo-1.0.zip").write_bytes(CONTENT)
+    (root / "sub" / "foo-2.0.tar.gz").write_bytes(b"tarball")
+    return root
+
+
+@pytest.fixture
+def app(root):
+    return asgi.app(roots=[root], authenticate=[], password_file=".")
+
+
+def test_routes_match_the_wsgi_app(app):
+    wsgi = webtest.TestApp(
+        app.wsgi_app, extra_environ={"HTTP_HOST": "testserver"}
+    )
+    for path in ("/", "/simple/", "/simple/foo/", "/packages/", "/foo/json"):
+        status, headers, body = call(app, "GET", path)
+        expected = wsgi.get(path)
+        assert (status, body) == (expected.status_int, expected.body), path
+        assert headers["content-type"] == expected.headers["Content-Type"]
+
+
+def test_download(app):
+    status, headers, body = call(app, "GET", "/packages/foo-1.0.zip")
+    assert (status, body) == (200, CONTENT)
+    assert headers["content-length"] == str(len(CONTENT))
+    assert headers["content-type"] == "application/zip"
+    assert headers["accept-ranges"] == "bytes"
+    assert "cache-control" not in headers
+
+    status, _, body = call(app, "GET", "/packages/sub/foo-2.0.tar.gz")
+    assert (status, body) == (200, b"tarball")
+
+
+def test_download_head(app):
+    status, headers, body = call(app, "HEAD", "/packages/foo-1.0.zip")
+    assert (status, body) == (200, b"")
+    assert headers["content-length"] == str(len(CONTENT))
+
+
+def test_download_streams_chunks(app, monkeypatch):
+    monkeypatch.setattr(asgi, "_CHUNK_SIZE", 64)
+    status, _, body = call(app, "GET", "/packages/foo-1.0.zip")
+    assert (status, body) == (200, CONTENT)
+
+
+def test_download_stops_on_disconnect(app, monkeypatch):
+    monkeypatch.setattr(asgi, "_CHUNK_SIZE", 10)
+    status, _, body = call(
+        app, "GET", "/packages/foo-1.0.zip", disconnect=True
+    )
+    assert status == 200
+    assert len(body) < len(CONTENT)
+
+
+def test_download_range(app):
+    status, headers, body = call(
+        app, "GET", "/packages/foo-1.0.zip", [("Range", "bytes=10-19")]
+    )
+    assert (status, body) == (206, CONTENT[10:20])
+    assert headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+
+    # Left to the WSGI app
+    status, _, _ = call(
+        app, "GET", "/packages/foo-1.0.zip", [("Range", "bytes=5000-")]
+    )
+    assert status == 416
+
+
+def test_download_not_modified(app, root):
+    since = time.strftime(
+        "%a, %d %b %Y %H:%M:%S GMT",
+        time.gmtime(os.stat(root / "foo-1.0.zip").st_mtime + 10),
+    )
+    status, _, body = call(
+        app, "GET", "/packages/foo-1.0.zip", [("If-Modified-Since", since)]
+    )
+    assert (status, body) == (304, b"")
+
+
+@pytest.mark.parametrize(
+    "path", ["/packages/foo-3.0.zip", "/packages/../foo-1.0.zip", "/nope/"]
+)
+def test_not_found(app, path):
+    status, _, _ = call(app, "GET", path)
+    # Unknown root URLs are redirected to /simple/
+    assert status == (303 if path == "/nope/" else 404)
+
+
+def test_download_cache_control(root):
+    app = asgi.app(
+        roots=[root], authenticate=[], password_file=".", cache_control=60
+    )
+    _, headers, _ = call(app, "GET", "/packages/foo-1.0.zip")
+    assert headers["cache-control"] == "public, max-age=60"
+
+
+def test_download_authentication(root):
+    app = asgi.ASGIApp(
+        Config.default_with_overrides(
+            roots=[root],
+            authenticate=["download"],
+            auther=lambda user, password: password == "secret",
+        )
+    )
+
+    def auth(password):
+        token = base64.b64encode(f"user:{password}".encode()).decode()
+        return [("Authorization", f"Basic {token}")]
+
+    path = "/packages/foo-1.0.zip"
+    assert call(app, "GET", path)[0] == 401
+    assert call(app, "GET", path, auth("wrong"))[0] == 403
+    assert call(app, "GET", path, auth("secret"))[:3:2] == (200, CONTENT)
+
+
+def test_download_rejected_credentials_checked_once(root):
+    checked = []
+
+    def auther(user, password):
+        checked.append(password)
+        return False
+
+    app = asgi.ASGIApp(
+        Config.default_with_overrides(
+            roots=[root], authenticate=["download"], auther=auther
+        )
+    )
+    token = base64.b64encode(b"user:wrong").decode()
+    headers = [("Authorization", f"Basic {token}")]
+    status, _, body = call(app, "GET", "/packages/foo-1.0.zip", headers)
+    assert checked == ["wrong"]
+    # The same error page as the bottle application's
+    wsgi = webtest.TestApp(
+        app.wsgi_app, extra_environ={"HTTP_HOST": "testserver"}
+    )
+    expected = wsgi.get(
+        "/packages/foo-1.0.zip", headers=dict(headers), expect_errors=True
+    )
+    assert (status, body) == (403, expected.body)
+
+
+def test_upload(app, root):
+    boundary = "boundary"
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name=":action"\r\n\r\n'
+        "file_upload\r\n"
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="content"; '
+        'filename="bar-1.0.zip"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+        "uploaded\r\n"
+        f"--{boundary}--\r\n"
+    ).encode()
+    status, _, _ = call(
+        app,
+        "POST",
+        "/",
+        [
+            ("Content-Type", f"multipart/form-data; boundary={boundary}"),
+            ("Content-Length", str(len(body))),
+        ],
+        body,
+    )
+    assert status == 200
+    assert (root / "bar-1.0.zip").read_bytes() == b"uploaded"
+    assert call(app, "GET", "/packages/bar-1.0.zip")[2] == b"uploaded"
+
+
+def test_lifespan(app):
+    sent = []
+
+    async def run():
+        messages = [{"type": "lifespan.shutdown"}, {"type": "lifespan.startup"}]
+
+        async def receive():
+            return messages.pop()
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await app({"type": "lifespan"}, receive, send)
+
+    asyncio.run(run())
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+def test_streamed_responses_move_between_threads(app):
+    # The pool may run each chunk of a response on another thread
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/packages/",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+    }
+    response = asgi._WSGIResponse(app.wsgi_app, app._environ(scope, None))
+    body = b""
+    for step in (response.start, response.next, response.next):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as thread:
+            body += thread.submit(step).result() or b""
+    assert response.status == 200
+    assert b"foo-1.0.zip" in body
+
+
+def test_download_signed_url(root, tmp_path):
+    key_file = tmp_path / "token.key"
+    tokens.create_key(key_file)
+    app = asgi.app(
+        roots=[root],
+        authenticate=["download"],
+        password_file=None,
+        token_key=key_file,
+        signed_urls=60,
+    )
+    query = app.config.url_signer.query("foo-1.0.zip")
+    path = "/packages/foo-1.0.zip"
+    assert call(app, "GET", f"{path}?{query}")[:3:2] == (200, CONTENT)
+    assert call(app, "GET", f"/packages/sub/foo-2.0.tar.gz?{query}")[0] == 401
+    assert call(app, "GET", path)[0] == 401
@@ -1,8 +1,36 @@
+import io
+import os
+import shutil
+import threading
+import types
 from pathlib import Path
 
 import pytest
+from watchdog.events import (
+    DirCreatedEvent,
+    DirDeletedEvent,
+    FileCreatedEvent,
+    FileDeletedEvent,
+    FileModifiedEvent,
+    FileMovedEvent,
+)
 
-from pypiserver.backend import listdir
+from pypiserver import backend as backend_module, cache
+from pypiserver.backend import (
+    BackendProxy,
+    CachingFileBackend,
+    SimpleFileBackend,
+    get_file_backend,
+    listdir,
+    listed_package,
+    listing_sort_key,
+    scan_listed_files,
+    scan_listed_files_parallel,
+)
+from pypiserver.scan import count_directories
+from pypiserver.cache import CacheManager, PolledRoot, _EventHandler
+from pypiserver.config import Config
+from pypiserver.pkg_helpers import is_listed_path
 
 
 def create_path(root: Path, path: Path):
@@ -40,3 +68,546 @@ def test_listdir_doesnt_generate_pkgfile_for_invalid_file(tmp_path, path_name):
     path = Path(path_name)
     create_path(tmp_path, path)
     assert not list(listdir(tmp_path))
+
+
+@pytest.mark.parametrize("backend_cls", [SimpleFileBackend, CachingFileBackend])
+def test_get_sorted_packages_across_roots(tmp_path, backend_cls):
+    roots = [tmp_path / "a", tmp_path / "b"]
+    for root in roots:
+        for path in ("foo-1.0.zip", "foo-1.10.zip", "sub/bar-2.0.zip"):
+            create_path(root, Path(path))
+    create_path(roots[1], Path("foo-1.2.zip"))
+
+    backend = backend_cls(Config.default_with_overrides(roots=roots))
+    expected = sorted(backend.get_all_packages(), key=listing_sort_key)
+    assert [p.fn for p in backend.get_sorted_packages()] == [
+        p.fn for p in expected
+    ]
+
+
+def test_caching_backend_sorted_listing_follows_invalidation(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(roots=[tmp_path])
+    )
+    assert len(list(backend.get_sorted_packages())) == 1
+
+    create_path(tmp_path, Path("foo-0.1.zip"))
+    backend.cache_manager.invalidate_root_cache(tmp_path)
+    assert [p.version for p in backend.get_sorted_packages()] == ["0.1", "1.0"]
+
+
+def test_caching_backend_updates_catalog_on_add_and_remove(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(roots=[tmp_path])
+    )
+    assert list(backend.get_sorted_projects()) == ["foo"]
+
+    backend.add_package("bar-2.0.zip", io.BytesIO(b"content"))
+    assert list(backend.get_sorted_projects()) == ["bar", "foo"]
+    assert backend.package_count() == 2
+
+    (pkg,) = backend.find_version("bar", "2.0")
+    backend.remove_package(pkg)
+    assert list(backend.get_sorted_projects()) == ["foo"]
+    assert list(backend.find_sorted_project_packages("bar")) == []
+
+
+def test_caching_backend_merges_projects_of_roots(tmp_path):
+    roots = [tmp_path / "a", tmp_path / "b"]
+    create_path(roots[0], Path("foo-1.0.zip"))
+    create_path(roots[1], Path("Foo-1.1.zip"))
+    create_path(roots[1], Path("bar-1.0.zip"))
+    backend = CachingFileBackend(Config.default_with_overrides(roots=roots))
+    assert list(backend.get_sorted_projects()) == ["bar", "foo"]
+    assert [p.version for p in backend.find_sorted_project_packages("foo")] == [
+        "1.0",
+        "1.1",
+    ]
+
+    backend.add_package("aaa-1.0.zip", io.BytesIO(b""))
+    assert list(backend.get_sorted_projects()) == ["aaa", "bar", "foo"]
+
+
+@pytest.mark.parametrize(
+    ("event_cls", "paths"),
+    [
+        (FileCreatedEvent, ["new-1.0.zip"]),
+        (FileDeletedEvent, ["foo-1.0.zip"]),
+        (FileMovedEvent, ["foo-1.0.zip", "sub/foo-1.0.zip"]),
+        (FileModifiedEvent, ["foo-1.0.zip"]),
+        (FileCreatedEvent, [".hidden-1.0.zip"]),
+        (DirDeletedEvent, ["sub"]),
+    ],
+)
+def test_cache_manager_applies_file_events(tmp_path, event_cls, paths):
+    """After any event, the cached catalog matches a fresh listing."""
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    create_path(tmp_path, Path("sub/bar-1.0.zip"))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(roots=[tmp_path])
+    )
+    list(backend.get_all_packages())
+
+    paths = [str(tmp_path / path) for path in paths]
+    if event_cls is FileMovedEvent:
+        os.rename(*paths)
+    elif event_cls is DirDeletedEvent:
+        shutil.rmtree(paths[0])
+    elif event_cls is FileDeletedEvent:
+        os.remove(paths[0])
+    else:
+        Path(paths[0]).write_bytes(b"new content")
+    _EventHandler(backend.cache_manager, str(tmp_path)).dispatch(
+        event_cls(*paths)
+    )
+
+    assert sorted(p.fn for p in backend.get_all_packages()) == sorted(
+        p.fn for p in listdir(tmp_path)
+    )
+
+
+def test_proxy_hands_out_cached_packages_as_they_are(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(roots=[tmp_path])
+    )
+    proxy = BackendProxy(backend)
+
+    packages = proxy.find_sorted_project_packages("foo")
+    assert not isinstance(packages, types.GeneratorType)
+    assert len(packages) == 1
+    assert not isinstance(proxy.get_sorted_packages(), types.GeneratorType)
+    (pkg,) = packages
+    assert pkg.digester == backend.digest
+
+
+def test_proxy_binds_digester_for_other_backends(tmp_path):
+    class PlainBackend(SimpleFileBackend):
+        binds_digester = False
+
+        def get_all_packages(self):
+            return listdir(self.roots[0])
+
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = PlainBackend(Config.default_with_overrides(roots=[tmp_path]))
+    (pkg,) = BackendProxy(backend).get_all_packages()
+    assert pkg.digester == backend.digest
+
+
+def _walk_listed_files(root: Path):
+    """The former `os.walk` based walker, for comparison."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = (d for d in dirnames if is_listed_path(Path(d)))
+        for filename in filenames:
+            filepath = root / dirpath / filename
+            if is_listed_path(Path(filename)) and filepath.is_file():
+                yield str(filepath)
+
+
+def test_scan_listed_files_walks_like_os_walk(tmp_path):
+    for path in (
+        "a-1.0.zip",
+        "sub/b-1.0.zip",
+        "sub/deeper/c-1.0.zip",
+        "sub/z-1.0.zip",
+        "other/d-1.0.zip",
+        ".hidden/e-1.0.zip",
+        "sub/.f-1.0.zip",
+        "linked/g-1.0.zip",
+    ):
+        create_path(tmp_path, Path(path))
+    (tmp_path / "file-link-1.0.zip").symlink_to(tmp_path / "a-1.0.zip")
+    (tmp_path / "broken-link-1.0.zip").symlink_to(tmp_path / "missing")
+    (tmp_path / "dir-link").symlink_to(tmp_path / "linked")
+    os.mkfifo(tmp_path / "fifo-1.0.zip")
+
+    scanned = [f.path for f in scan_listed_files(tmp_path)]
+    assert scanned == list(_walk_listed_files(tmp_path))
+    assert str(tmp_path / "file-link-1.0.zip") in scanned
+    assert str(tmp_path / "broken-link-1.0.zip") not in scanned
+    assert str(tmp_path / "dir-link" / "g-1.0.zip") not in scanned
+
+
+def test_scan_listed_files_with_stat(tmp_path):
+    (tmp_path / "a-1.0.zip").write_bytes(b"12345")
+    (listed,) = scan_listed_files(tmp_path, with_stat=True)
+    assert listed.size == 5
+    assert listed.mtime == os.stat(tmp_path / "a-1.0.zip").st_mtime
+    assert os.fspath(listed) == str(tmp_path / "a-1.0.zip")
+
+    (listed,) = scan_listed_files(tmp_path)
+    assert listed.size is None and listed.mtime is None
+
+
+@pytest.mark.parametrize("workers", [2, 8])
+def test_scan_listed_files_parallel_keeps_serial_order(tmp_path, workers):
+    roots = [tmp_path / "a", tmp_path / "b", tmp_path / "empty"]
+    for root in roots[:2]:
+        for path in (
+            "top-1.0.zip",
+            "sub/b-1.0.zip",
+            "sub/deeper/c-1.0.zip",
+            "other/d-1.0.zip",
+            ".hidden/e-1.0.zip",
+            *(f"many/p{i}/p{i}-1.0.zip" for i in range(20)),
+        ):
+            create_path(root, Path(path))
+    roots[2].mkdir()
+    roots.append(tmp_path / "missing")
+
+    scanned = scan_listed_files_parallel(roots, workers)
+    assert scanned == [list(scan_listed_files(root)) for root in roots]
+
+
+@pytest.mark.parametrize("backend_cls", [SimpleFileBackend, CachingFileBackend])
+def test_backends_scan_in_parallel(tmp_path, backend_cls):
+    roots = [tmp_path / "a", tmp_path / "b"]
+    for root in roots:
+        for path in ("foo-1.0.zip", "sub/bar-2.0.zip", "sub2/baz-3.0.zip"):
+            create_path(root, Path(path))
+
+    serial = backend_cls(Config.default_with_overrides(roots=roots))
+    parallel = backend_cls(
+        Config.default_with_overrides(roots=roots, scan_workers=4)
+    )
+    assert parallel.scan_workers == 4
+    assert [p.fn for p in parallel.get_all_packages()] == [
+        p.fn for p in serial.get_all_packages()
+    ]
+
+
+def test_polled_root_relists_changed_directories(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_RACY_NS", -(10**18))
+    for path in ("a-1.0.zip", "sub/b-1.0.zip", "gone/c-1.0.zip"):
+        create_path(tmp_path, Path(path))
+    poller = PolledRoot(str(tmp_path))
+    assert sorted(poller.walk()) == [
+        str(tmp_path / path)
+        for path in ("a-1.0.zip", "gone/c-1.0.zip", "sub/b-1.0.zip")
+    ]
+    assert poller.poll() is None
+    assert poller.poll(force=True) == ([], [])
+
+    create_path(tmp_path, Path("sub/b-2.0.zip"))
+    create_path(tmp_path, Path("new/deeper/d-1.0.zip"))
+    shutil.rmtree(tmp_path / "gone")
+    (tmp_path / "a-1.0.zip").rename(tmp_path / "a-1.1.zip")
+
+    added, removed = poller.poll(force=True)
+    assert sorted(removed) == [
+        str(tmp_path / "a-1.0.zip"),
+        str(tmp_path / "gone" / "c-1.0.zip"),
+    ]
+    assert {
+        str(tmp_path / "a-1.1.zip"),
+        str(tmp_path / "sub" / "b-2.0.zip"),
+        str(tmp_path / "new" / "deeper" / "d-1.0.zip"),
+    }.issubset(added)
+    assert str(tmp_path / "gone") not in poller.dirs
+    assert poller.poll(force=True) == ([], [])
+
+
+def test_polled_root_reports_changed_files_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "_RACY_NS", -(10**18))
+    for path in ("a-1.0.zip", "b-1.0.zip"):
+        create_path(tmp_path, Path(path))
+    poller = PolledRoot(str(tmp_path))
+    poller.walk()
+
+    create_path(tmp_path, Path("c-1.0.zip"))
+    (tmp_path / "b-1.0.zip").write_bytes(b"rewritten")
+    added, removed = poller.poll(force=True)
+    assert sorted(added) == [
+        str(tmp_path / "b-1.0.zip"),
+        str(tmp_path / "c-1.0.zip"),
+    ]
+    assert removed == []
+
+
+def test_polled_root_relists_racy_directories(tmp_path):
+    create_path(tmp_path, Path("a-1.0.zip"))
+    poller = PolledRoot(str(tmp_path))
+    poller.walk()
+    mtime_ns = os.stat(tmp_path).st_mtime_ns
+    create_path(tmp_path, Path("b-1.0.zip"))
+    os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+    # Just modified: its mtime cannot be trusted yet
+    assert poller.poll(force=True) == ([str(tmp_path / "b-1.0.zip")], [])
+    assert poller.poll(force=True) == ([], [])
+
+
+def test_caching_backend_polls_roots(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(
+            roots=[tmp_path], poll_roots=[tmp_path], poll_interval=0
+        )
+    )
+    assert [p.version for p in backend.get_sorted_packages()] == ["1.0"]
+    assert backend.cache_manager.observer is None
+
+    create_path(tmp_path, Path("sub/foo-2.0.zip"))
+    (tmp_path / "foo-1.0.zip").unlink()
+    assert [p.relfn for p in backend.get_sorted_packages()] == [
+        os.path.join("sub", "foo-2.0.zip")
+    ]
+
+    (pkg,) = backend.get_all_packages()
+    digest = backend.digest(pkg)
+    backend.add_package(
+        os.path.join("sub", "foo-2.0.zip"), io.BytesIO(b"new content")
+    )
+    assert backend.digest(pkg) != digest
+    assert backend.cache_manager.observer is None
+
+
+def test_caching_backend_polling_keeps_unrelated_digests(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(cache, "_RACY_NS", -(10**18))
+    for name in ("foo-1.0.zip", "bar-1.0.zip"):
+        create_path(tmp_path, Path(name))
+    backend = CachingFileBackend(
+        Config.default_with_overrides(
+            roots=[tmp_path], poll_roots=[tmp_path], poll_interval=0
+        )
+    )
+    for pkg in backend.get_all_packages():
+        backend.digest(pkg)
+
+    create_path(tmp_path, Path("baz-1.0.zip"))
+    assert backend.package_count() == 3
+    manager = backend.cache_manager
+    for name in ("foo-1.0.zip", "bar-1.0.zip"):
+        assert manager.cached_digest(str(tmp_path / name), "sha256")
+
+
+def test_caching_backend_polls_without_watchdog(tmp_path, monkeypatch):
+    monkeypatch.setattr(backend_module, "ENABLE_CACHING", False)
+    monkeypatch.setattr(cache, "ENABLE_CACHING", False)
+    roots = [tmp_path / "a", tmp_path / "b"]
+    for root in roots:
+        create_path(root, Path("foo-1.0.zip"))
+
+    config = Config.default_with_overrides(roots=roots, poll_roots=roots[:1])
+    with pytest.raises(RuntimeError, match="pypiserver\\[cache\\]"):
+        CachingFileBackend(config)
+    assert not isinstance(get_file_backend(config), CachingFileBackend)
+
+    config = Config.default_with_overrides(roots=roots, poll_roots=roots)
+    backend = get_file_backend(config)
+    assert isinstance(backend, CachingFileBackend)
+    assert backend.package_count() == 2
+
+
+def test_count_directories(tmp_path):
+    for path in ("a/b/c", "a/.hidden", "d"):
+        (tmp_path / path).mkdir(parents=True)
+    (tmp_path / "link").symlink_to(tmp_path / "a")
+    (tmp_path / "file").touch()
+    assert count_directories(tmp_path) == 6
+    assert count_directories(tmp_path, limit=2) == 3
+    assert count_directories(tmp_path / "missing") == 1
+
+
+def _listdir(manager, root):
+    return manager.listdir(root, listdir, listed_package)
+
+
+def test_cache_manager_counts_watches(tmp_path):
+    for path in ("a/sub/foo-1.0.zip", "b/foo-2.0.zip"):
+        create_path(tmp_path, Path(path))
+    manager = CacheManager(watch_budget=10)
+    assert len(_listdir(manager, tmp_path / "a")) == 1
+    assert len(_listdir(manager, tmp_path / "b")) == 1
+    assert manager.watch_count == 3
+    assert manager.fallback_roots == frozenset()
+
+    # Digest directories within watched roots are not watched again
+    manager.digest_file(
+        str(tmp_path / "a" / "sub" / "foo-1.0.zip"), "sha256", lambda *_: "x"
+    )
+    assert manager.watch_count == 3
+    assert len(manager.observer.emitters) == 2
+
+
+def test_cache_manager_polls_roots_over_the_watch_budget(tmp_path):
+    for path in ("a/sub/foo-1.0.zip", "b/foo-2.0.zip"):
+        create_path(tmp_path, Path(path))
+    manager = CacheManager(watch_budget=2, poll_interval=0)
+    _listdir(manager, tmp_path / "a")
+    _listdir(manager, tmp_path / "b")
+    assert manager.watch_count == 2
+    assert manager.fallback_roots == {str(tmp_path / "b")}
+
+    create_path(tmp_path, Path("b/foo-3.0.zip"))
+    assert len(_listdir(manager, tmp_path / "b")) == 2
+
+
+def test_cache_manager_polls_roots_failing_to_be_watched(
+    tmp_path, monkeypatch
+):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    manager = CacheManager(watch_budget=None, poll_interval=0)
+    _listdir(manager, tmp_path / "missing")
+    assert manager.fallback_roots == {str(tmp_path / "missing")}
+    assert manager.observer.emitters == set()
+
+    def schedule(*args, **kwargs):
+        raise OSError(28, "inotify watch limit reached")
+
+    monkeypatch.setattr(manager.observer, "schedule", schedule)
+    assert len(_listdir(manager, tmp_path)) == 1
+    assert str(tmp_path) in manager.fallback_roots
+    assert manager.watch_count == 0
+    create_path(tmp_path, Path("foo-2.0.zip"))
+    assert len(_listdir(manager, tmp_path)) == 2
+
+
+def test_cache_manager_polls_roots_outgrowing_the_watch_budget(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    manager = CacheManager(watch_budget=2, poll_interval=0)
+    _listdir(manager, tmp_path)
+    assert manager.watch_count == 1
+
+    # Dispatch the events here only, rather than from the observer as well
+    watch = manager.watches[str(tmp_path)]
+    (handler,) = manager.observer._handlers[watch]
+    manager.observer.remove_handler_for_watch(handler, watch)
+    create_path(tmp_path, Path("sub/foo-2.0.zip"))
+    handler.dispatch(DirCreatedEvent(str(tmp_path / "sub")))
+    assert manager.watch_count == 2
+    assert manager.fallback_roots == frozenset()
+
+    create_path(tmp_path, Path("sub2/foo-3.0.zip"))
+    handler.dispatch(DirCreatedEvent(str(tmp_path / "sub2")))
+    assert manager.fallback_roots == frozenset()
+    assert len(_listdir(manager, tmp_path)) == 3
+    assert manager.fallback_roots == {str(tmp_path)}
+    assert manager.observer.emitters == set()
+    assert manager.watch_count == 0
+
+
+def test_caching_backend_polls_all_roots_without_watch_budget(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    backend = get_file_backend(
+        Config.default_with_overrides(roots=[tmp_path], watch_budget=0)
+    )
+    assert isinstance(backend, CachingFileBackend)
+    assert backend.package_count() == 1
+    assert backend.cache_manager.observer is None
+    assert backend.cache_manager.fallback_roots == frozenset()
+
+
+def _digest(manager, path, hash_algo="sha256"):
+    return manager.digest_file(
+        str(path), hash_algo, lambda fpath, algo: f"{algo}={fpath}"
+    )
+
+
+def test_cache_manager_evicts_least_recently_used_digests(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    manager = CacheManager(digest_max_entries=2)
+    paths = [tmp_path / f"foo-1.{i}.zip" for i in range(3)]
+    _digest(manager, paths[0])
+    _digest(manager, paths[1])
+    _digest(manager, paths[0])
+    _digest(manager, paths[2])
+    assert list(manager.digest_cache) == [
+        (str(paths[0]), "sha256"),
+        (str(paths[2]), "sha256"),
+    ]
+
+    manager.digest_max_entries = None
+    manager.digest_max_bytes = manager.digest_bytes
+    _digest(manager, paths[1], "md5")
+    assert len(manager.digest_cache) == 2
+    assert (str(paths[1]), "md5") in manager.digest_cache
+    assert manager.digest_bytes <= manager.digest_max_bytes
+
+
+def test_cache_manager_accounts_for_digests(tmp_path):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    manager = CacheManager()
+    path = str(tmp_path / "foo-1.0.zip")
+    _digest(manager, path)
+    _digest(manager, path, "md5")
+    usage = manager.memory_usage()
+    assert usage["digest_entries"] == 2
+    assert usage["digest_bytes"] == manager.digest_bytes > 0
+
+    manager.update_root_cache(tmp_path, removed=[path])
+    assert manager.memory_usage()["digest_entries"] == 0
+    assert manager.digest_bytes == 0
+
+
+def test_cache_manager_sweeps_unlisted_digests(tmp_path):
+    root = tmp_path / "root"
+    for path in ("root/foo-1.0.zip", "root/foo-2.0.zip", "other/foo-1.0.zip"):
+        create_path(tmp_path, Path(path))
+    manager = CacheManager(sweep_interval=3600)
+    _listdir(manager, root)
+    usage = manager.memory_usage()
+    assert usage["listdir_entries"] == 2
+    assert usage["listdir_bytes"] > 0
+
+    listed, unlisted = root / "foo-1.0.zip", root / "foo-3.0.zip"
+    for path in (listed, unlisted, tmp_path / "other" / "foo-1.0.zip"):
+        _digest(manager, path)
+    assert manager.sweep_digests() == 1
+    assert (str(unlisted), "sha256") not in manager.digest_cache
+    assert len(manager.digest_cache) == 2
+
+
+def test_cache_manager_sweeps_periodically(tmp_path, monkeypatch):
+    create_path(tmp_path, Path("foo-1.0.zip"))
+    manager = CacheManager(sweep_interval=0)
+    _listdir(manager, tmp_path)
+    swept = []
+    monkeypatch.setattr(
+        manager, "sweep_digests", lambda: swept.append(1) or 0
+    )
+    _digest(manager, tmp_path / "foo-1.0.zip")
+    assert manager.sweeping
+    for thread in threading.enumerate():
+        if thread.name == "pypiserver-sweep":
+            thread.join()
+    assert swept == [1]
+    # Only one sweep at a time
+    _digest(manager, tmp_path / "foo-1.0.zip")
+    assert swept == [1]
+
+
+@pytest.mark.parametrize("backend_cls", [SimpleFileBackend, CachingFileBackend])
+@pytest.mark.parametrize("layout", ["project", "sharded"])
+def test_backends_store_packages_by_layout(tmp_path, backend_cls, layout):
+    backend = backend_cls(
+        Config.default_with_overrides(roots=[tmp_path], layout=layout)
+    )
+    project_dir = tmp_path / backend.layout.project_dir("Foo_Bar")
+    create_path(tmp_path, Path("foo_bar-0.1.zip"))
+
+    backend.add_package("Foo_Bar-1.0.zip", io.BytesIO(b"content"))
+    assert (project_dir / "Foo_Bar-1.0.zip").is_file()
+    assert backend.exists("Foo_Bar-1.0.zip")
+    assert not backend.exists("Foo_Bar-2.0.zip")
+
+    (pkg,) = backend.find_version("Foo_Bar", "1.0")
+    assert pkg.fn == str(project_dir / "Foo_Bar-1.0.zip")
+    assert sorted(p.version for p in backend.get_all_packages()) == [
+        "0.1",
+        "1.0",
+    ]
+    found = [p.version for p in backend.find_project_packages("foo.bar")]
+    if backend_cls is SimpleFileBackend:
+        # Only the directory of the project is listed, while the caching
+        # backend looks packages up in its catalog of the whole root
+        assert found == ["1.0"]
+    else:
+        assert sorted(found) == ["0.1", "1.0"]
+
+    backend.remove_package(pkg)
+    assert not backend.exists("Foo_Bar-1.0.zip")
+    assert list(backend.find_version("Foo_Bar", "1.0")) == []
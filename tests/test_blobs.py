@@ -0,0 +1,148 @@
+"""Tests for the content-addressed blob store."""
+
+import hashlib
+import io
+import os
+
+import pytest
+
+from pypiserver.backend import CachingFileBackend, SimpleFileBackend
+from pypiserver.blobs import BlobStore, deduplicate
+from pypiserver.config import Config
+
+
+def _sha256(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / ".blobs")
+
+
+def test_add_stores_content_once(tmp_path, store):
+    first, second = tmp_path / "a-1.0.zip", tmp_path / "b-1.0.zip"
+    stream = io.BytesIO(b"content")
+
+    assert store.add(stream, first) == f"sha256={_sha256(b'content')}"
+    assert stream.tell() == 0
+    store.add(stream, second)
+
+    blob = store.blob_path(_sha256(b"content"))
+    assert blob.read_bytes() == b"content"
+    assert os.path.samestat(first.stat(), blob.stat())
+    assert os.path.samestat(second.stat(), blob.stat())
+    assert blob.stat().st_nlink == 3
+    assert list(store.tmp_dir.iterdir()) == []
+
+
+def test_add_replaces_destination(tmp_path, store):
+    path = tmp_path / "a-1.0.zip"
+    store.add(io.BytesIO(b"old"), path)
+    store.add(io.BytesIO(b"new"), path)
+
+    assert path.read_bytes() == b"new"
+    # The old blob is left untouched
+    assert store.blob_path(_sha256(b"old")).read_bytes() == b"old"
+
+
+def test_address(tmp_path, store):
+    linked = tmp_path / "a-1.0.zip"
+    store.add(io.BytesIO(b"content"), linked)
+    unlinked = tmp_path / "b-1.0.zip"
+    unlinked.write_bytes(b"content")
+
+    assert store.address(linked, "sha256") == f"sha256={_sha256(b'content')}"
+    assert store.address(linked, "md5") is None
+    assert store.address(unlinked, "sha256") is None
+    # A fresh store finds the addresses of existing blobs
+    assert BlobStore(store.path).address(linked, "sha256") is not None
+
+
+def test_address_of_collected_blob(tmp_path, store):
+    path = tmp_path / "a-1.0.zip"
+    store.add(io.BytesIO(b"content"), path)
+    other = tmp_path / "other"
+    os.link(path, other)
+    store.blob_path(_sha256(b"content")).unlink()
+
+    assert store.address(path, "sha256") is None
+
+
+def test_ingest(tmp_path, store):
+    first, second = tmp_path / "a-1.0.zip", tmp_path / "sub" / "a-1.0.zip"
+    second.parent.mkdir()
+    first.write_bytes(b"content")
+    second.write_bytes(b"content")
+
+    assert store.ingest(first) == 0
+    assert store.ingest(second) == len(b"content")
+    assert store.ingest(second) == 0
+    assert os.path.samestat(first.stat(), second.stat())
+    assert second.read_bytes() == b"content"
+
+
+def test_collect(tmp_path, store):
+    kept, removed = tmp_path / "a-1.0.zip", tmp_path / "b-1.0.zip"
+    store.add(io.BytesIO(b"kept"), kept)
+    store.add(io.BytesIO(b"removed"), removed)
+    removed.unlink()
+
+    assert store.collect() == 1
+    assert store.blob_path(_sha256(b"kept")).is_file()
+    assert not store.blob_path(_sha256(b"removed")).exists()
+    assert store.address(kept, "sha256") is not None
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_deduplicate(tmp_path, store, workers):
+    roots = [tmp_path / "team", tmp_path / "mirror"]
+    for root in roots:
+        (root / "sub").mkdir(parents=True)
+        (root / "a-1.0.zip").write_bytes(b"a" * 100)
+        (root / "sub" / "b-1.0.zip").write_bytes(b"b" * 10)
+        (root / "README").write_bytes(b"a" * 100)
+
+    assert deduplicate(roots, store, workers) == 110
+    assert os.path.samestat(
+        (roots[0] / "a-1.0.zip").stat(), (roots[1] / "a-1.0.zip").stat()
+    )
+    assert (roots[0] / "README").stat().st_nlink == 1
+
+
+@pytest.mark.parametrize("backend_cls", [SimpleFileBackend, CachingFileBackend])
+def test_backends_deduplicate_uploads(tmp_path, backend_cls, monkeypatch):
+    root = tmp_path / "packages"
+    root.mkdir()
+    backend = backend_cls(
+        Config.default_with_overrides(
+            roots=[root], blob_store=root / ".blobs", layout="project"
+        )
+    )
+    backend.add_package("a-1.0.zip", io.BytesIO(b"content"))
+    backend.add_package("b-1.0.zip", io.BytesIO(b"content"))
+
+    assert [p.relfn for p in backend.get_sorted_packages()] == [
+        os.path.join("a", "a-1.0.zip"),
+        os.path.join("b", "b-1.0.zip"),
+    ]
+    assert (root / ".blobs" / "sha256").exists()
+
+    def digest_file(*_):
+        raise AssertionError("The digest comes from the address")
+
+    monkeypatch.setattr("pypiserver.backend.digest_file", digest_file)
+    for pkg in backend.get_all_packages():
+        assert backend.digest(pkg) == f"sha256={_sha256(b'content')}"
+
+
+def test_backend_does_not_write_through_links(tmp_path):
+    root = tmp_path / "packages"
+    root.mkdir()
+    backend = SimpleFileBackend(Config.default_with_overrides(roots=[root]))
+    (root / "a-1.0.zip").write_bytes(b"content")
+    os.link(root / "a-1.0.zip", tmp_path / "link")
+
+    backend.add_package("a-1.0.zip", io.BytesIO(b"new"))
+    assert (root / "a-1.0.zip").read_bytes() == b"new"
+    assert (tmp_path / "link").read_bytes() == b"content"
@@ -0,0 +1,210 @@
+import os
+import random
+import typing as t
+
+import pytest
+
+from pypiserver import catalog as catalog_module
+from pypiserver.catalog import Catalog, listing_sort_key, project_sort_key
+from pypiserver.core import PkgFile
+
+
+def pkgfile(relfn: str, root: str = "/root") -> PkgFile:
+    name, _, rest = relfn.rpartition("/")[-1].partition("-")
+    version = rest[: -len(".zip")]
+    return PkgFile(
+        pkgname=name,
+        version=version,
+        fn=f"{root}/{relfn}",
+        root=root,
+        relfn=relfn,
+    )
+
+
+def attrs(pkg: PkgFile) -> tuple:
+    return tuple(
+        getattr(pkg, attr) for attr in PkgFile.__slots__ if attr != "digester"
+    )
+
+
+def assert_consistent(catalog: Catalog, expected: t.Iterable[PkgFile]):
+    """The aggregates must match what would be computed from scratch."""
+    expected = list(expected)
+    assert len(catalog) == len(expected)
+    assert list(map(attrs, catalog.sorted_packages())) == list(
+        map(attrs, sorted(expected, key=listing_sort_key))
+    )
+    projects = sorted({p.pkgname_norm for p in expected})
+    assert list(catalog.projects()) == projects
+    for project in projects:
+        assert list(map(attrs, catalog.find_project(project))) == list(
+            map(
+                attrs,
+                sorted(
+                    (p for p in expected if p.pkgname_norm == project),
+                    key=project_sort_key,
+                ),
+            )
+        )
+    for pkg in expected:
+        assert pkg.fn in catalog
+        assert attrs(catalog.get(pkg.fn)) == attrs(pkg)
+
+
+def test_catalog_aggregates():
+    packages = [
+        pkgfile(p)
+        for p in (
+            "foo-1.10.zip",
+            "Foo_Bar-1.0.zip",
+            "foo-1.2.zip",
+            "a/foo-1.0.zip",
+        )
+    ]
+    catalog = Catalog(packages)
+    assert_consistent(catalog, packages)
+    assert list(catalog.projects()) == ["foo", "foo-bar"]
+    assert [p.version for p in catalog.find_project("foo")] == [
+        "1.0",
+        "1.2",
+        "1.10",
+    ]
+    assert catalog.find_project("missing") == ()
+    assert "/root/foo-1.2.zip" in catalog
+    assert "/root/foo-1.3.zip" not in catalog
+    assert "/elsewhere/foo-1.2.zip" not in catalog
+
+
+def test_catalog_materializes_packages_lazily():
+    pkg = pkgfile("sub/foo-1.0.zip")
+    catalog = Catalog([pkg])
+    (materialized,) = catalog.find_project("foo")
+    assert materialized is not pkg
+    assert attrs(materialized) == attrs(pkg)
+
+
+def test_catalog_keeps_digester():
+    def digester(pkg):
+        return "sha256=abc"
+
+    pkg = PkgFile("foo", "1.0", "/root/foo-1.0.zip", "/root", "foo-1.0.zip")
+    pkg.digester = digester
+    (materialized,) = Catalog([pkg])
+    assert materialized.fname_and_hash == "foo-1.0.zip#sha256=abc"
+
+
+@pytest.mark.parametrize(
+    "pkg",
+    [
+        # a digest is known already
+        PkgFile("foo", "1.0", "/root/foo-1.0.zip", "/root", "foo-1.0.zip"),
+        # no path
+        PkgFile("foo", "1.0"),
+        # the name does not match the file name
+        PkgFile("bar", "1.0", "/root/foo-1.0.zip", "/root", "foo-1.0.zip"),
+    ],
+)
+def test_catalog_keeps_irregular_packages(pkg):
+    if pkg.fn is not None and pkg.pkgname == "foo":
+        pkg.digest = "sha256=abc"
+    catalog = Catalog([pkg, pkgfile("foo-2.0.zip")])
+    assert pkg in list(catalog)
+    if pkg.fn is not None:
+        assert catalog.get(pkg.fn) is pkg
+        catalog.remove(pkg.fn)
+        assert pkg not in list(catalog)
+        assert len(catalog) == 1
+
+
+def test_catalog_add_and_remove():
+    catalog = Catalog([pkgfile("foo-1.0.zip")])
+    generation = catalog.generation
+
+    catalog.add(pkgfile("bar-1.0.zip"))
+    assert catalog.generation > generation
+    assert list(catalog.projects()) == ["bar", "foo"]
+
+    catalog.remove("/root/foo-1.0.zip")
+    assert list(catalog.projects()) == ["bar"]
+    assert catalog.find_project("foo") == ()
+    assert_consistent(catalog, [pkgfile("bar-1.0.zip")])
+
+
+def test_catalog_add_replaces_same_path():
+    catalog = Catalog([pkgfile("foo-1.0.zip")])
+    catalog.add(pkgfile("foo-1.0.zip"))
+    assert len(catalog) == 1
+    assert len(catalog.find_project("foo")) == 1
+
+
+def test_catalog_noop_update_keeps_generation():
+    catalog = Catalog([pkgfile("foo-1.0.zip")])
+    catalog.update(removed=["/root/missing-1.0.zip"])
+    assert catalog.generation == 0
+
+
+def test_catalog_views_are_not_mutated():
+    catalog = Catalog([pkgfile("foo-1.0.zip")])
+    listing = catalog.sorted_packages()
+    projects = catalog.projects()
+    catalog.add(pkgfile("bar-1.0.zip"))
+    catalog.remove("/root/foo-1.0.zip")
+    assert [p.fn for p in listing] == ["/root/foo-1.0.zip"]
+    assert list(projects) == ["foo"]
+
+
+def test_catalog_packs_file_names(monkeypatch):
+    monkeypatch.setattr(catalog_module, "_COMPACT_MIN_ROWS", 2)
+    names = ["foo-1.0.zip", "foo-1.0\udce9.zip", "föö-2.0.zip"]
+    catalog = Catalog(pkgfile(name) for name in names)
+    catalog.remove("/root/foo-1.0.zip")
+    catalog.remove("/root/foo-1.0\udce9.zip")
+    catalog.add(pkgfile("foo-3.0.zip"))
+    assert sorted(os.path.basename(p.fn) for p in catalog) == [
+        "foo-3.0.zip",
+        "föö-2.0.zip",
+    ]
+
+
+def test_catalog_memory_usage():
+    empty = Catalog().memory_usage()
+    assert empty > 0
+    packages = [pkgfile(f"pkg{i}/pkg{i}-1.{i}.zip") for i in range(1000)]
+    catalog = Catalog(packages[:500])
+    half = catalog.memory_usage()
+    catalog.update(added=packages[500:])
+    usage = catalog.memory_usage()
+    assert empty < half < usage
+    # Names and directories are interned, so only counted once
+    shared = Catalog([pkgfile(f"pkg-1.{i}.zip") for i in range(1000)])
+    assert shared.memory_usage() < usage
+
+    irregular = PkgFile("foo", "1.0")
+    catalog.add(irregular)
+    assert catalog.memory_usage() > usage
+
+
+@pytest.mark.parametrize("batch_size", [1, 10, 100])
+def test_catalog_random_updates(monkeypatch, batch_size):
+    # Drop dead rows regularly, too
+    monkeypatch.setattr(catalog_module, "_COMPACT_MIN_ROWS", 16)
+    rnd = random.Random(batch_size)
+    paths = [
+        f"{d}{name}-{major}.{minor}.zip"
+        for d in ("", "sub/")
+        for name in ("foo", "bar", "Baz", "qux")
+        for major in range(5)
+        for minor in range(0, 20, 3)
+    ]
+    expected = {
+        f"/root/{p}": pkgfile(p) for p in rnd.sample(paths, len(paths) // 2)
+    }
+    catalog = Catalog(expected.values())
+    for _ in range(20):
+        removed = [f"/root/{p}" for p in rnd.sample(paths, batch_size)]
+        added = [pkgfile(p) for p in rnd.sample(paths, batch_size)]
+        catalog.update(added=added, removed=removed)
+        for path in removed:
+            expected.pop(path, None)
+        expected.update((pkg.fn, pkg) for pkg in added)
+        assert_consistent(catalog, expected.values())
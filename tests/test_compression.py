@@ -0,0 +1,51 @@
+import gzip
+
+import pytest
+
+from pypiserver import compression
+from pypiserver.compression import ResponseCompressor, choose_encoding
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("deflate, gzip;q=0.5", "gzip"),
+        ("gzip;q=0", None),
+        ("*", compression.SUPPORTED_ENCODINGS[0]),
+        ("*;q=0.5, gzip;q=0", "br" if compression.brotli else None),
+    ],
+)
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_compressor_caches_variants():
+    compressor = ResponseCompressor(level=6, min_size=10)
+    body = b"<a>link</a>" * 100
+
+    data, encoding = compressor.encode(body, "gzip")
+    assert encoding == "gzip"
+    assert gzip.decompress(data) == body
+
+    again, _ = compressor.encode(body, "gzip")
+    assert again is data
+
+
+def test_compressor_threshold():
+    compressor = ResponseCompressor(level=6, min_size=1000)
+    assert compressor.encode(b"small", "gzip") == (b"small", None)
+
+
+def test_compressor_evicts_least_recently_used():
+    compressor = ResponseCompressor(level=1, min_size=0, max_entries=2)
+    first, _ = compressor.encode(b"first", "gzip")
+    compressor.encode(b"second", "gzip")
+    compressor.encode(b"first", "gzip")
+    compressor.encode(b"third", "gzip")
+
+    assert compressor.encode(b"first", "gzip")[0] is first
+    assert len(compressor._variants) == 2
@@ -9,7 +9,13 @@ import sys
 import pytest
 
 from pypiserver.backend import SimpleFileBackend, BackendProxy
-from pypiserver.config import DEFAULTS, Config, RunConfig, UpdateConfig
+from pypiserver.config import (
+    DEFAULTS,
+    Config,
+    MigrateConfig,
+    RunConfig,
+    UpdateConfig,
+)
 
 FILE_DIR = pathlib.Path(__file__).parent.resolve()
 
@@ -406,6 +412,7 @@ _CONFIG_TEST_PARAMS: t.Tuple[ConfigTestCase, ...] = (
             "gevent",
             "gunicorn",
             "paste",
+            "threaded",
             "twisted",
             "wsgiref",
         )
@@ -417,6 +424,118 @@ _CONFIG_TEST_PARAMS: t.Tuple[ConfigTestCase, ...] = (
         exp_config_type=RunConfig,
         exp_config_values={"server_method": "cherrypy"},
     ),
+    # threaded server
+    ConfigTestCase(
+        case="Run: threaded server options unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "threads": DEFAULTS.THREADS,
+            "backlog": DEFAULTS.BACKLOG,
+            "timeout": DEFAULTS.TIMEOUT,
+            "keepalive_timeout": DEFAULTS.KEEPALIVE_TIMEOUT,
+        },
+    ),
+    ConfigTestCase(
+        case="Run: threaded server options specified",
+        args=[
+            "run",
+            "--threads",
+            "4",
+            "--backlog",
+            "512",
+            "--timeout",
+            "0",
+            "--keepalive-timeout",
+            "1.5",
+        ],
+        legacy_args=[
+            "--threads",
+            "4",
+            "--backlog",
+            "512",
+            "--timeout",
+            "0",
+            "--keepalive-timeout",
+            "1.5",
+        ],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "threads": 4,
+            "backlog": 512,
+            "timeout": 0.0,
+            "keepalive_timeout": 1.5,
+        },
+    ),
+    # auth cache
+    ConfigTestCase(
+        case="Run: auth cache unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={"auth_cache_ttl": 300.0, "auth_cache_size": 1024},
+    ),
+    ConfigTestCase(
+        case="Run: auth cache specified",
+        args=["run", "--auth-cache-ttl", "30", "--auth-cache-size", "10"],
+        legacy_args=["--auth-cache-ttl", "30", "--auth-cache-size", "10"],
+        exp_config_type=RunConfig,
+        exp_config_values={"auth_cache_ttl": 30.0, "auth_cache_size": 10},
+    ),
+    # proxy
+    ConfigTestCase(
+        case="Run: proxy unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "proxy_cache": None,
+            "proxy_index_ttl": 600.0,
+            "proxy_negative_ttl": 60.0,
+            "_test": lambda conf: conf.proxy is None,
+        },
+    ),
+    ConfigTestCase(
+        case="Run: proxy TTLs specified",
+        args=["run", "--proxy-index-ttl", "30", "--proxy-negative-ttl", "0"],
+        legacy_args=["--proxy-index-ttl", "30", "--proxy-negative-ttl", "0"],
+        exp_config_type=RunConfig,
+        exp_config_values={"proxy_index_ttl": 30.0, "proxy_negative_ttl": 0},
+    ),
+    # offload threads
+    ConfigTestCase(
+        case="Run: offload threads unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={"offload_threads": None},
+    ),
+    ConfigTestCase(
+        case="Run: offload threads specified",
+        args=["run", "--offload-threads", "4"],
+        legacy_args=["--offload-threads", "4"],
+        exp_config_type=RunConfig,
+        exp_config_values={"offload_threads": 4},
+    ),
+    # workers
+    ConfigTestCase(
+        case="Run: workers unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "workers": DEFAULTS.WORKERS,
+            "graceful_timeout": DEFAULTS.GRACEFUL_TIMEOUT,
+        },
+    ),
+    ConfigTestCase(
+        case="Run: workers specified",
+        args=["run", "--workers", "4", "--graceful-timeout", "2.5"],
+        legacy_args=["--workers", "4", "--graceful-timeout", "2.5"],
+        exp_config_type=RunConfig,
+        exp_config_values={"workers": 4, "graceful_timeout": 2.5},
+    ),
     # overwrite
     ConfigTestCase(
         "Run: overwrite unset",
@@ -501,6 +620,176 @@ _CONFIG_TEST_PARAMS: t.Tuple[ConfigTestCase, ...] = (
         exp_config_type=RunConfig,
         exp_config_values={"cache_control": 1900},
     ),
+    # compression
+    ConfigTestCase(
+        case="Run: compression unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "compression_level": DEFAULTS.COMPRESSION_LEVEL,
+            "compression_min_size": DEFAULTS.COMPRESSION_MIN_SIZE,
+        },
+    ),
+    ConfigTestCase(
+        case="Run: compression specified",
+        args=["run", "--compression-level", "0", "--compression-min-size", "1"],
+        legacy_args=["--compression-level", "0", "--compression-min-size", "1"],
+        exp_config_type=RunConfig,
+        exp_config_values={"compression_level": 0, "compression_min_size": 1},
+    ),
+    # scan-workers
+    ConfigTestCase(
+        case="Run: scan-workers unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={"scan_workers": DEFAULTS.SCAN_WORKERS},
+    ),
+    ConfigTestCase(
+        case="Run: scan-workers specified",
+        args=["run", "--scan-workers", "8"],
+        legacy_args=["--scan-workers", "8"],
+        exp_config_type=RunConfig,
+        exp_config_values={"scan_workers": 8},
+    ),
+    # polling
+    ConfigTestCase(
+        case="Run: polling unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "poll_roots": [],
+            "poll_interval": DEFAULTS.POLL_INTERVAL,
+        },
+    ),
+    ConfigTestCase(
+        case="Run: polling specified",
+        args=[
+            "run",
+            "--poll-root",
+            str(FILE_DIR),
+            "--poll-root",
+            str(FILE_DIR.parent),
+            "--poll-interval",
+            "0.5",
+        ],
+        legacy_args=[
+            "--poll-root",
+            str(FILE_DIR),
+            "--poll-root",
+            str(FILE_DIR.parent),
+            "--poll-interval",
+            "0.5",
+        ],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "poll_roots": [FILE_DIR, FILE_DIR.parent],
+            "poll_interval": 0.5,
+        },
+    ),
+    # watch-budget
+    ConfigTestCase(
+        case="Run: watch-budget unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={"watch_budget": None},
+    ),
+    *(
+        ConfigTestCase(
+            case=f"Run: watch-budget {budget}",
+            args=["run", "--watch-budget", budget],
+            legacy_args=["--watch-budget", budget],
+            exp_config_type=RunConfig,
+            exp_config_values={"watch_budget": int(budget)},
+        )
+        for budget in ("0", "8192")
+    ),
+    # digest cache
+    ConfigTestCase(
+        case="Run: digest cache limits unspecified",
+        args=["run"],
+        legacy_args=[],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "digest_cache_bytes": DEFAULTS.DIGEST_CACHE_BYTES,
+            "digest_cache_entries": None,
+        },
+    ),
+    *(
+        ConfigTestCase(
+            case=f"Run: digest cache limits {size}",
+            args=[
+                "run",
+                "--digest-cache-bytes",
+                size,
+                "--digest-cache-entries",
+                "1000",
+            ],
+            legacy_args=[
+                "--digest-cache-bytes",
+                size,
+                "--digest-cache-entries",
+                "1000",
+            ],
+            exp_config_type=RunConfig,
+            exp_config_values={
+                "digest_cache_bytes": exp_bytes,
+                "digest_cache_entries": 1000,
+            },
+        )
+        for size, exp_bytes in (
+            ("4096", 4096),
+            ("64k", 64 * 2**10),
+            ("32M", 32 * 2**20),
+            ("2G", 2 * 2**30),
+        )
+    ),
+    # layout
+    *generate_subcommand_test_cases(
+        case="layout unspecified",
+        exp_config_values={"layout": DEFAULTS.LAYOUT},
+    ),
+    *(
+        ConfigTestCase(
+            case=f"Run: layout {layout}",
+            args=["run", "--layout", layout],
+            legacy_args=["--layout", layout],
+            exp_config_type=RunConfig,
+            exp_config_values={"layout": layout},
+        )
+        for layout in ("flat", "project", "sharded")
+    ),
+    # blob-store
+    *generate_subcommand_test_cases(
+        case="blob store unspecified",
+        exp_config_values={"blob_store": None},
+    ),
+    *generate_subcommand_test_cases(
+        case="blob store specified",
+        extra_args=["--blob-store", "~/packages/.blobs"],
+        exp_config_values={
+            "blob_store": pathlib.Path("~/packages/.blobs")
+            .expanduser()
+            .resolve()
+        },
+    ),
+    # snapshot
+    *generate_subcommand_test_cases(
+        case="snapshot unspecified",
+        exp_config_values={"snapshot": None},
+    ),
+    ConfigTestCase(
+        case="Run: snapshot specified",
+        args=["run", "--snapshot", "/tmp/catalog.snap"],
+        legacy_args=["--snapshot", "/tmp/catalog.snap"],
+        exp_config_type=RunConfig,
+        exp_config_values={
+            "snapshot": pathlib.Path("/tmp/catalog.snap").resolve()
+        },
+    ),
     # log-req-frmt
     ConfigTestCase(
         case="Run: log request format unspecified",
@@ -681,6 +970,51 @@ _CONFIG_TEST_PARAMS: t.Tuple[ConfigTestCase, ...] = (
         exp_config_type=UpdateConfig,
         exp_config_values={"ignorelist": ["mypiserver", "something"]},
     ),
+    # index lookups
+    ConfigTestCase(
+        case="Update: index lookups not specified",
+        args=["update"],
+        legacy_args=["-U"],
+        exp_config_type=UpdateConfig,
+        exp_config_values={
+            "index_url": DEFAULTS.INDEX_URL,
+            "workers": DEFAULTS.UPDATE_WORKERS,
+            "timeout": DEFAULTS.UPDATE_TIMEOUT,
+            "cache_file": DEFAULTS.UPDATE_CACHE,
+        },
+    ),
+    ConfigTestCase(
+        case="Update: index lookups specified",
+        args=[
+            "update",
+            "--index-url",
+            "http://localhost:8080/simple/",
+            "-w",
+            "2",
+            "--timeout",
+            "5",
+            "--cache-file",
+            "cache.json",
+        ],
+        legacy_args=[
+            "-U",
+            "--index-url",
+            "http://localhost:8080/simple/",
+            "-w",
+            "2",
+            "--timeout",
+            "5",
+            "--cache-file",
+            "cache.json",
+        ],
+        exp_config_type=UpdateConfig,
+        exp_config_values={
+            "index_url": "http://localhost:8080/simple/",
+            "workers": 2,
+            "timeout": 5.0,
+            "cache_file": pathlib.Path("cache.json"),
+        },
+    ),
 )
 
 # Split case names out from cases to use as pytest IDs.
@@ -721,6 +1055,158 @@ _CONFIG_ERROR_CASES = (
         )
         for val in ("/", "health", "/health!", "/:health", "/health?check=True")
     ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid compression level: {val}",
+            args=["run", "--compression-level", val],
+            exp_txt="Invalid compression level",
+        )
+        for val in ("-1", "10", "fast")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid scan workers: {val}",
+            args=["run", "--scan-workers", val],
+            exp_txt="Invalid number of scan workers",
+        )
+        for val in ("0", "-2", "many")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid number of server workers: {val}",
+            args=["run", "--workers", val],
+            exp_txt="Invalid number of server workers",
+        )
+        for val in ("0", "-2", "many")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid number of threads: {val}",
+            args=["run", "--threads", val],
+            exp_txt="Invalid number of threads",
+        )
+        for val in ("0", "lots")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid listen backlog: {val}",
+            args=["run", "--backlog", val],
+            exp_txt="Invalid listen backlog",
+        )
+        for val in ("0", "-1")
+    ),
+    ConfigErrorCase(
+        case="Invalid auth cache TTL",
+        args=["run", "--auth-cache-ttl", "-1"],
+        exp_txt="Invalid timeout",
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid auth cache size: {val}",
+            args=["run", "--auth-cache-size", val],
+            exp_txt="Invalid credential cache size",
+        )
+        for val in ("0", "many")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid token actions: {val}",
+            args=["token", "--token-key", "k", "-u", "ci", "-a", val],
+            exp_txt="Invalid token actions",
+        )
+        for val in ("upload", "list,.", "")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid token lifetime: {val}",
+            args=["token", "--token-key", "k", "-u", "ci", "--expires", val],
+            exp_txt="Invalid duration",
+        )
+        for val in ("0", "0s", "1y", "inf", "soon")
+    ),
+    ConfigErrorCase(
+        case="Token user unspecified",
+        args=["token", "--token-key", "k"],
+        exp_txt="--user",
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid proxy TTL: {arg}",
+            args=["run", arg, "soon"],
+            exp_txt="Invalid timeout",
+        )
+        for arg in ("--proxy-index-ttl", "--proxy-negative-ttl")
+    ),
+    ConfigErrorCase(
+        case="Invalid number of offload threads",
+        args=["run", "--offload-threads", "0"],
+        exp_txt="Invalid number of threads",
+    ),
+    ConfigErrorCase(
+        case="Invalid keep-alive timeout",
+        args=["run", "--keepalive-timeout", "-5"],
+        exp_txt="Invalid timeout",
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid graceful timeout: {val}",
+            args=["run", "--graceful-timeout", val],
+            exp_txt="Invalid timeout",
+        )
+        for val in ("-1", "inf", "later")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid poll interval: {val}",
+            args=["run", "--poll-interval", val],
+            exp_txt="Invalid poll interval",
+        )
+        for val in ("-1", "inf", "nan", "often")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid watch budget: {val}",
+            args=["run", "--watch-budget", val],
+            exp_txt="Invalid watch budget",
+        )
+        for val in ("-1", "1.5", "all")
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid digest cache size: {val}",
+            args=["run", "--digest-cache-bytes", val],
+            exp_txt="Invalid digest cache size",
+        )
+        for val in ("0", "0M", "1T", "M", "big")
+    ),
+    ConfigErrorCase(
+        case="Invalid layout",
+        args=["run", "--layout", "nested"],
+        exp_txt="invalid choice: 'nested'",
+    ),
+    ConfigErrorCase(
+        case="Invalid migrate workers",
+        args=["migrate", "--workers", "0"],
+        exp_txt="Invalid number of scan workers",
+    ),
+    ConfigErrorCase(
+        case="Invalid update workers",
+        args=["update", "--workers", "0"],
+        exp_txt="Invalid number of threads",
+    ),
+    ConfigErrorCase(
+        case="Invalid update timeout",
+        args=["update", "--timeout", "-1"],
+        exp_txt="Invalid timeout",
+    ),
+    *(
+        ConfigErrorCase(
+            case=f"Invalid digest cache entries: {val}",
+            args=["run", "--digest-cache-entries", val],
+            exp_txt="Invalid number of digest cache entries",
+        )
+        for val in ("0", "1k")
+    ),
 )
 # pylint: disable=unsubscriptable-object
 CONFIG_ERROR_PARAMS = (i[1:] for i in _CONFIG_ERROR_CASES)
@@ -794,3 +1280,36 @@ def test_argv_conf():
         assert conf.disable_fallback is True
     finally:
         sys.argv = orig_args
+
+
+@pytest.mark.parametrize(
+    "args, exp_config_values",
+    [
+        (
+            ["migrate"],
+            {
+                "execute": False,
+                "workers": DEFAULTS.MIGRATE_WORKERS,
+                "layout": DEFAULTS.LAYOUT,
+            },
+        ),
+        (
+            ["migrate", "--layout", "sharded", "-x", "-w", "2", str(FILE_DIR)],
+            {
+                "execute": True,
+                "workers": 2,
+                "layout": "sharded",
+                "roots": [FILE_DIR],
+            },
+        ),
+    ],
+)
+def test_migrate_config(
+    args: t.List[str], exp_config_values: t.Dict[str, t.Any]
+) -> None:
+    """The migrate subcommand has no legacy equivalent."""
+    conf = Config.from_args(args)
+    assert isinstance(conf, MigrateConfig)
+    assert {k: getattr(conf, k) for k in exp_config_values} == (
+        exp_config_values
+    )
@@ -0,0 +1,125 @@
+"""Tests for the cache of verified credentials."""
+
+import os
+
+import pytest
+from passlib.apache import HtpasswdFile
+
+from pypiserver.config import Config
+from pypiserver.credentials import CredentialCache, HtpasswdAuther
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def htpasswd(tmp_path):
+    path = tmp_path / "htpasswd"
+    htpasswd = HtpasswdFile(str(path), new=True)
+    htpasswd.set_password("user", "secret")
+    htpasswd.save()
+    return HtpasswdFile(str(path))
+
+
+def test_cache_expires(clock):
+    cache = CredentialCache(ttl=60, max_entries=10, clock=clock)
+    assert not cache.verified("user", "secret")
+    cache.add("user", "secret")
+    assert cache.verified("user", "secret")
+    assert not cache.verified("user", "other")
+    assert not cache.verified("user2", "secret")
+    clock.now += 60
+    assert not cache.verified("user", "secret")
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = CredentialCache(ttl=60, max_entries=2, clock=clock)
+    cache.add("a", "1")
+    cache.add("b", "2")
+    assert cache.verified("a", "1")
+    cache.add("c", "3")
+    assert len(cache) == 2
+    assert cache.verified("a", "1")
+    assert not cache.verified("b", "2")
+
+
+def test_cache_keys():
+    cache = CredentialCache(ttl=60, max_entries=10)
+    # Splitting the same characters differently is different credentials
+    cache.add("ab", "c")
+    assert not cache.verified("a", "bc")
+    # The credentials are not kept
+    assert all(b"ab" not in key for key in cache._expiries)
+    # Nor the same keys across processes
+    assert cache._key("ab", "c") != CredentialCache(60, 10)._key("ab", "c")
+
+
+def test_auther_caches_verified_credentials(htpasswd, clock, monkeypatch):
+    checks = []
+    check_password = htpasswd.check_password
+    monkeypatch.setattr(
+        htpasswd,
+        "check_password",
+        lambda *args: checks.append(args) or check_password(*args),
+    )
+    auther = HtpasswdAuther(
+        htpasswd, CredentialCache(60, 10, clock=clock), clock=clock
+    )
+    assert auther("user", "secret")
+    assert auther("user", "secret")
+    assert checks == [("user", "secret")]
+    # Failures are not cached
+    assert not auther("user", "wrong")
+    assert not auther("user", "wrong")
+    assert not auther("nobody", "secret")
+    assert len(checks) == 4
+
+
+def test_auther_reloads_changed_file(htpasswd, clock):
+    auther = HtpasswdAuther(
+        htpasswd, CredentialCache(60, 10, clock=clock), clock=clock
+    )
+    assert auther("user", "secret")
+
+    changed = HtpasswdFile(htpasswd.path)
+    changed.set_password("user", "new")
+    changed.save()
+    mtime = os.stat(htpasswd.path).st_mtime + 10
+    os.utime(htpasswd.path, (mtime, mtime))
+
+    # The file is only checked once per interval
+    assert auther("user", "secret")
+    clock.now += 1
+    assert not auther("user", "secret")
+    assert auther("user", "new")
+
+
+def test_auther_without_cache(htpasswd):
+    auther = HtpasswdAuther(htpasswd)
+    assert auther("user", "secret")
+    assert not auther("user", "wrong")
+
+
+@pytest.mark.parametrize("ttl, cached", [(300.0, True), (0.0, False)])
+def test_config_auther(htpasswd, ttl, cached):
+    auther = Config.default_with_overrides(
+        password_file=htpasswd.path,
+        authenticate=["download"],
+        auth_cache_ttl=ttl,
+        auth_cache_size=5,
+    ).auther
+    assert auther("user", "secret")
+    assert (auther.cache is not None) is cached
+    if cached:
+        assert (auther.cache.ttl, auther.cache.max_entries) == (300.0, 5)
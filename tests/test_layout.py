@@ -0,0 +1,134 @@
+"""Tests for package layouts and their migration."""
+
+import hashlib
+import io
+import os
+import pathlib
+
+import pytest
+
+from pypiserver.layout import (
+    LAYOUTS,
+    get_layout,
+    migrate,
+    move_package,
+    planned_moves,
+)
+
+
+def _sharded(project: str) -> str:
+    digest = hashlib.sha256(project.encode("utf-8")).hexdigest()
+    return os.path.join(digest[:2], digest[2:4], project)
+
+
+@pytest.mark.parametrize(
+    "layout, filename, exp_path",
+    [
+        ("flat", "Foo_Bar-1.0.tar.gz", "Foo_Bar-1.0.tar.gz"),
+        ("project", "Foo_Bar-1.0.tar.gz", "foo-bar/Foo_Bar-1.0.tar.gz"),
+        (
+            "sharded",
+            "Foo_Bar-1.0.tar.gz",
+            os.path.join(_sharded("foo-bar"), "Foo_Bar-1.0.tar.gz"),
+        ),
+        ("flat", "README.txt", None),
+        ("project", "README.txt", None),
+        ("sharded", "README.txt", None),
+    ],
+)
+def test_package_path(layout, filename, exp_path):
+    assert get_layout(layout).package_path(filename) == exp_path
+
+
+def test_layouts_are_indexed():
+    assert {name for name, layout in LAYOUTS.items() if layout.indexed} == {
+        "project",
+        "sharded",
+    }
+
+
+@pytest.fixture
+def roots(tmp_path: pathlib.Path):
+    first, second = tmp_path / "first", tmp_path / "second"
+    (first / "sub").mkdir(parents=True)
+    (first / "pkg-1.0.tar.gz").write_text("pkg")
+    (first / "sub" / "pkg-1.1.tar.gz").write_text("pkg")
+    (first / "README.txt").write_text("readme")
+    (first / "other").mkdir()
+    (first / "other" / "other-2.0.zip").write_text("other")
+    second.mkdir()
+    (second / "pkg-2.0.tar.gz").write_text("pkg")
+    return [first, second]
+
+
+def test_planned_moves(roots):
+    first, second = roots
+    assert sorted(planned_moves(roots, get_layout("project"), 2)) == sorted(
+        [
+            (str(first / "pkg-1.0.tar.gz"), str(first / "pkg/pkg-1.0.tar.gz")),
+            (
+                str(first / "sub" / "pkg-1.1.tar.gz"),
+                str(first / "pkg/pkg-1.1.tar.gz"),
+            ),
+            (
+                str(second / "pkg-2.0.tar.gz"),
+                str(second / "pkg/pkg-2.0.tar.gz"),
+            ),
+        ]
+    )
+    assert planned_moves(roots, get_layout("flat")) == []
+
+
+def test_migrate_dry_run(roots):
+    out = io.StringIO()
+    assert migrate(roots, get_layout("project"), out=out) == 0
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3
+    assert f"mkdir -p {roots[1] / 'pkg'} && mv -n " in "\n".join(lines)
+    # Nothing moved
+    assert (roots[0] / "pkg-1.0.tar.gz").is_file()
+
+
+@pytest.mark.parametrize("layout, exp_moved", [("project", 3), ("sharded", 4)])
+@pytest.mark.parametrize("workers", [1, 4])
+def test_migrate(roots, layout, exp_moved, workers):
+    first, second = roots
+    moved = migrate(roots, get_layout(layout), workers, dry_run=False)
+    assert moved == exp_moved
+    pkg_dir = _sharded("pkg") if layout == "sharded" else "pkg"
+    assert (first / pkg_dir / "pkg-1.0.tar.gz").is_file()
+    assert (first / pkg_dir / "pkg-1.1.tar.gz").is_file()
+    assert (second / pkg_dir / "pkg-2.0.tar.gz").is_file()
+    assert not (first / "pkg-1.0.tar.gz").exists()
+    # Non-packages stay put
+    assert (first / "README.txt").is_file()
+    # Migrating again is a no-op
+    assert planned_moves(roots, get_layout(layout)) == []
+
+
+def test_migrate_does_not_clobber(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg-1.0.tar.gz").write_text("new")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "pkg-1.0.tar.gz").write_text("old")
+
+    assert migrate([tmp_path], get_layout("project"), dry_run=False) == 1
+    assert (tmp_path / "pkg" / "pkg-1.0.tar.gz").is_file()
+    # Whichever came second was left where it was
+    assert len(list(tmp_path.glob("**/pkg-1.0.tar.gz"))) == 2
+
+
+def test_move_package_without_hard_links(tmp_path, monkeypatch):
+    def link(src, dst):
+        raise PermissionError(src)
+
+    monkeypatch.setattr(os, "link", link)
+    source = tmp_path / "pkg-1.0.tar.gz"
+    source.write_text("pkg")
+    destination = tmp_path / "pkg" / "pkg-1.0.tar.gz"
+
+    assert move_package(str(source), str(destination))
+    assert destination.read_text() == "pkg"
+    source.write_text("again")
+    assert not move_package(str(source), str(destination))
+    assert source.is_file()
@@ -90,7 +90,27 @@ def test_wsgiserver_extra_args_present(monkeypatch, main):
         "guess_auto_server",
         lambda: __main__.AutoServer.WsgiRef,
     )
-    assert main([])["handler_class"] is __main__.WsgiHandler
+    kwargs = main([])
+    # The built-in threaded server runs instead of wsgiref
+    assert kwargs["server"] is __main__.ThreadedServer
+    assert kwargs["handler_class"] is __main__.ThreadedWsgiHandler
+    assert kwargs["threads"] == 16
+    assert kwargs["keepalive_timeout"] == 5.0
+
+
+def test_wsgiref_server_extra_args(main):
+    kwargs = main(["--server", "wsgiref"])
+    assert kwargs["server"] == "wsgiref"
+    assert kwargs["handler_class"] is __main__.WsgiHandler
+
+
+def test_threaded_server_args(main):
+    kwargs = main(
+        ["--server", "threaded", "--threads", "4", "--backlog", "64"]
+    )
+    assert kwargs["server"] is __main__.ThreadedServer
+    assert kwargs["threads"] == 4
+    assert kwargs["backlog"] == 64
 
 
 def test_wsgiserver_extra_kwargs_absent(monkeypatch, main):
@@ -256,6 +276,22 @@ def test_blacklist_file(main):
     assert main.update_kwargs["ignorelist"] == ["mypiserver", "something"]
 
 
+@pytest.mark.parametrize("execute", [False, True])
+def test_migrate(monkeypatch, execute):
+    calls = []
+    monkeypatch.setattr(
+        "pypiserver.layout.migrate",
+        lambda *args, **kwargs: calls.append((args, kwargs)),
+    )
+    argv = ["migrate", "--layout", "project", "-w", "3", str(THIS_DIR)]
+    __main__.main(argv + (["-x"] if execute else []))
+
+    ((roots, layout), kwargs) = calls[0]
+    assert roots == [THIS_DIR.resolve()]
+    assert layout.name == "project"
+    assert kwargs == {"workers": 3, "dry_run": not execute}
+
+
 def test_auto_servers() -> None:
     """Test auto servers."""
     # A list of bottle ServerAdapters
@@ -308,3 +344,54 @@ def test_health_endpoint_customized(main):
 def test_health_endpoint_invalid_customized(main):
     with pytest.raises(SystemExit):
         main(["--health-endpoint", "/health!"])
+
+
+def test_migrate_deduplicates(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "pkg-1.0.zip").write_bytes(b"content")
+    (tmp_path / "c-1.0.zip").write_bytes(b"removed")
+    blob_store = tmp_path / ".blobs"
+    __main__.main(
+        ["migrate", "--blob-store", str(blob_store), "-x", str(tmp_path)]
+    )
+
+    assert (tmp_path / "a" / "pkg-1.0.zip").stat().st_nlink == 3
+    (tmp_path / "c-1.0.zip").unlink()
+    __main__.main(
+        ["migrate", "--blob-store", str(blob_store), "-x", str(tmp_path)]
+    )
+    assert len(list(blob_store.glob("sha256/*/*"))) == 1
+
+
+def test_workers(main, monkeypatch, caplog):
+    masters = []
+
+    class Master:
+        def __init__(self, sock, worker, workers, graceful_timeout):
+            masters.append((workers, graceful_timeout))
+            sock.close()
+
+        def run(self):
+            pass
+
+    monkeypatch.setattr("pypiserver.prefork.Master", Master)
+    assert main(["--workers", "3", "-p", "0", "-i", "127.0.0.1"]) is None
+    assert masters == [(3, 30.0)]
+
+    # Whichever server `auto` finds, the workers run the built-in one
+    monkeypatch.setattr(
+        __main__, "guess_auto_server", lambda: __main__.AutoServer.Waitress
+    )
+    with caplog.at_level(logging.INFO, logger="pypiserver.main"):
+        main(["--workers", "2", "-p", "0", "-i", "127.0.0.1"])
+    assert masters[-1] == (2, 30.0)
+    assert "workers run the built-in threaded server" in caplog.text
+    # A single worker is served by bottle, as usual
+    assert main(["--workers", "1"])["server"] == "auto"
+
+
+@pytest.mark.parametrize("server", ["paste", "wsgiref"])
+def test_workers_require_the_builtin_server(main, server):
+    with pytest.raises(SystemExit, match="--workers requires"):
+        main(["--workers", "2", "--server", server])
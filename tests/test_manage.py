@@ -3,8 +3,12 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import json
+import threading
+import time
+from collections import Counter
 from pathlib import Path
-from unittest.mock import Mock
+from unittest.mock import ANY, Mock
 
 import py
 import pytest
@@ -13,14 +17,19 @@ from pypiserver import manage
 from pypiserver.core import PkgFile
 from pypiserver.pkg_helpers import guess_pkgname_and_version, parse_version
 from pypiserver.manage import (
+    IndexClient,
+    IndexLookupError,
     PipCmd,
     build_releases,
     filter_stable_releases,
     filter_latest_pkgs,
+    find_updates,
+    get_package_releases,
     is_stable_version,
     update_package,
     update_all_packages,
 )
+from pypiserver.server import ThreadPoolWSGIServer
 
 
 def touch_files(root, files):
@@ -235,6 +244,8 @@ def test_update_all_packages(monkeypatch):
         destdir,
         dry_run,
         stable_only,
+        client=ANY,
+        workers=manage.UPDATE_WORKERS,
     )
 
 
@@ -272,5 +283,230 @@ def test_update_all_packages_with_blacklist(monkeypatch):
     )
 
     manage.update.assert_called_once_with(  # pylint: disable=no-member
-        frozenset([public_pkg_1, public_pkg_2]), destdir, dry_run, stable_only
+        frozenset([public_pkg_1, public_pkg_2]),
+        destdir,
+        dry_run,
+        stable_only,
+        client=ANY,
+        workers=manage.UPDATE_WORKERS,
+    )
+
+
+class FakeIndex:
+    """A PEP 691 JSON index, counting the requests and the connections."""
+
+    def __init__(self, versions):
+        self.versions = versions
+        self.requests = Counter()
+        self.not_modified = 0
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0.0
+        # The paths requested, and the credentials given to the proxy
+        self.paths = []
+        self.proxy_authorization = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        project = environ["PATH_INFO"].strip("/").rpartition("/")[2]
+        with self._lock:
+            self.paths.append(environ["PATH_INFO"])
+            self.requests[project] += 1
+            self.proxy_authorization = environ.get("HTTP_PROXY_AUTHORIZATION")
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if project not in self.versions:
+            start_response("404 Not Found", [("Content-Length", "0")])
+            return [b""]
+        etag = f'"{project}-{len(self.versions[project])}"'
+        if environ.get("HTTP_IF_NONE_MATCH") == etag:
+            self.not_modified += 1
+            start_response("304 Not Modified", [("ETag", etag)])
+            return [b""]
+        assert environ["HTTP_ACCEPT"] == IndexClient.accept
+        body = json.dumps(
+            {"name": project, "versions": self.versions[project]}
+        ).encode()
+        start_response(
+            "200 OK",
+            [
+                ("Content-Type", IndexClient.accept),
+                ("Content-Length", str(len(body))),
+                ("ETag", etag),
+            ],
+        )
+        return [body]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    for name in ("http_proxy", "https_proxy", "no_proxy", "all_proxy"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.upper(), raising=False)
+    index = FakeIndex(
+        {
+            f"pkg{i}": ["1.0", "2.0" if i % 2 else "1.0rc1"]
+            for i in range(10)
+        }
+    )
+
+    class Server(ThreadPoolWSGIServer):
+        def get_request(self):
+            index.connections += 1
+            return super().get_request()
+
+    server = Server(("127.0.0.1", 0), threads=16)
+    server.set_app(index)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    index.url = f"http://127.0.0.1:{server.server_port}/simple/"
+    yield index
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def local_pkgs(count):
+    return [
+        PkgFile(f"pkg{i}", "1.0", fn=f"/packages/pkg{i}-1.0.zip")
+        for i in range(count)
+    ]
+
+
+def test_find_updates(index, capsys):
+    pkgs = local_pkgs(10) + [PkgFile("unknown", "1.0", fn="unknown-1.0.zip")]
+    client = IndexClient(index.url)
+    need_update = find_updates(pkgs, client=client, workers=1)
+    assert sorted(pkg.pkgname for pkg in need_update) == [
+        "pkg1",
+        "pkg3",
+        "pkg5",
+        "pkg7",
+        "pkg9",
+    ]
+    assert all(pkg.version == "2.0" for pkg in need_update)
+    out = capsys.readouterr().out
+    assert out.startswith("checking 11 packages for newer version\n\n")
+    progress = out.splitlines()[2]
+    assert sorted(progress) == sorted("u" * 5 + "." * 5 + "e")
+    assert "no releases found on pypi for unknown" in out
+    # Kept alive
+    assert index.connections == 1
+
+
+def test_find_updates_concurrency(index, capsys):
+    index.delay = 0.05
+    find_updates(local_pkgs(10), client=IndexClient(index.url), workers=3)
+    assert index.max_in_flight == 3
+    # Reused, although the server may close some while others are queued
+    assert index.connections < sum(index.requests.values())
+
+
+def test_conditional_requests(index, tmp_path):
+    cache_file = tmp_path / "cache" / "update.json"
+    client = IndexClient(index.url, cache_file=cache_file)
+    assert client.releases("PKG1") == ["1.0", "2.0"]
+    assert client.releases("nope") is None
+    client.save()
+
+    # In another run
+    client = IndexClient(index.url, cache_file=cache_file)
+    assert client.releases("pkg1") == ["1.0", "2.0"]
+    assert index.not_modified == 1
+    # Until it changes
+    index.versions["pkg1"].append("3.0")
+    assert client.releases("pkg1") == ["1.0", "2.0", "3.0"]
+    assert index.not_modified == 1
+    assert index.requests["pkg1"] == 3
+
+
+def test_invalid_cache_file(index, tmp_path):
+    cache_file = tmp_path / "update.json"
+    cache_file.write_text("not json")
+    client = IndexClient(index.url, cache_file=cache_file)
+    assert client.releases("pkg1") == ["1.0", "2.0"]
+    client.save()
+    assert json.loads(cache_file.read_text())
+
+
+def test_index_errors(index):
+    index.delay = 1
+    with pytest.raises(IndexLookupError, match="timed out"):
+        IndexClient(index.url, timeout=0.1).releases("pkg1")
+    with pytest.raises(IndexLookupError):
+        IndexClient("http://127.0.0.1:9/simple/").releases("pkg1")
+
+
+def test_index_behind_proxy(index, monkeypatch):
+    # wsgiref serves absolute URLs too, so the index is its own proxy
+    proxy = index.url.replace("http://", "http://user:p%40ss@").rpartition(
+        "/simple/"
+    )[0]
+    monkeypatch.setenv("http_proxy", proxy)
+    client = IndexClient("http://pypi.invalid/simple/")
+    assert client.releases("pkg1") == ["1.0", "2.0"]
+    assert index.paths == ["http://pypi.invalid/simple/pkg1/"]
+    assert index.proxy_authorization == "Basic dXNlcjpwQHNz"
+
+    monkeypatch.setenv("no_proxy", "pypi.invalid")
+    with pytest.raises(IndexLookupError):
+        IndexClient("http://pypi.invalid/simple/").releases("pkg1")
+
+
+def test_index_tunneled_through_proxy(monkeypatch):
+    monkeypatch.setenv("https_proxy", "proxy.invalid:3128")
+    monkeypatch.delenv("no_proxy", raising=False)
+    monkeypatch.delenv("NO_PROXY", raising=False)
+    connection, _ = IndexClient()._connection("https", "pypi.org")
+    assert (connection.conn.host, connection.conn.port) == (
+        "proxy.invalid",
+        3128,
+    )
+    assert connection.conn._tunnel_host == "pypi.org"
+
+
+def test_find_updates_closes_connections(index, capsys):
+    client = IndexClient(index.url)
+    client.releases("pkg0")
+    (conn,) = client._connections
+    assert conn.sock is not None
+    find_updates(local_pkgs(4), client=client, workers=2)
+    assert conn.sock is None
+    assert client._connections == []
+    # Reconnects when used again
+    assert client.releases("pkg1") == ["1.0", "2.0"]
+
+
+def test_package_releases_close_their_client(index, monkeypatch):
+    clients = []
+
+    class Client(IndexClient):
+        def __init__(self):
+            super().__init__(index.url)
+            clients.append(self)
+
+    monkeypatch.setattr(manage, "IndexClient", Client)
+    assert get_package_releases("pkg1") == ["1.0", "2.0"]
+    (client,) = clients
+    assert client._connections == []
+
+
+def test_update_all_packages_from_index(index, monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr(manage, "listdir", lambda root: local_pkgs(2))
+    monkeypatch.setattr(manage, "call", Mock())
+    update_all_packages(
+        ["/packages"],
+        dry_run=True,
+        index_url=index.url,
+        workers=2,
+        cache_file=tmp_path / "update.json",
     )
+    out = capsys.readouterr().out
+    assert f"-i {index.url.rstrip('/')} -d /packages pkg1==2.0" in out
+    assert (tmp_path / "update.json").exists()
@@ -0,0 +1,118 @@
+"""Tests for running blocking work on OS threads under gevent."""
+
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+import pypiserver
+from pypiserver import offload
+from pypiserver.backend import CachingFileBackend, SimpleFileBackend
+from pypiserver.config import Config
+
+HTPASS_FILE = Path(__file__).parent / "../fixtures/htpasswd.a.a"
+
+
+class RecordingPool:
+    """Runs the work right away, recording the functions run."""
+
+    def __init__(self):
+        self.calls = []
+
+    def apply(self, fn, args=(), kwds=None):
+        self.calls.append(getattr(fn, "__name__", fn))
+        return fn(*args, **(kwds or {}))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = RecordingPool()
+    monkeypatch.setattr(offload, "_threadpool", lambda: pool)
+    return pool
+
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "foo-1.0.zip").write_bytes(b"zip")
+    return tmp_path
+
+
+def test_runs_inline_without_gevent():
+    assert offload.run(max, 1, 2) == 2
+    assert offload.run(sorted, [2, 1], reverse=True) == [2, 1]
+    # Still lazy
+    numbers = offload.iterate(iter, [1, 2])
+    assert not isinstance(numbers, list)
+    assert list(numbers) == [1, 2]
+
+
+def test_iterate_exhausts_on_the_pool(pool):
+    assert offload.iterate(iter, [1, 2]) == [1, 2]
+    assert pool.calls == ["<lambda>"]
+
+
+def test_digest(pool, root):
+    backend = SimpleFileBackend(
+        Config.default_with_overrides(roots=[root], hash_algo="sha256")
+    )
+    (pkg,) = backend.get_all_packages()
+    pool.calls.clear()
+    assert backend.digest(pkg).startswith("sha256=")
+    assert pool.calls == ["digest_file"]
+
+
+def test_listing(pool, root):
+    backend = CachingFileBackend(Config.default_with_overrides(roots=[root]))
+    assert [pkg.fn for pkg in backend.get_all_packages()] == [
+        str(root / "foo-1.0.zip")
+    ]
+    assert "<lambda>" in pool.calls
+
+
+def test_password_check(pool):
+    config = Config.default_with_overrides(
+        password_file=str(HTPASS_FILE), authenticate=["update"]
+    )
+    assert config.auther("a", "a")
+    assert not config.auther("a", "b")
+    assert pool.calls == ["check_password", "check_password"]
+
+
+def test_pool_size(monkeypatch, root):
+    monkeypatch.setattr(offload, "_threads", None)
+    pypiserver.app(roots=[root], offload_threads=3)
+    assert offload._threads == 3
+
+
+def test_gevent(root):
+    pytest.importorskip("gevent")
+    script = textwrap.dedent(
+        f"""
+        from gevent import monkey
+
+        monkey.patch_all()
+
+        import threading
+
+        import gevent
+        import pypiserver
+        from pypiserver import backend, offload
+
+        threads = set()
+
+        def digest_file(path, hash_algo):
+            threads.add(threading.get_ident())
+            return "digest"
+
+        backend.digest_file = digest_file
+        app = pypiserver.app(roots=[{str(root)!r}], offload_threads=2)
+        packages = app._pypiserver_config.backend
+        (pkg,) = packages.get_all_packages()
+        gevent.joinall([gevent.spawn(packages.digest, pkg) for _ in range(4)])
+        assert threading.get_ident() not in threads, threads
+        assert offload._threadpool().maxsize == 2
+        """
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=60)
@@ -3,7 +3,13 @@ from pathlib import WindowsPath, PureWindowsPath
 
 import pytest
 
-from pypiserver.pkg_helpers import guess_pkgname_and_version, is_listed_path
+from pypiserver import pkg_helpers
+from pypiserver.pkg_helpers import (
+    guess_pkgname_and_version,
+    is_listed_path,
+    parse_version,
+    version_key,
+)
 
 files = [
     ("pytz-2012b.tar.bz2", "pytz", "2012b"),
@@ -104,6 +110,58 @@ def test_guess_pkgname_and_version_invalid_files(filename):
     assert guess_pkgname_and_version(filename) is None
 
 
+def _guess_with_regexes(path):
+    """The classification without suffix dispatch, for comparison."""
+    if path.endswith(".asc"):
+        path = path.rstrip(".asc")
+    if path.endswith(".whl"):
+        return pkg_helpers._guess_pkgname_and_version_wheel(path)
+    if not pkg_helpers._archive_suffix_rx.search(path):
+        return None
+    path = pkg_helpers._archive_suffix_rx.sub("", path)
+    if "-" not in path:
+        return path, ""
+    if path.count("-") == 1:
+        return tuple(path.split("-", 1))
+    if "." not in path:
+        return tuple(path.rsplit("-", 1))
+    pkgname = pkg_helpers._pkgname_re.split(path)[0]
+    ver_spec = path[len(pkgname) + 1 :]
+    return pkgname, pkg_helpers._pkgname_parts_re.split(ver_spec)[0]
+
+
+@pytest.mark.parametrize(
+    "stem",
+    [
+        "pkg-1.0",
+        "Pkg_Name-2.0b1",
+        "pkg-1.0-py3.8-linux-x86_64",
+        "pkg-1.0.win-amd64-py3.2",
+        "pkg-1.0.win32-py2.7",
+        "pkg-1.0-PY3.1-win32",
+        "pkg-1.0.zip",
+        "pkg-1.0.tar",
+        "pkg-1.0.egg-info",
+        "pkg-1.0-ünicode",
+        "pkg",
+    ],
+)
+@pytest.mark.parametrize(
+    "suffix",
+    ["", ".zip", ".ZIP", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".egg"]
+    + [".exe", ".msi", ".txt", ".gz", ".zip.asc", ".Tar.Gz.asc", ".whl"],
+)
+def test_guess_pkgname_and_version_suffix_dispatch(stem, suffix):
+    filename = stem + suffix
+    assert guess_pkgname_and_version(filename) == _guess_with_regexes(filename)
+
+
+def test_guess_pkgname_and_version_is_memoized():
+    assert guess_pkgname_and_version(
+        "/a/pkg-1.0.zip"
+    ) is guess_pkgname_and_version("/b/pkg-1.0.zip")
+
+
 paths = [
     ("/some/path", True),
     (PureWindowsPath(r"c:\some\windows\path"), True),
@@ -115,3 +173,53 @@ paths = [
 @pytest.mark.parametrize(("pathname", "allowed"), paths)
 def test_allowed_path_check(pathname, allowed):
     assert is_listed_path(pathname) == allowed
+
+
+versions = [
+    "0.1",
+    "0.9.post1",
+    "1",
+    "1.0",
+    "1.0.0",
+    "1.0a1",
+    "1.0b2",
+    "1.0rc1",
+    "1.0c1",
+    "1.0-rc1",
+    "1.0.dev0",
+    "1.0.dev20240101",
+    "1.0-1",
+    "1.0.post2",
+    "1.0+local.7",
+    "1.0.0-alpha.1",
+    "1.2.10",
+    "1.10",
+    "2!1.0",
+    "2013.02.17.dev123",
+    "20000101",
+    "123456789",
+    "99999999",
+    "1.3.7+build.11.e0f985a",
+    "8.1.301.ga0df26f",
+    "5.5.0-DEV",
+    "0.3.4.win-amd64",
+    "1.0\udce9",
+    "1.0é",
+    "",
+]
+
+
+@pytest.mark.parametrize("first", versions)
+def test_version_key_sorts_like_parse_version(first):
+    for second in versions:
+        assert (version_key(first) < version_key(second)) == (
+            parse_version(first) < parse_version(second)
+        ), (first, second)
+        assert (version_key(first) == version_key(second)) == (
+            parse_version(first) == parse_version(second)
+        ), (first, second)
+
+
+def test_parse_version_is_memoized():
+    assert parse_version("1.2.3") is parse_version("1.2.3")
+    assert version_key("1.2.3") is version_key("1.2.3")
@@ -0,0 +1,184 @@
+"""Tests for pre-forking multi-process serving."""
+
+import os
+import signal
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from pypiserver import prefork
+from pypiserver.backend import CachingFileBackend
+from pypiserver.config import Config
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, "fork"), reason="needs os.fork"
+)
+
+
+def app(environ, start_response):
+    if environ["PATH_INFO"] == "/slow":
+        time.sleep(0.5)
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [str(os.getpid()).encode()]
+
+
+def _get(sock, path="/"):
+    port = sock.getsockname()[1]
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}") as res:
+        return int(res.read())
+
+
+def _reap_until(master, count, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    exited = []
+    while len(exited) < count and time.monotonic() < deadline:
+        exited.extend(master.reap())
+        time.sleep(0.01)
+    return exited
+
+
+@pytest.fixture
+def sock():
+    sock = prefork.listen("127.0.0.1", 0)
+    yield sock
+    sock.close()
+
+
+def test_socket_server(sock):
+    server = prefork.SocketWSGIServer(sock)
+    server.set_app(app)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        assert _get(sock) == os.getpid()
+    finally:
+        server.shutdown()
+        thread.join()
+    assert server.server_port == sock.getsockname()[1]
+
+
+def test_master_restarts_workers(sock):
+    master = prefork.Master(
+        sock, lambda sock: prefork.serve_socket(app, sock), workers=2
+    )
+    try:
+        pids = {master.spawn(), master.spawn()}
+        assert _get(sock) in pids
+
+        killed = pids.pop()
+        os.kill(killed, signal.SIGKILL)
+        assert _reap_until(master, 1) == [killed]
+        pids.add(master.spawn())
+        assert set(master.children) == pids
+    finally:
+        master.shutdown()
+    assert master.children == {}
+
+
+def test_master_backs_off_failing_workers(sock):
+    master = prefork.Master(sock, lambda sock: None, workers=1)
+    master.spawn()
+    assert len(_reap_until(master, 1)) == 1
+    assert master.respawn_delay == prefork._SUPERVISE_INTERVAL
+    master.spawn()
+    _reap_until(master, 1)
+    assert master.respawn_delay == 2 * prefork._SUPERVISE_INTERVAL
+    master.shutdown()
+
+
+def test_shutdown_finishes_requests_in_flight(sock):
+    master = prefork.Master(
+        sock, lambda sock: prefork.serve_socket(app, sock), workers=1
+    )
+    pid = master.spawn()
+    # Wait for the worker to serve
+    assert _get(sock) == pid
+
+    responses = []
+    request = threading.Thread(
+        target=lambda: responses.append(_get(sock, "/slow"))
+    )
+    request.start()
+    time.sleep(0.2)
+    master.shutdown()
+    request.join()
+    assert responses == [pid]
+    assert master.children == {}
+
+
+def test_shutdown_kills_stuck_workers(sock):
+    def worker(sock):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        time.sleep(60)
+
+    master = prefork.Master(sock, worker, workers=1, graceful_timeout=0.2)
+    master.spawn()
+    start = time.monotonic()
+    master.shutdown()
+    assert time.monotonic() - start < 10
+    assert master.children == {}
+
+
+def test_forked_cache_manager(tmp_path):
+    root = tmp_path / "packages"
+    root.mkdir()
+    (root / "foo-1.0.zip").write_bytes(b"content")
+    backend = CachingFileBackend(Config.default_with_overrides(roots=[root]))
+    manager = backend.cache_manager
+    assert backend.package_count() == 1
+    assert manager.observer is not None
+
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        # The listing is kept, and the roots watched again when listed
+        ok = (
+            manager.observer is None
+            and str(root) in manager.listdir_cache
+            and backend.package_count() == 1
+            and manager.observer is not None
+        )
+        manager.observer.stop()
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    # The parent's locks are released, and its watches kept
+    assert not manager.listdir_lock.locked()
+    assert str(root) in manager.watched
+
+
+def test_workers_share_the_watch_budget(tmp_path):
+    for path in ("a/foo-1.0.zip", "b/sub/bar-1.0.zip"):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_bytes(b"content")
+    roots = [tmp_path / "a", tmp_path / "b"]
+    backend = CachingFileBackend(
+        Config.default_with_overrides(roots=roots, watch_budget=3)
+    )
+    manager = backend.cache_manager
+    assert backend.package_count() == 2
+    assert manager.watch_count == 3
+
+    backend.prepare_workers(2)
+    assert manager.observer is None
+    assert manager.watch_count == 0
+    # Added before the workers watch the roots again
+    (tmp_path / "a" / "foo-2.0.zip").write_bytes(b"content")
+
+    pids = []
+    for _ in range(2):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            # Each worker watches what fits in its share of the budget
+            ok = (
+                backend.package_count() == 3
+                and manager.watched == {str(roots[0])}
+                and manager.fallback_roots == {str(roots[1])}
+            )
+            manager.observer.stop()
+            os._exit(0 if ok else 1)
+        pids.append(pid)
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,268 @@
+"""Tests for the pull-through proxy, against a local stand-in upstream."""
+
+import hashlib
+import threading
+from collections import Counter
+
+import pytest
+import webtest
+
+import pypiserver
+from pypiserver.layout import get_layout
+from pypiserver.proxy import Proxy, UpstreamError, parse_links
+from pypiserver.server import ThreadPoolWSGIServer
+from pypiserver.tokens import create_key
+
+WHEEL = b"wheel content"
+SHA256 = hashlib.sha256(WHEEL).hexdigest()
+
+
+class Upstream:
+    """A PEP 503 index serving the `foo` project."""
+
+    def __init__(self):
+        self.requests = Counter()
+        self.digest = SHA256
+        self.down = False
+        self.released = threading.Event()
+        self.released.set()
+
+    def __call__(self, environ, start_response):
+        path = environ["PATH_INFO"]
+        self.requests[path] += 1
+        if self.down:
+            start_response("503 Service Unavailable", [])
+            return [b""]
+        if path == "/simple/foo/":
+            start_response("200 OK", [("Content-Type", "text/html")])
+            return [
+                (
+                    "<html><body>"
+                    f'<a href="../../files/foo-1.0-py3-none-any.whl'
+                    f'#sha256={self.digest}" '
+                    'data-requires-python="&gt;=3.8">'
+                    "foo-1.0-py3-none-any.whl</a>"
+                    '<a href="/files/README.txt">README.txt</a>'
+                    "</body></html>"
+                ).encode()
+            ]
+        if path == "/files/foo-1.0-py3-none-any.whl":
+            self.released.wait(10)
+            start_response(
+                "200 OK", [("Content-Type", "application/octet-stream")]
+            )
+            return [WHEEL]
+        start_response("404 Not Found", [])
+        return [b""]
+
+
+@pytest.fixture
+def upstream():
+    upstream = Upstream()
+    server = ThreadPoolWSGIServer(("127.0.0.1", 0), threads=4)
+    server.set_app(upstream)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    upstream.url = f"http://127.0.0.1:{server.server_port}/simple/"
+    yield upstream
+    upstream.released.set()
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+@pytest.fixture
+def root(tmp_path):
+    root = tmp_path / "packages"
+    root.mkdir()
+    return root
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return tmp_path / "cache"
+
+
+def make_app(root, cache, upstream, **kwargs):
+    return webtest.TestApp(
+        pypiserver.app(
+            roots=[root],
+            proxy_cache=cache,
+            fallback_url=upstream.url,
+            **kwargs,
+        )
+    )
+
+
+def test_parse_links():
+    links = parse_links(
+        '<a href="foo-1.0.tar.gz#md5=abc">x</a>'
+        '<a href="https://files.example/a/foo-2.0.zip" data-yanked="">y</a>'
+        '<a href="../.hidden-1.0.zip">z</a>'
+        '<a href="foo-3.0.tar.gz#frag">z</a>'
+        "<a>no href</a>",
+        "https://index.example/simple/foo/",
+    )
+    assert [(link.filename, link.url, link.digest) for link in links] == [
+        (
+            "foo-1.0.tar.gz",
+            "https://index.example/simple/foo/foo-1.0.tar.gz",
+            "md5=abc",
+        ),
+        ("foo-2.0.zip", "https://files.example/a/foo-2.0.zip", None),
+        (
+            "foo-3.0.tar.gz",
+            "https://index.example/simple/foo/foo-3.0.tar.gz",
+            None,
+        ),
+    ]
+    assert links[1].attributes == (("data-yanked", ""),)
+
+
+def test_proxied_project(root, cache, upstream):
+    app = make_app(root, cache, upstream)
+    page = app.get("/simple/foo/")
+    (link,) = page.html.find_all("a")
+    assert link["href"] == (
+        f"/packages/foo-1.0-py3-none-any.whl#sha256={SHA256}"
+    )
+    assert link["data-requires-python"] == ">=3.8"
+
+    assert app.get("/packages/foo-1.0-py3-none-any.whl").body == WHEEL
+    assert (cache / "foo-1.0-py3-none-any.whl").read_bytes() == WHEEL
+    assert app.get("/packages/foo-1.0-py3-none-any.whl").body == WHEEL
+    assert upstream.requests["/files/foo-1.0-py3-none-any.whl"] == 1
+    # Within the TTL of the page
+    app.get("/simple/foo/")
+    assert upstream.requests["/simple/foo/"] == 1
+
+
+def test_local_projects_take_precedence(root, cache, upstream):
+    (root / "foo-0.1.zip").write_bytes(b"local")
+    app = make_app(root, cache, upstream)
+    assert "foo-0.1.zip" in app.get("/simple/foo/").text
+    assert not upstream.requests
+    # Nor are the files of other versions proxied
+    app.get("/packages/foo-1.0-py3-none-any.whl", status=404)
+
+
+def test_cached_files_do_not_hide_upstream(root, cache, upstream):
+    app = make_app(root, cache, upstream, proxy_index_ttl=0)
+    app.get("/packages/foo-1.0-py3-none-any.whl")
+    app.get("/simple/foo/")
+    assert upstream.requests["/simple/foo/"] == 2
+
+
+def test_unknown_projects(root, cache, upstream):
+    app = make_app(root, cache, upstream)
+    app.get("/simple/nope/", status=404)
+    app.get("/simple/nope/", status=404)
+    assert upstream.requests["/simple/nope/"] == 1
+    app.get("/packages/nope-1.0.zip", status=404)
+    assert upstream.requests["/simple/nope/"] == 1
+
+    app = make_app(root, cache, upstream, proxy_negative_ttl=0)
+    app.get("/simple/nope/", status=404)
+    app.get("/simple/nope/", status=404)
+    assert upstream.requests["/simple/nope/"] == 3
+
+
+def test_upstream_down(root, cache, upstream):
+    app = make_app(root, cache, upstream, proxy_index_ttl=0)
+    app.get("/simple/foo/")
+    upstream.down = True
+    # The expired page
+    assert "foo-1.0" in app.get("/simple/foo/").text
+    app.get("/packages/foo-1.0-py3-none-any.whl", status=502)
+    app.get("/simple/bar/", status=502)
+
+
+def test_upstream_down_serves_cached_files(root, cache, upstream):
+    make_app(root, cache, upstream).get("/packages/foo-1.0-py3-none-any.whl")
+    upstream.down = True
+    app = make_app(root, cache, upstream)
+    assert "foo-1.0" in app.get("/simple/foo/").text
+    assert app.get("/packages/foo-1.0-py3-none-any.whl").body == WHEEL
+
+
+def test_digest_mismatch(root, cache, upstream):
+    upstream.digest = "0" * 64
+    app = make_app(root, cache, upstream)
+    app.get("/packages/foo-1.0-py3-none-any.whl", status=502)
+    assert not any(cache.iterdir())
+
+
+def test_layout(root, cache, upstream):
+    app = make_app(root, cache, upstream, layout="project")
+    (link,) = app.get("/simple/foo/").html.find_all("a")
+    path = link["href"].partition("#")[0]
+    assert path == "/packages/foo/foo-1.0-py3-none-any.whl"
+    assert app.get(path).body == WHEEL
+    assert (cache / "foo" / "foo-1.0-py3-none-any.whl").exists()
+    # Nor elsewhere
+    app.get("/packages/foo-1.0-py3-none-any.whl", status=404)
+
+
+def test_signed_urls(tmp_path, root, cache, upstream):
+    key_file = tmp_path / "token.key"
+    create_key(key_file)
+    app = make_app(
+        root,
+        cache,
+        upstream,
+        authenticate=["download"],
+        password_file=None,
+        token_key=key_file,
+        signed_urls=3600,
+    )
+    (link,) = app.get("/simple/foo/").html.find_all("a")
+    url, _, fragment = link["href"].partition("#")
+    assert url.startswith("/packages/foo-1.0-py3-none-any.whl?expires=")
+    assert fragment == f"sha256={SHA256}"
+    # Without credentials
+    assert app.get(url).body == WHEEL
+    app.get("/packages/foo-1.0-py3-none-any.whl", status=401)
+
+
+def test_concurrent_fetches_are_shared(cache, upstream):
+    proxy = Proxy(cache, upstream.url, get_layout("flat"), 60, 60)
+    upstream.released.clear()
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                proxy.fetch("foo-1.0-py3-none-any.whl")
+            )
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    threading.Timer(0.2, upstream.released.set).start()
+    for thread in threads:
+        thread.join()
+    assert results == [cache / "foo-1.0-py3-none-any.whl"] * 4
+    assert upstream.requests["/simple/foo/"] == 1
+    assert upstream.requests["/files/foo-1.0-py3-none-any.whl"] == 1
+
+
+def test_unreachable_upstream(cache):
+    proxy = Proxy(
+        cache, "http://127.0.0.1:9/simple/", get_layout("flat"), 60, 60
+    )
+    with pytest.raises(UpstreamError):
+        proxy.project_links("foo")
+
+
+def test_config(root, cache, upstream):
+    config = pypiserver.Config.default_with_overrides(
+        roots=[root],
+        proxy_cache=cache,
+        fallback_url=upstream.url,
+        proxy_index_ttl=5,
+    )
+    assert cache.is_dir()
+    assert config.roots == [root, cache]
+    assert config.package_root == root
+    assert (config.proxy.index_ttl, config.proxy.negative_ttl) == (5, 60)
+    assert config.with_updates(verbosity=2).roots == [root, cache]
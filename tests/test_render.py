@@ -0,0 +1,76 @@
+"""The precompiled renderers must match the former templates byte for byte."""
+
+import os
+from urllib.parse import urljoin
+
+import pytest
+
+from pypiserver import render
+from pypiserver.bottle_wrapper import template
+from pypiserver.core import PkgFile
+from tests import templates
+
+SIMPLE_URL = "http://localhost/simple/foo/"
+PACKAGES_URL = "http://localhost/packages/"
+
+
+def make_pkg(relfn, digest=None):
+    pkg = PkgFile("foo", "1.0", f"/root/{relfn}", "/root", relfn)
+    pkg.digest = digest
+    return pkg
+
+
+PACKAGES = [
+    [],
+    [make_pkg("foo-1.0.zip")],
+    [
+        make_pkg("foo-1.0.zip", "sha256=abc"),
+        make_pkg("sub/foo-1.1.tar.gz", "md5=def"),
+        make_pkg("we<i>rd/f&o'o\"-1.2.zip"),
+    ],
+]
+
+
+@pytest.mark.parametrize(
+    "projects", [[], ["foo"], ["foo", "bar-baz", "<script>", "a&b"]]
+)
+def test_render_simple_index(projects):
+    expected = template(templates.SIMPLE_INDEX, links=projects)
+    assert render.render_simple_index(projects) == expected
+
+
+@pytest.mark.parametrize("project", ["foo", "f<o>o"])
+@pytest.mark.parametrize("packages", PACKAGES)
+def test_render_project_links(project, packages):
+    links = (
+        (
+            os.path.basename(pkg.relfn),
+            urljoin(SIMPLE_URL, f"../../packages/{pkg.fname_and_hash}"),
+        )
+        for pkg in packages
+    )
+    expected = template(templates.PROJECT_LINKS, project=project, links=links)
+    packages_url = urljoin(SIMPLE_URL, "../../packages/")
+    assert render.render_project_links(project, packages_url, packages) == (
+        expected
+    )
+
+
+@pytest.mark.parametrize("packages", PACKAGES)
+def test_render_listing(packages):
+    links = (
+        (pkg.relfn_unix, urljoin(PACKAGES_URL, pkg.fname_and_hash))
+        for pkg in packages
+    )
+    expected = template(templates.LISTING, links=links)
+    chunks = render.render_listing("Index of packages", PACKAGES_URL, packages)
+    assert "".join(chunks) == expected
+
+
+def test_render_listing_in_chunks(monkeypatch):
+    monkeypatch.setattr(render, "LISTING_CHUNK_SIZE", 2)
+    packages = [make_pkg(f"foo-1.{i}.zip") for i in range(5)]
+    chunks = list(render.render_listing("Title", PACKAGES_URL, packages))
+    # header, three chunks of links and footer
+    assert len(chunks) == 5
+    assert "".join(chunks).count("<a href=") == 5
@@ -0,0 +1,302 @@
+"""Tests for catalog snapshots shared between processes."""
+
+import gc
+import io
+import os
+import weakref
+from pathlib import Path
+
+import pytest
+
+from pypiserver import backend as backend_module, snapshot as snapshot_module
+from pypiserver.backend import CachingFileBackend, SnapshotBackend
+from pypiserver.config import Config
+from pypiserver.core import PkgFile
+from pypiserver.snapshot import (
+    Snapshot,
+    SnapshotError,
+    SnapshotReader,
+    snapshot_generation,
+    write_snapshot,
+)
+
+
+def _create(root: Path, *relpaths: str) -> None:
+    for relpath in relpaths:
+        path = root / relpath
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(relpath.encode())
+
+
+def _publish(backend: CachingFileBackend, path: Path, generation: int = 1):
+    write_snapshot(
+        path,
+        backend.get_sorted_packages(),
+        (
+            (project, backend.find_sorted_project_packages(project))
+            for project in backend.get_sorted_projects()
+        ),
+        generation,
+        digest=lambda pkg: "md5=1" if pkg.version == "1.0" else None,
+    )
+
+
+def _relfns(packages):
+    return [pkg.relfn for pkg in packages]
+
+
+@pytest.fixture
+def packages(tmp_path):
+    root = tmp_path / "packages"
+    _create(
+        root,
+        "foo-1.0.zip",
+        "foo-2.0.tar.gz",
+        "sub/Foo_Bar-0.1.zip",
+        "sub/foo-1.1.zip",
+        "b\xe9-3.0.zip",
+    )
+    return CachingFileBackend(Config.default_with_overrides(roots=[root]))
+
+
+def test_snapshot_mirrors_catalog(tmp_path, packages):
+    path = tmp_path / "catalog.snap"
+    _publish(packages, path, generation=3)
+    snapshot = Snapshot(path, digester=lambda pkg: "md5=computed")
+
+    assert snapshot.generation == 3
+    assert len(snapshot) == 5
+    assert _relfns(snapshot.sorted_packages()) == _relfns(
+        packages.get_sorted_packages()
+    )
+    assert list(snapshot.projects()) == list(packages.get_sorted_projects())
+    for project in packages.get_sorted_projects():
+        assert _relfns(snapshot.find_project(project)) == _relfns(
+            packages.find_sorted_project_packages(project)
+        )
+    assert snapshot.find_project("missing") == ()
+
+    (pkg,) = snapshot.find_project("foo-bar")
+    expected = next(iter(packages.find_sorted_project_packages("foo-bar")))
+    for attr in PkgFile.__slots__:
+        if attr not in ("digest", "digester"):
+            assert getattr(pkg, attr) == getattr(expected, attr), attr
+    # Known digests are stored, the others computed by the digester
+    assert [p.fname_and_hash for p in snapshot.find_project("foo")] == [
+        "foo-1.0.zip#md5=1",
+        "sub/foo-1.1.zip#md5=computed",
+        "foo-2.0.tar.gz#md5=computed",
+    ]
+
+
+def test_empty_snapshot(tmp_path):
+    path = tmp_path / "catalog.snap"
+    write_snapshot(path, [], [], 1)
+    snapshot = Snapshot(path)
+    assert len(snapshot) == 0
+    assert list(snapshot.projects()) == []
+    assert snapshot.find_project("foo") == ()
+
+
+@pytest.mark.parametrize("content", [b"", b"PYPISNP1", b"not a snapshot" * 8])
+def test_invalid_snapshot(tmp_path, content):
+    path = tmp_path / "catalog.snap"
+    path.write_bytes(content)
+    with pytest.raises(SnapshotError):
+        Snapshot(path)
+    assert snapshot_generation(path) == 0
+
+
+def test_reader_swaps_generations(tmp_path, packages):
+    path = tmp_path / "catalog.snap"
+    reader = SnapshotReader(path, interval=3600)
+    assert reader.get() is None
+    assert snapshot_generation(path) == 0
+
+    _publish(packages, path, generation=1)
+    assert reader.refresh().generation == 1
+    old = reader.get()
+    listing = old.sorted_packages()
+
+    packages.remove_package(next(iter(packages.find_version("foo", "1.0"))))
+    _publish(packages, path, generation=2)
+    # Not checked again before the interval
+    assert reader.get() is old
+    assert reader.refresh().generation == 2
+    assert len(reader.get()) == 4
+    # The previous generation is still mapped and readable
+    assert len(list(listing)) == 5
+    assert snapshot_generation(path) == 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_reader_keeps_serving_over_invalid_snapshots(
+    tmp_path, packages, monkeypatch, caplog
+):
+    path = tmp_path / "catalog.snap"
+    reader = SnapshotReader(path, interval=3600)
+    _publish(packages, path, generation=1)
+    good = reader.refresh()
+
+    # Replaced, as a publisher would, by a truncated file
+    (tmp_path / "catalog.tmp").write_bytes(path.read_bytes()[:64])
+    os.replace(tmp_path / "catalog.tmp", path)
+    mapped = []
+    monkeypatch.setattr(
+        snapshot_module,
+        "Snapshot",
+        lambda *args: mapped.append(args) or Snapshot(*args),
+    )
+    assert reader.refresh() is good
+    assert "truncated" in caplog.text
+    # Not mapped again until it changes
+    assert reader.refresh() is good
+    assert len(mapped) == 1
+    assert len(good) == 5
+
+    _publish(packages, path, generation=2)
+    assert reader.refresh().generation == 2
+    assert len(mapped) == 2
+
+
+@pytest.fixture
+def config(tmp_path, monkeypatch):
+    # Publish from the tests only
+    monkeypatch.setattr(
+        backend_module, "_publish_periodically", lambda ref: None
+    )
+    root = tmp_path / "packages"
+    _create(root, "foo-1.0.zip", "sub/bar-2.0.zip")
+    # Directories modified too recently are listed again on every poll
+    for path in (root, root / "sub"):
+        os.utime(path, ns=(0, 0))
+    return Config.default_with_overrides(
+        roots=[root],
+        snapshot=tmp_path / "catalog.snap",
+        poll_roots=[root],
+        poll_interval=0,
+    )
+
+
+def test_publishing_stops_with_the_backend(config):
+    backend = SnapshotBackend(config)
+    backend._lead()
+    ref = weakref.ref(backend)
+    del backend
+    gc.collect()
+    # Returns right away, rather than publishing forever
+    backend_module._publish_periodically(ref)
+
+
+def test_auto_backend_with_snapshot(config):
+    assert isinstance(config.backend.backend, SnapshotBackend)
+
+
+def test_snapshot_backend_publishes(config):
+    leader, follower = SnapshotBackend(config), SnapshotBackend(config)
+    assert list(leader.get_sorted_projects()) == ["bar", "foo"]
+    assert leader.leader is not None
+    assert list(follower.get_sorted_projects()) == ["bar", "foo"]
+    assert follower.leader is None
+    assert follower.package_count() == 2
+    assert follower.exists("foo-1.0.zip")
+    assert not follower.exists("foo-2.0.zip")
+    generation = follower.reader.get().generation
+
+    # Uploads to the leader are published right away
+    leader.add_package("foo-2.0.zip", io.BytesIO(b"content"))
+    assert [p.version for p in follower.find_project_packages("foo")] == [
+        "1.0",
+        "2.0",
+    ]
+    assert follower.reader.get().generation == generation + 1
+
+    # The follower's, once the leader notices them
+    follower.add_package("baz-0.1.zip", io.BytesIO(b"content"))
+    assert "baz" not in follower.get_sorted_projects()
+    assert leader.publish()
+    assert not leader.publish()
+    assert "baz" in follower.get_sorted_projects()
+    (pkg,) = follower.find_version("baz", "0.1")
+    follower.remove_package(pkg)
+    assert leader.publish()
+    assert "baz" not in follower.get_sorted_projects()
+
+
+def test_snapshot_backend_fills_digests(config):
+    leader = SnapshotBackend(config)
+    (pkg,) = leader.find_version("foo", "1.0")
+    assert pkg.digest is None
+    assert leader.fill_digests()
+    (pkg,) = leader.find_version("foo", "1.0")
+    assert pkg.digest is not None and pkg.digest.startswith("sha256=")
+    assert not leader.fill_digests()
+
+
+def test_snapshot_backend_fills_more_digests_than_cached(config, monkeypatch):
+    root = config.roots[0]
+    _create(root, *(f"pkg{i}-1.0.zip" for i in range(4)))
+    # Neither are files modified too recently
+    for path in [*root.glob("*.zip"), *root.glob("*/*.zip"), root]:
+        os.utime(path, ns=(0, 0))
+    hashed = []
+    digest_file = backend_module.digest_file
+    monkeypatch.setattr(
+        backend_module,
+        "digest_file",
+        lambda path, algo: hashed.append(path) or digest_file(path, algo),
+    )
+    leader = SnapshotBackend(config.with_updates(digest_cache_entries=2))
+    assert leader.package_count() == 6
+    assert leader.fill_digests()
+    assert leader._missing_digests == 0
+    assert len(hashed) == 6
+    assert all(pkg.digest for pkg in leader.get_all_packages())
+
+    # Nothing is hashed again, nor published
+    for _ in range(3):
+        assert not leader.publish()
+        assert not leader.fill_digests()
+    assert leader.publish(force=True)
+    assert all(pkg.digest for pkg in leader.get_all_packages())
+    assert len(hashed) == 6
+
+    # Only the new package, once uploaded
+    leader.add_package("pkg9-1.0.zip", io.BytesIO(b"content"))
+    assert leader.fill_digests()
+    assert len(hashed) == 7
+
+    # And rewritten ones
+    leader.add_package("pkg9-1.0.zip", io.BytesIO(b"new content"))
+    (pkg,) = leader.find_version("pkg9", "1.0")
+    assert pkg.digest is None
+    assert leader.fill_digests()
+    assert len(hashed) == 8
+
+
+def test_snapshot_backend_lists_roots_until_published(config):
+    leader, follower = SnapshotBackend(config), SnapshotBackend(config)
+    # Hold the lock without publishing anything
+    assert leader._acquire_lock()
+    assert follower.reader.get() is None
+    assert sorted(follower.get_projects()) == ["bar", "foo"]
+    assert [p.version for p in follower.find_version("foo", "1.0")] == ["1.0"]
+    assert follower.leader is None
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_workers_follow(config):
+    backend = SnapshotBackend(config)
+    assert backend.package_count() == 2
+    assert backend.leader is not None
+
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        ok = (
+            backend._lead() is None
+            and backend.package_count() == 2
+            and list(backend.get_sorted_projects()) == ["bar", "foo"]
+        )
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,134 @@
+"""Tests for the built-in threaded server."""
+
+import http.client
+import socket
+import threading
+
+import pytest
+
+from pypiserver.server import ThreadPoolWSGIServer
+
+released = threading.Event()
+
+
+def app(environ, start_response):
+    path = environ["PATH_INFO"]
+    if path == "/slow":
+        released.wait(10)
+    if path == "/stream":
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return iter([b"a", b"b"])
+    body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [path.encode() + body]
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def serve(**kwargs):
+        server = ThreadPoolWSGIServer(("127.0.0.1", 0), **kwargs)
+        server.set_app(app)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        servers.append((server, thread))
+        return server
+
+    released.clear()
+    yield serve
+    released.set()
+    for server, thread in servers:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def _connect(server):
+    return http.client.HTTPConnection("127.0.0.1", server.server_port, 10)
+
+
+def _get(conn, path="/"):
+    conn.request("GET", path)
+    res = conn.getresponse()
+    return res, res.read()
+
+
+def test_keeps_connections_alive(serve):
+    server = serve()
+    conn = _connect(server)
+    res, body = _get(conn, "/first")
+    assert (res.version, body) == (11, b"/first")
+    assert not res.will_close
+    sock = conn.sock
+    assert _get(conn, "/second")[1] == b"/second"
+    # The same connection served both
+    assert conn.sock is sock
+
+
+@pytest.mark.parametrize(
+    "request_kwargs",
+    [
+        {"url": "/stream"},
+        {"url": "/upload", "body": b"data", "method": "POST"},
+        {"url": "/", "headers": {"Connection": "close"}},
+    ],
+)
+def test_closes_connections(serve, request_kwargs):
+    conn = _connect(serve())
+    conn.request(request_kwargs.pop("method", "GET"), **request_kwargs)
+    res = conn.getresponse()
+    res.read()
+    assert res.getheader("Connection") == "close"
+    assert res.will_close
+
+
+def test_closes_http10_connections(serve):
+    server = serve()
+    with socket.create_connection(("127.0.0.1", server.server_port)) as sock:
+        sock.sendall(b"GET /old HTTP/1.0\r\n\r\n")
+        response = b""
+        for chunk in iter(lambda: sock.recv(4096), b""):
+            response += chunk
+    assert response.endswith(b"\r\n\r\n/old")
+
+
+def test_slow_requests_do_not_block_others(serve):
+    server = serve(threads=2)
+    slow = _connect(server)
+    slow.request("GET", "/slow")
+    assert _get(_connect(server), "/fast")[1] == b"/fast"
+    released.set()
+    assert slow.getresponse().read() == b"/slow"
+
+
+def test_idle_connections_give_way(serve):
+    server = serve(threads=1, keepalive_timeout=30)
+    idle = _connect(server)
+    assert _get(idle)[1] == b"/"
+    # The only thread would otherwise wait for the idle connection
+    assert _get(_connect(server), "/next")[1] == b"/next"
+
+
+def test_keepalive_disabled(serve):
+    res, _ = _get(_connect(serve(keepalive_timeout=0)))
+    assert res.getheader("Connection") == "close"
+
+
+def test_close_finishes_requests_in_flight():
+    server = ThreadPoolWSGIServer(("127.0.0.1", 0), threads=2)
+    server.set_app(app)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    released.clear()
+    slow = _connect(server)
+    slow.request("GET", "/slow")
+    idle = _connect(server)
+    _get(idle)
+
+    server.shutdown()
+    thread.join()
+    threading.Timer(0.2, released.set).start()
+    server.server_close()
+    assert slow.getresponse().read() == b"/slow"
+    assert not any(t.is_alive() for t in server.threads)
@@ -0,0 +1,222 @@
+"""Tests for API tokens."""
+
+import base64
+import os
+
+import pytest
+import webtest
+
+import pypiserver
+from pypiserver import __main__
+from pypiserver.config import Config, TokenConfig
+from pypiserver.tokens import (
+    TokenSigner,
+    URLSigner,
+    create_key,
+    load_key,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def key_file(tmp_path):
+    path = tmp_path / "token.key"
+    create_key(path)
+    return path
+
+
+def test_key(tmp_path, key_file):
+    assert len(load_key(key_file)) == 32
+    assert os.stat(key_file).st_mode & 0o777 == 0o600
+    with pytest.raises(FileExistsError):
+        create_key(key_file)
+
+    short = tmp_path / "short.key"
+    short.write_text("abcd\n")
+    with pytest.raises(ValueError, match="not a token key"):
+        load_key(short)
+
+
+def test_issue_and_verify():
+    clock = Clock()
+    signer = TokenSigner(b"k" * 32, clock=clock)
+    token = signer.issue("ci", ["list", "download"], lifetime=60)
+    assert signer.decode(token) == ("ci", ("download", "list"), 1_000_060)
+    assert signer.verify(token, "download")
+    assert not signer.verify(token, "update")
+
+    clock.now += 60
+    assert signer.decode(token) is None
+    assert not signer.verify(token, "download")
+
+    assert signer.decode(signer.issue("ci", ["list"])).expires is None
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        # Another key
+        lambda token: TokenSigner(b"x" * 32).issue("ci", ["update"]),
+        # Another payload
+        lambda token: base64.urlsafe_b64encode(
+            b'{"u":"ci","a":["update"],"e":null}'
+        ).decode().rstrip("=")
+        + token[token.index(".") :],
+        # Another signature
+        lambda token: token[:-2] + ("AA" if token[-2:] != "AA" else "BB"),
+        lambda token: token.partition(".")[0],
+        lambda token: token + "!",
+        lambda token: "é" + token,
+        lambda token: "",
+    ],
+)
+def test_invalid_tokens(tamper):
+    signer = TokenSigner(b"k" * 32)
+    token = signer.issue("ci", ["list"])
+    assert signer.decode(tamper(token)) is None
+
+
+def test_token_command(tmp_path, capsys):
+    key_file = tmp_path / "token.key"
+    argv = ["token", "--token-key", str(key_file), "-u", "ci"]
+    __main__.main(argv + ["-a", "update", "--expires", "1d"])
+    token = capsys.readouterr().out.strip()
+    assert key_file.exists()
+
+    signer = TokenSigner(load_key(key_file))
+    decoded = signer.decode(token)
+    assert decoded.user == "ci"
+    assert decoded.actions == ("update",)
+
+    # With the same key
+    __main__.main(argv)
+    decoded = signer.decode(capsys.readouterr().out.strip())
+    assert (decoded.actions, decoded.expires) == (("download", "list"), None)
+
+
+def test_token_config(tmp_path):
+    config = Config.from_args(
+        ["token", "--token-key", "k", "-u", "ci", "-a", "list,update"]
+    )
+    assert isinstance(config, TokenConfig)
+    assert config.actions == ["list", "update"]
+    assert config.expires is None
+    assert Config.from_args(
+        ["token", "--token-key", "k", "-u", "ci", "--expires", "2h"]
+    ).expires == 7200
+
+
+def test_run_config(key_file):
+    assert Config.default_with_overrides().tokens is None
+    config = Config.default_with_overrides(token_key=key_file)
+    assert config.tokens.key == load_key(key_file)
+    with pytest.raises(SystemExit, match="Cannot read the token key"):
+        Config.default_with_overrides(token_key=key_file.with_name("nope"))
+
+
+@pytest.fixture
+def testapp(tmp_path, key_file):
+    (tmp_path / "foo-1.0.zip").write_bytes(b"zip")
+    app = pypiserver.app(
+        roots=[tmp_path],
+        authenticate=["list", "download", "update"],
+        password_file=None,
+        token_key=key_file,
+    )
+    return webtest.TestApp(app)
+
+
+def _authorization(user, password):
+    credentials = base64.b64encode(f"{user}:{password}".encode()).decode()
+    return {"Authorization": f"Basic {credentials}"}
+
+
+def test_authentication(testapp, key_file):
+    signer = TokenSigner(load_key(key_file))
+    headers = _authorization("__token__", signer.issue("ci", ["download"]))
+    testapp.get("/packages/foo-1.0.zip", headers=headers, status=200)
+    # Not allowed by the token
+    testapp.get("/simple/", headers=headers, status=403)
+    # Nor by a token of another key
+    other = TokenSigner(b"k" * 32).issue("ci", ["download", "list"])
+    testapp.get(
+        "/packages/foo-1.0.zip",
+        headers=_authorization("__token__", other),
+        status=403,
+    )
+    # Tokens are not passwords of other users
+    testapp.get(
+        "/packages/foo-1.0.zip",
+        headers=_authorization("ci", signer.issue("ci", ["download"])),
+        status=403,
+    )
+
+
+def test_url_signer():
+    clock = Clock()
+    signer = URLSigner(b"k" * 32, lifetime=100, clock=clock)
+    query = signer.query("foo/foo-1.0.zip")
+    params = dict(pair.split("=") for pair in query.split("&"))
+    # The end of the next window
+    assert int(params["expires"]) == 1_000_200
+    # The same URL for the whole window
+    clock.now += 99
+    assert signer.query("foo/foo-1.0.zip") == query
+    clock.now += 100
+
+    args = params["expires"], params["signature"]
+    assert signer.verify("foo/foo-1.0.zip", *args)
+    assert not signer.verify("foo/foo-2.0.zip", *args)
+    assert not signer.verify("foo/foo-1.0.zip", "1000300", args[1])
+    assert not signer.verify("foo/foo-1.0.zip", "soon", args[1])
+    assert not signer.verify("foo/foo-1.0.zip", args[0], "é")
+    # Nor a token
+    assert not TokenSigner(b"k" * 32).decode(
+        f"{params['expires']}.{params['signature']}"
+    )
+    clock.now += 1
+    assert not signer.verify("foo/foo-1.0.zip", *args)
+
+
+def test_signed_urls_need_a_key():
+    with pytest.raises(SystemExit, match="needs --token-key"):
+        Config.default_with_overrides(
+            authenticate=["download"], password_file=None, signed_urls=60
+        )
+    # Unless downloads are not authenticated
+    assert Config.default_with_overrides(signed_urls=60).url_signer is None
+
+
+def test_signed_urls(tmp_path, key_file):
+    (tmp_path / "foo-1.0.zip").write_bytes(b"zip")
+    testapp = webtest.TestApp(
+        pypiserver.app(
+            roots=[tmp_path],
+            authenticate=["list", "download"],
+            password_file=None,
+            token_key=key_file,
+            signed_urls=3600,
+        )
+    )
+    signer = TokenSigner(load_key(key_file))
+    headers = _authorization("__token__", signer.issue("ci", ["list"]))
+    page = testapp.get("/simple/foo/", headers=headers)
+    (link,) = page.html.find_all("a")
+    path, _, fragment = link["href"].partition("#")
+    assert path.startswith("/packages/foo-1.0.zip?expires=")
+    assert fragment.startswith("sha256=")
+
+    # Without credentials
+    url = path
+    assert testapp.get(url).body == b"zip"
+    testapp.get("/packages/foo-1.0.zip", status=401)
+    testapp.get(url.replace("signature=", "signature=x"), status=401)
+    # Only downloads
+    testapp.get("/simple/foo/?" + url.partition("?")[2], status=401)